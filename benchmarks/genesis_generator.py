@@ -0,0 +1,73 @@
+import numpy as np
+
+SPECIES = [
+    "Eiche und Roteiche",
+    "Buche und sonstiges Laubholz",
+    "Fichte und Tanne und Douglasie und sonstiges Nadelholz",
+    "Kiefer und Lärche",
+]
+OWNERS = ["Staatswald (Bundes- und Landeswald)", "Körperschaftswald", "Privatwald"]
+REASONS = ["Wind/Sturm", "Schnee/Duft", "Insekten", "Trockenheit", "Sonstiges"]
+
+
+def labels(names, n, prefix):
+    """
+    Returns n labels, the first ones are taken from names and the others are numbered.
+    :param names: Labels of the real statistic
+    :param n: Number of labels
+    :param prefix: Prefix of the numbered labels
+    :return:
+    """
+    return names[:n] + [f"{prefix} {idx}" for idx in range(len(names) + 1, n + 1)]
+
+
+def write_genesis_csv(
+    file_path, years=18, species=5, owners=4, reasons=6, regions=1, first_year=2006, missing=0.02, seed=0
+):
+    """
+    Writes a synthetic statistic in the format of a raw CSV export of the GENESIS database like
+    data/DamagedLoggingOriginal.csv. Like there, the last species, owner and reason is "Insgesamt".
+    :param file_path: Path of the CSV file
+    :param years: Number of years
+    :param species: Number of species, including "Insgesamt"
+    :param owners: Number of owners, including "Insgesamt"
+    :param reasons: Number of reasons, including "Insgesamt"
+    :param regions: Number of regions, with more than one region a leading region column is written
+    :param first_year: First year of the statistic
+    :param missing: Fraction of values written as "-"
+    :param seed: Seed of the random values
+    :return: Keys of the dimension columns
+    """
+    rng = np.random.default_rng(seed)
+    region_labels = labels([], regions, "Region") if regions > 1 else []
+    year_labels = [str(year) for year in range(first_year, first_year + years)]
+    species_labels = labels(SPECIES, species - 1, "Baumart") + ["Insgesamt"]
+    owner_labels = labels(OWNERS, owners - 1, "Waldeigentum") + ["Insgesamt"]
+    reason_labels = labels(REASONS, reasons - 1, "Einschlagsursache") + ["Insgesamt"]
+
+    # Random walks over the years, the totals are the sums over species, owners and reasons
+    shape = (max(regions, 1), years, species - 1, owners - 1, reasons - 1)
+    values = np.abs(rng.normal(50, 20, shape) + np.cumsum(rng.normal(0, 10, shape), axis=1)).round(1)
+    values = np.concatenate([values, values.sum(axis=2, keepdims=True)], axis=2)
+    values = np.concatenate([values, values.sum(axis=3, keepdims=True)], axis=3)
+    values = np.concatenate([values, values.sum(axis=4, keepdims=True)], axis=4)
+    fields = np.char.replace(np.char.mod("%.1f", values), ".", ",")
+    fields[rng.random(fields.shape) < missing] = "-"
+
+    dimension_keys = (["Bundesland"] if regions > 1 else []) + ["Jahr", "Baumart", "Waldeigentum"]
+    empty = ";" * len(dimension_keys)
+    with open(file_path, "w", encoding="latin-1", newline="") as file:
+        file.write("GENESIS-Tabelle: 41261-0003\n")
+        file.write("Schadholzeinschlag: Deutschland, Jahre, Einschlagsursache,;;;;;;;;\n")
+        file.write("Holzartengruppen, Waldeigentumsarten;;;;;;;;\n")
+        file.write("Schadholzeinschlag (1000 cbm);;;;;;;;\n")
+        file.write(empty + ";".join(["Einschlagsursache"] * reasons) + "\n")
+        file.write(empty + ";".join(reason_labels) + "\n")
+        for idx in np.ndindex(values.shape[:4]):
+            region, year, specie, owner = idx
+            dimensions = [region_labels[region]] if regions > 1 else []
+            dimensions += [year_labels[year], species_labels[specie], owner_labels[owner]]
+            file.write(";".join(dimensions + list(fields[idx])) + "\n")
+        file.write("__________\n")
+        file.write("Synthetische Daten\n")
+    return dimension_keys
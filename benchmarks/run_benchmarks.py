@@ -0,0 +1,235 @@
+"""
+Benchmarks of the stages of the DamagedLoggingAnalyzer on synthetic GENESIS data.
+
+Each benchmark is timed with several repeats and the results are written as JSON report, which can be compared with
+the report of another commit:
+
+    python benchmarks/run_benchmarks.py --output base.json
+    git checkout my-branch
+    python benchmarks/run_benchmarks.py --output new.json --compare base.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from damagedlogginganalyzer.CSVAnalyzer import CSVAnalyzer
+from damagedlogginganalyzer.DamagedLoggingAnalyzer import DIMENSION_KEYS, DamagedLoggingAnalyzer
+from damagedlogginganalyzer.Oracle import Oracle
+from damagedlogginganalyzer.Plotter import Plotter
+from damagedlogginganalyzer.WoodOracle import WoodOracle
+
+from genesis_generator import write_genesis_csv
+
+SCALES = {
+    "small": dict(years=18, species=5, owners=4, reasons=6, regions=1),
+    "medium": dict(years=30, species=20, owners=10, reasons=12, regions=4),
+    "large": dict(years=50, species=50, owners=20, reasons=20, regions=16),
+}
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description="Benchmarks the DamagedLoggingAnalyzer on synthetic GENESIS data.")
+    parser.add_argument("--scale", choices=list(SCALES), default="small", help="Size of the synthetic data.")
+    for dimension in SCALES["small"]:
+        parser.add_argument(f"--{dimension}", type=int, help=f"Number of {dimension}, overrides --scale.")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timed repeats of each benchmark.")
+    parser.add_argument("--select", type=str, default="", help="Only run benchmarks whose name contains this.")
+    parser.add_argument("--output", type=str, help="Path of the JSON report.")
+    parser.add_argument("--compare", type=str, help="JSON report to compare the results with.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.2,
+        help="Ratio of the median times above which a benchmark counts as regression in --compare.",
+    )
+    return parser.parse_args(args)
+
+
+def time_benchmark(function, repeat):
+    """
+    Times a function, the first call is not timed, so that caches of imports and fonts are warm.
+    :param function: Function without arguments
+    :param repeat: Number of timed calls
+    :return: Statistics of the times in seconds
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        function()
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+    return {
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.mean(times),
+        "max": max(times),
+        "repeat": repeat,
+    }
+
+
+def benchmarks(work_dir, sizes):
+    """
+    Creates the synthetic data and returns the benchmarks on it.
+    The regions only scale the rows of the loading and partitioning benchmarks, the analysis works on one region.
+    :param work_dir: Directory for the data, caches and plots
+    :param sizes: Number of years, species, owners, reasons and regions
+    :return: Dictionary with the name and the function of each benchmark
+    """
+    regions_csv = work_dir / "regions.csv"
+    region_keys = write_genesis_csv(regions_csv, **sizes)
+    csv = work_dir / "germany.csv"
+    write_genesis_csv(csv, **dict(sizes, regions=1))
+
+    csv_analyzer = CSVAnalyzer()
+    csv_analyzer.read_in_csv(regions_csv, dimension_keys=region_keys)
+    csv_analyzer.read_in_csv(regions_csv, cache_dir=work_dir / "cache", dimension_keys=region_keys)
+
+    analyzer = DamagedLoggingAnalyzer(work_dir / "plots", rebuild_plots=True)
+    analyzer.read_in_csv(csv)
+    analyzer.analyze()
+    _, (year_index, species_index, owner_index, reason_index) = analyzer.get_dense_array(
+        DIMENSION_KEYS, value_like="Einschlagsursache:"
+    )
+    keys = [(specie, reason, owner) for specie in species_index for reason in reason_index for owner in owner_index]
+    specie, reason, owner = keys[0]
+
+    x = np.array(list(year_index), dtype=float).reshape(-1, 1)
+    y = np.stack([analyzer.collect_temporal_dependencies(*key) for key in keys])
+    series = np.nan_to_num(y[0])
+    # Each fold needs 2 validation values, so few years are cross validated in less folds
+    k_splits = min(9, sizes["years"] // 2)
+    oracle = Oracle(k_splits=k_splits)
+    wood_oracle = WoodOracle(k_splits=k_splits)
+    train_predict, train_score, value_2024, degree = wood_oracle.predict_wood_logging(x, series, *keys[0])
+
+    plotter = Plotter(work_dir / "plots", rebuild=True)
+    plotter.set_x_axis(x.ravel())
+    owner_dict = {owner: analyzer.collect_temporal_dependencies(specie, reason, owner) for owner in owner_index}
+    reason_dict = {reason: analyzer.collect_temporal_dependencies(specie, reason, owner) for reason in reason_index}
+
+    def read_in_csv():
+        CSVAnalyzer().read_in_csv(regions_csv, dimension_keys=region_keys)
+
+    def read_in_csv_cached():
+        CSVAnalyzer().read_in_csv(regions_csv, cache_dir=work_dir / "cache", dimension_keys=region_keys)
+
+    def collect_all_temporal_dependencies():
+        for key in keys:
+            analyzer.collect_temporal_dependencies(*key)
+
+    return {
+        "read_in_csv": read_in_csv,
+        "read_in_csv_cached": read_in_csv_cached,
+        "get_dict_with_df_same_key_value": lambda: csv_analyzer.get_dict_with_df_same_key_value("Baumart"),
+        "get_dense_array": lambda: csv_analyzer.get_dense_array(region_keys, value_like="Einschlagsursache:"),
+        "collect_temporal_dependencies": collect_all_temporal_dependencies,
+        "calculate_most_dangerous_reasons": analyzer.calculate_most_dangerous_reasons,
+        "Oracle.k_fold_cross_validation": lambda: oracle.k_fold_cross_validation(x, series),
+        "WoodOracle.predict_wood_logging": lambda: wood_oracle.predict_wood_logging(x, series, *keys[0]),
+        "WoodOracle.predict_many": lambda: wood_oracle.predict_many(x, np.nan_to_num(y)),
+        "Plotter.plot_temporal_dependencies": lambda: plotter.plot_temporal_dependencies(y[0], *keys[0]),
+        "Plotter.plot_temporal_dependencies_from_species_reason_dict": (
+            lambda: plotter.plot_temporal_dependencies_from_species_reason_dict(reason_dict, specie, owner)
+        ),
+        "Plotter.plot_temporal_dependencies_from_species_owner_dict": (
+            lambda: plotter.plot_temporal_dependencies_from_species_owner_dict(owner_dict, specie, reason)
+        ),
+        "Plotter.plot_predictions": (
+            lambda: plotter.plot_predictions(
+                series, train_predict, train_score, value_2024, degree, specie, reason, owner
+            )
+        ),
+    }
+
+
+def git_commit():
+    """
+    Returns the commit of the working tree or None outside of a git repository.
+    :return:
+    """
+    try:
+        result = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, cwd=Path(__file__).parent)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def compare(results, reference, threshold):
+    """
+    Prints the ratios of the median times to the ones of a reference report.
+    :param results: Results of this run
+    :param reference: Results of the reference report
+    :param threshold: Ratio above which a benchmark counts as regression
+    :return: Names of the regressed benchmarks
+    """
+    regressions = []
+    print(f"{'benchmark':<60} {'reference':>10} {'current':>10} {'ratio':>7}")
+    for name, result in results.items():
+        if name not in reference:
+            continue
+        ratio = result["median"] / reference[name]["median"]
+        flag = ""
+        if ratio > threshold:
+            regressions.append(name)
+            flag = " regression"
+        print(f"{name:<60} {reference[name]['median']:>10.4f} {result['median']:>10.4f} {ratio:>7.2f}{flag}")
+    return regressions
+
+
+def main(args):
+    args = parse_args(args)
+    sizes = dict(SCALES[args.scale])
+    sizes.update({dimension: getattr(args, dimension) for dimension in sizes if getattr(args, dimension)})
+
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        with contextlib.redirect_stdout(io.StringIO()):
+            selected = benchmarks(Path(work_dir), sizes)
+        for name, function in selected.items():
+            if args.select not in name:
+                continue
+            results[name] = time_benchmark(function, args.repeat)
+            print(f"{name:<60} {results[name]['median']:.4f} s")
+
+    import matplotlib
+    import pandas as pd
+
+    report = {
+        "metadata": {
+            "commit": git_commit(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "matplotlib": matplotlib.__version__,
+            "sizes": sizes,
+        },
+        "benchmarks": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=1))
+
+    if args.compare:
+        reference = json.loads(Path(args.compare).read_text())
+        if reference["metadata"]["sizes"] != sizes:
+            print(f"Warning: the reference was run with the sizes {reference['metadata']['sizes']}!")
+        if compare(results, reference["benchmarks"], args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,7 +1,362 @@
+import csv as csv_module
+import hashlib
+import itertools
+import json
+import os
+import numpy as np
 import pandas as pd
 
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+# Increase when the parsing of the CSV files changes, so that the cached tables are parsed again
+CACHE_VERSION = 2
+
+
+def default_cache_dir():
+    """
+    Returns the default directory for cached csv files.
+    :return:
+    """
+    return Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "damagedlogginganalyzer"
+
+
+def file_sha256(file_path):
+    """
+    Calculates the SHA-256 hash of the content of a file.
+    :param file_path: Path to the file
+    :return: Hex digest of the hash
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_table(table, file_path):
+    """
+    Writes a data frame as CSV or, if the file ends with .json, as JSON file with one object per row.
+    :param table: Data frame
+    :param file_path: Path of the file
+    :return:
+    """
+    file_path = Path(file_path)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    if file_path.suffix == ".json":
+        table.to_json(file_path, orient="records", indent=1, force_ascii=False)
+    else:
+        table.to_csv(file_path, index=False)
+
+
+# Special characters of GENESIS tables, which mark missing, secret or not yet available values
+GENESIS_MISSING_VALUES = ["-", ".", "...", "x", "/", ""]
+
+
+def genesis_delimiter(csv_file):
+    """
+    Detects a raw CSV export of the GENESIS database of Destatis and its delimiter. GENESIS separates the fields with
+    ";", exports saved again by spreadsheet programs can use "," and pad the title row with empty fields.
+    :param csv_file: Path to the CSV file.
+    :return: Delimiter of the fields or None, if the file is no GENESIS export
+    """
+    with open(csv_file, "rb") as file:
+        head = file.read(4096)
+    if not head.startswith(b"GENESIS-Tabelle"):
+        return None
+    title = head.splitlines()[0]
+    padding = title[len(title.rstrip(b",;")) :]
+    if padding:
+        return padding[:1].decode()
+    return ";" if b";" in head else ","
+
+
+def is_genesis_csv(csv_file):
+    """
+    Checks, whether a file is a raw CSV export of the GENESIS database of Destatis.
+    :param csv_file: Path to the CSV file.
+    :return:
+    """
+    return genesis_delimiter(csv_file) is not None
+
+
+def split_comma_fields(row, n_dimensions, n_values):
+    """
+    Restores the fields of a data row of a GENESIS export, which is separated by ",". The commas in the labels, which
+    are followed by a space, and the decimal commas of the values were read as delimiters as well.
+    :param row: Fields of the row split at each ","
+    :param n_dimensions: Number of dimension columns
+    :param n_values: Number of value columns
+    :return: The dimension and value fields of the row or None, if the fields can not be restored
+    """
+    fields = []
+    for field in row:
+        if fields and field.startswith(" "):
+            fields[-1] += "," + field
+        else:
+            fields.append(field)
+    while len(fields) > n_dimensions + n_values and fields[-1] == "":
+        fields.pop()
+    if len(fields) == n_dimensions + n_values:
+        return fields
+
+    # With decimal commas, each value is either a special character of GENESIS or an integer and a fraction field
+    values = []
+    end = len(fields)
+    while len(values) < n_values:
+        if end > n_dimensions and fields[end - 1].strip() in GENESIS_MISSING_VALUES:
+            values.append(fields[end - 1])
+            end -= 1
+        elif end - 1 > n_dimensions and fields[end - 1].isdigit() and fields[end - 2].lstrip("-").isdigit():
+            values.append(f"{fields[end - 2]},{fields[end - 1]}")
+            end -= 2
+        else:
+            return None
+    if end != n_dimensions:
+        return None
+    return fields[:n_dimensions] + values[::-1]
+
+
+def read_genesis_csv(
+    csv_file, dimension_keys=None, chunk_size=65536, encoding="latin-1", region_key=None, delimiter=";"
+):
+    """
+    Reads a raw CSV export of the GENESIS database. The metadata block above the table and the footnotes below it are
+    skipped, the header rows are joined to the column keys, e.g. "Einschlagsursache: Wind/Sturm". The rows are streamed
+    in chunks into numeric arrays, "," is read as decimal separator and "-" as well as the other special characters of
+    GENESIS as missing value. Exports separated by "," are restored with split_comma_fields.
+    :param csv_file: Path to the CSV file.
+    :param dimension_keys: Keys of the leading dimension columns, e.g. ["Jahr", "Baumart", "Waldeigentum"]. Defaults to
+        their header or "Dimension 1", "Dimension 2", ... if it is empty.
+    :param chunk_size: Number of rows, which are converted at once.
+    :param encoding: Encoding of the CSV file.
+    :param region_key: Key of a leading region column, e.g. "Bundesland", which is read in addition to the columns of
+        dimension_keys, if the table has one.
+    :param delimiter: Delimiter of the fields, see genesis_delimiter.
+    :return: Data frame with one column for each dimension and float columns for the values
+    """
+    with open(csv_file, encoding=encoding, newline="") as file:
+        rows = csv_module.reader(file, delimiter=delimiter)
+
+        # The header rows leave the fields above the dimension columns empty, the data starts after them
+        header = []
+        row = []
+        for row in rows:
+            if row and row[0] == "" and any(row):
+                header.append(row)
+            elif header:
+                break
+        else:
+            row = []
+        if not header:
+            raise ValueError(f"{csv_file} does not contain a GENESIS table header!")
+
+        # Empty fields at the end of the header rows pad the table to the width of the metadata block
+        header = [header_row[: max(idx + 1 for idx, field in enumerate(header_row) if field)] for header_row in header]
+        n_dimensions = next(idx for idx, field in enumerate(header[-1]) if field)
+        n_values = max(len(header_row) for header_row in header) - n_dimensions
+        value_keys = [
+            ": ".join(header_row[idx] for header_row in header if idx < len(header_row) and header_row[idx])
+            for idx in range(n_dimensions, n_dimensions + n_values)
+        ]
+        if dimension_keys is None:
+            dimension_keys = [
+                ": ".join(header_row[idx] for header_row in header if header_row[idx]) or f"Dimension {idx + 1}"
+                for idx in range(n_dimensions)
+            ]
+        if region_key is not None and len(dimension_keys) + 1 == n_dimensions:
+            dimension_keys = [region_key] + list(dimension_keys)
+        if len(dimension_keys) != n_dimensions:
+            raise ValueError(f"{csv_file} has {n_dimensions} dimension columns, but got the keys {dimension_keys}!")
+
+        # Dimension values are stored as codes into one label list per dimension
+        label_codes = [{} for _ in range(n_dimensions)]
+        codes = [[] for _ in range(n_dimensions)]
+        value_chunks = []
+        chunk = []
+
+        def convert(chunk):
+            fields = np.array([row[n_dimensions:] + [""] * (n_dimensions + n_values - len(row)) for row in chunk])
+            fields = np.char.replace(np.char.strip(fields), ",", ".")
+            # The fields are only as wide as the widest one of the chunk, which can be narrower than "nan"
+            fields = np.where(np.isin(fields, GENESIS_MISSING_VALUES), np.array("nan", dtype="<U3"), fields)
+            value_chunks.append(fields.astype(float))
+            for idx in range(n_dimensions):
+                codes[idx].extend(label_codes[idx].setdefault(row[idx], len(label_codes[idx])) for row in chunk)
+
+        # The first data row was consumed while searching the end of the header
+        for row in itertools.chain([row], rows):
+            if not row or row[0].startswith("__________"):
+                break
+            if delimiter == ",":
+                fields = split_comma_fields(row, n_dimensions, n_values)
+                if fields is None:
+                    raise ValueError(
+                        f"{csv_file}: line {rows.line_num} can not be split into {n_dimensions} dimension and "
+                        f'{n_values} value columns, "," separates its fields and decimals. Export it with ";"!'
+                    )
+                row = fields
+            chunk.append(row[: n_dimensions + n_values])
+            if len(chunk) == chunk_size:
+                convert(chunk)
+                chunk = []
+        if chunk:
+            convert(chunk)
+
+    values = np.concatenate(value_chunks) if value_chunks else np.empty((0, n_values))
+    columns = {}
+    for idx, key in enumerate(dimension_keys):
+        labels = list(label_codes[idx])
+        if labels and all(label.isdigit() for label in labels):
+            labels = np.array(labels, dtype=np.int64)
+        else:
+            labels = np.array(labels, dtype=object)
+        columns[key] = labels[np.asarray(codes[idx], dtype=np.intp)]
+    for idx, key in enumerate(value_keys):
+        columns[key] = values[:, idx]
+    return pd.DataFrame(columns)
+
+
+def load_csv(csv_file, cache_dir=None, rebuild_cache=False, dimension_keys=None, region_key=None):
+    """
+    Reads a CSV file, raw exports of the GENESIS database are detected and read with read_genesis_csv.
+    If a cache directory is given, the parsed csv is stored there in binary form and reused by later calls, as
+    long as path, size and modification time or content of the CSV file and the CACHE_VERSION did not change.
+    :param csv_file: Path to the CSV file.
+    :param cache_dir: Directory for the parsed csv, None disables the cache.
+    :param rebuild_cache: Parse the CSV file again and replace its cached version.
+    :param dimension_keys: Keys of the dimension columns of raw GENESIS exports.
+    :param region_key: Key of a leading region column of raw GENESIS exports.
+    :return: Data frame of the CSV file
+    """
+    csv = Path(csv_file)
+    if not csv.exists():
+        raise FileExistsError(f"{csv} does not exists!. Please enter correct Path to your CSV file!")
+
+    def parse():
+        delimiter = genesis_delimiter(csv)
+        if delimiter is not None:
+            return read_genesis_csv(csv, dimension_keys, region_key=region_key, delimiter=delimiter)
+        return pd.read_csv(csv)
+
+    if cache_dir is None:
+        return parse()
+
+    cache_dir = Path(cache_dir)
+    key = hashlib.sha256(str(csv.resolve()).encode()).hexdigest()[:32]
+    data_path = cache_dir / f"{key}.pkl"
+    meta_path = cache_dir / f"{key}.json"
+
+    stat = csv.stat()
+    meta = {
+        "version": CACHE_VERSION,
+        "path": str(csv.resolve()),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "pandas": pd.__version__,
+        "dimension_keys": dimension_keys,
+        "region_key": region_key,
+    }
+    cached_meta = {}
+    if not rebuild_cache and meta_path.exists() and data_path.exists():
+        cached_meta = json.loads(meta_path.read_text())
+
+    if all(
+        cached_meta.get(field) == meta[field]
+        for field in ["version", "path", "size", "pandas", "dimension_keys", "region_key"]
+    ):
+        # A changed modification time alone does not invalidate the cache, if the content is still the same
+        same_mtime = cached_meta.get("mtime_ns") == meta["mtime_ns"]
+        meta["sha256"] = cached_meta.get("sha256") if same_mtime else file_sha256(csv)
+        if cached_meta.get("sha256") == meta["sha256"]:
+            try:
+                table = pd.read_pickle(data_path)
+            except Exception:  # A broken cache is replaced below
+                pass
+            else:
+                if not same_mtime:
+                    meta_path.write_text(json.dumps(meta))
+                return table
+
+    table = parse()
+
+    if meta.get("sha256") is None:
+        meta["sha256"] = file_sha256(csv)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    table.to_pickle(data_path.with_suffix(".tmp"))
+    os.replace(data_path.with_suffix(".tmp"), data_path)
+    meta_path.write_text(json.dumps(meta))
+    return table
+
+
+def combine_tables(tables, names, dimension_keys=None, region_key="Region", on_conflict="last"):
+    """
+    Combines the tables of many CSV files into one table with a region column. Tables without the region column are
+    one region named like their file. Rows with the same region and dimension values are combined into one row:
+    exact duplicates are dropped and for differing values the rule on_conflict applies per value column, missing
+    values never replace present ones.
+    :param tables: Data frames of the CSV files, in the order of their precedence for "last"
+    :param names: Names of the tables, used as region of tables without region column
+    :param dimension_keys: Keys of the dimension columns, None uses all columns, which are not float columns
+    :param region_key: Key of the region column
+    :param on_conflict: "last" takes the value of the last table, "first" the one of the first table and "error"
+        raises a ValueError
+    :return: Data frame with the region column in front
+    """
+    if on_conflict not in ("last", "first", "error"):
+        raise ValueError(f"Unknown rule {on_conflict!r} for conflicts, expected last, first or error")
+
+    tables = [
+        table if region_key in table.columns else table.assign(**{region_key: name})
+        for table, name in zip(tables, names)
+    ]
+    table = pd.concat(tables, ignore_index=True) if len(tables) > 1 else tables[0]
+    if dimension_keys is None:
+        dimension_keys = [key for key in table.columns if not pd.api.types.is_float_dtype(table[key])]
+    key_columns = [region_key] + [key for key in dimension_keys if key != region_key]
+    value_columns = [key for key in table.columns if key not in key_columns]
+    table = table[key_columns + value_columns]
+
+    if not table.duplicated(key_columns).any():
+        return table
+    # Placeholders like "-" of prepared CSV files are missing values
+    table = table.assign(**{key: pd.to_numeric(table[key], errors="coerce") for key in value_columns})
+    groups = table.groupby(key_columns, sort=False, dropna=False)
+    if on_conflict == "error":
+        conflicts = (groups[value_columns].nunique() > 1).any(axis=1)
+        if conflicts.any():
+            raise ValueError(
+                f"{conflicts.sum()} rows have different values in different files, e.g. {conflicts.idxmax()}!"
+            )
+    combined = groups.last() if on_conflict != "first" else groups.first()
+    return combined.reset_index()
+
+
+def compact_table(table, dimension_keys, float_dtype="float32"):
+    """
+    Returns a compact copy of a table. The dimension columns and other text columns become categoricals, which store
+    each label once and an integer code per row. The value columns become float arrays with NaN for missing values,
+    including placeholders like "-" of prepared CSV files.
+    :param table: Data frame
+    :param dimension_keys: Keys of the dimension columns
+    :param float_dtype: Type of the value columns, "float32" halves their memory, but keeps only about 7 digits
+    :return: Data frame with the same columns
+    """
+    columns = {}
+    for key in table.columns:
+        column = table[key]
+        if key not in dimension_keys and not pd.api.types.is_numeric_dtype(column):
+            numbers = pd.to_numeric(column, errors="coerce")
+            # Columns with text besides the missing values of GENESIS are no value columns
+            if not column[numbers.isna()].astype(str).str.strip().isin(GENESIS_MISSING_VALUES).all():
+                numbers = None
+            column = column if numbers is None else numbers
+        if key in dimension_keys or not pd.api.types.is_numeric_dtype(column):
+            columns[key] = column.astype("category")
+        else:
+            columns[key] = column.astype(float_dtype)
+    return pd.DataFrame(columns, index=table.index)
+
 
 class CSVAnalyzer:
     """
@@ -17,37 +372,152 @@ class CSVAnalyzer:
     def __exit__(self, exc_type, exc_val, exc_tb):
         pass
 
-    def read_in_csv(self, csv_file):
+    def read_in_csv(self, csv_file, cache_dir=None, rebuild_cache=False, dimension_keys=None, region_key=None):
         """
-        Read in a CSV file and saves it into self.__csv.
+        Read in a CSV file and saves it into self.__csv, see load_csv.
         :param csv_file: Path to the CSV file.
+        :param cache_dir: Directory for the parsed csv, None disables the cache.
+        :param rebuild_cache: Parse the CSV file again and replace its cached version.
+        :param dimension_keys: Keys of the dimension columns of raw GENESIS exports.
+        :param region_key: Key of a leading region column of raw GENESIS exports.
         :return:
         """
-        csv = Path(csv_file)
-        if not csv.exists():
-            raise FileExistsError(f"{csv} does not exists!. Please enter correct Path to your CSV file!")
+        self.__csv = load_csv(csv_file, cache_dir, rebuild_cache, dimension_keys, region_key)
 
-        self.__csv = pd.read_csv(csv)
+    def read_in_csvs(
+        self,
+        csv_files,
+        cache_dir=None,
+        rebuild_cache=False,
+        dimension_keys=None,
+        region_key="Region",
+        jobs=1,
+        on_conflict="last",
+    ):
+        """
+        Reads in many CSV files, e.g. one per region and table release, and saves them as one table into self.__csv,
+        see combine_tables. A single file is read in like by read_in_csv, without a region named like the file. With
+        more than one job, the files are parsed in parallel processes.
+        :param csv_files: Paths to the CSV files.
+        :param cache_dir: Directory for the parsed csv files, None disables the cache.
+        :param rebuild_cache: Parse the CSV files again and replace their cached versions.
+        :param dimension_keys: Keys of the dimension columns, which identify a row in addition to the region.
+        :param region_key: Key of the region column. Files without it are one region named like the file without
+            its directory and suffix.
+        :param jobs: Number of processes, which parse the files.
+        :param on_conflict: How rows of the same region and dimensions with different values are combined, see
+            combine_tables.
+        :return:
+        """
+        csv_files = [Path(csv_file) for csv_file in csv_files]
+        arguments = [csv_files] + [[argument] * len(csv_files) for argument in (cache_dir, rebuild_cache)]
+        arguments += [[dimension_keys] * len(csv_files), [region_key] * len(csv_files)]
+        if jobs > 1 and len(csv_files) > 1:
+            with ProcessPoolExecutor(min(jobs, len(csv_files))) as pool:
+                tables = list(pool.map(load_csv, *arguments))
+        else:
+            tables = list(map(load_csv, *arguments))
+        if len(tables) == 1:
+            self.__csv = tables[0]
+            return
+
+        # Files with the same name, e.g. releases/2023/Bayern.csv and releases/2024/Bayern.csv, are the same region
+        names = [csv_file.stem for csv_file in csv_files]
+        self.__csv = combine_tables(tables, names, dimension_keys, region_key, on_conflict)
+
+    def compact(self, dimension_keys, float_dtype="float32"):
+        """
+        Replaces the csv by its compact representation, see compact_table.
+        :param dimension_keys: Keys of the dimension columns
+        :param float_dtype: Type of the value columns, "float32" or "float64"
+        :return:
+        """
+        self.__csv = compact_table(self.__csv, dimension_keys, float_dtype)
+
+    def memory_usage(self):
+        """
+        Returns the memory used by each column of the csv, including the memory of the labels of text columns.
+        :return: Series with the bytes of each column
+        """
+        return self.__csv.memory_usage(index=False, deep=True)
+
+    def get_keys(self):
+        """
+        Returns the keys of the columns of the csv.
+        :return:
+        """
+        return [] if self.__csv is None else list(self.__csv.columns)
 
     def get_dict_with_df_same_key_value(self, key=""):
         """
         Returns a dictionary, which contains all rows of the csv with the same key value as data frame.
+        The csv is partitioned in a single pass, rows with the same key value are stored as one row range of the
+        partitioned csv and each data frame is a slice of it.
+        The analysis of DamagedLoggingAnalyzer does not use it, it reads the csv with get_dense_array. This method is
+        kept for scripts, which use CSVAnalyzer directly.
         :param key: The key value to group the data frames.
         :return:
         """
         try:
-            unique_key_values = self.__csv[key].unique()
-            unique_key_values = list(filter(lambda x: x not in ["__________"], unique_key_values))
+            key_values = self.__csv[key]
         except KeyError:
             raise KeyError(
                 f"Your CSV does not contain a column with value: {key}! Possible values are {self.__csv.keys()}"
             )
 
+        # Rows with code -1 (missing values and the "__________" rows) end up in front of all groups
+        codes, unique_key_values = pd.factorize(key_values)
+        codes[(key_values == "__________").to_numpy()] = -1
+
+        # Stable sort keeps the row order inside each group, already grouped csv files are not copied at all
+        partitioned = self.__csv
+        if np.any(codes[1:] < codes[:-1]):
+            order = np.argsort(codes, kind="stable")
+            partitioned = self.__csv.take(order)
+            codes = codes[order]
+        bounds = np.searchsorted(codes, np.arange(-1, len(unique_key_values) + 1))
+
         # Create a dictionary to store DataFrames for each key value
         values_dataframes = {}
 
-        for value in unique_key_values:
-            value_df = self.__csv[self.__csv[key] == value]
-            values_dataframes[value] = value_df
+        for idx, value in enumerate(unique_key_values):
+            start, stop = bounds[idx + 1], bounds[idx + 2]
+            if start == stop:
+                continue
+            values_dataframes[value] = partitioned.iloc[start:stop]
 
         return values_dataframes
+
+    def get_dense_array(self, dimension_keys, value_like=""):
+        """
+        Returns the csv as dense array with one axis for each dimension key and a last axis for the value columns.
+        Combinations of dimension values which are not contained in the csv are NaN.
+        :param dimension_keys: Keys of the columns which span the axes of the array.
+        :param value_like: Only columns whose key contains this string are used as value columns.
+        :return: The array and a list with one dictionary per axis, which maps each label to its index.
+        """
+        dimension_keys = list(dimension_keys)
+        try:
+            dimensions = self.__csv[dimension_keys]
+        except KeyError:
+            raise KeyError(
+                f"Your CSV does not contain the columns: {dimension_keys}! Possible values are {self.__csv.keys()}"
+            )
+        values = self.__csv.filter(like=value_like) if value_like else self.__csv
+        values = values.drop(columns=dimension_keys, errors="ignore")
+
+        # Skip rows with missing dimension values, e.g. the "__________" row at the end of GENESIS tables
+        valid = (dimensions.notna() & (dimensions != "__________")).all(axis=1)
+        dimensions = dimensions[valid]
+
+        codes = []
+        label_indexes = []
+        for key in dimension_keys:
+            key_codes, labels = pd.factorize(dimensions[key])
+            codes.append(key_codes)
+            label_indexes.append({label: idx for idx, label in enumerate(labels)})
+        label_indexes.append({key: idx for idx, key in enumerate(values.columns)})
+
+        dense_array = np.full([len(label_index) for label_index in label_indexes], np.nan)
+        dense_array[tuple(codes)] = values[valid].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+        return dense_array, label_indexes
@@ -1,31 +1,170 @@
+import hashlib
+import itertools
+import json
+import logging
+import time
+
 import numpy as np
+import pandas as pd
+
+from pathlib import Path
 
 from damagedlogginganalyzer.CSVAnalyzer import CSVAnalyzer
-from damagedlogginganalyzer.Plotter import Plotter
+from damagedlogginganalyzer.PlotWriter import QUEUE_SIZE
+from damagedlogginganalyzer.Profiler import Profiler
 from damagedlogginganalyzer.WoodOracle import WoodOracle
 
+# Keys of the dimension columns of the statistic 41261-0003
+DIMENSION_KEYS = ["Jahr", "Baumart", "Waldeigentum"]
+
+# Key of the region column of the statistic of several regions, e.g. one file per federal state
+REGION_KEY = "Bundesland"
+
+# Maximum number of series, which are predicted at once
+PREDICTION_BATCH_SIZE = 4096
+
+# Seconds between two checkpoints, which flush the outputs and write the completed units to the journal
+CHECKPOINT_SECONDS = 5
+
+# Axes of the dimensions in the cube of the analyzer
+DIMENSIONS = {"year": 0, "species": 1, "owner": 2, "reason": 3}
+
+_logger = logging.getLogger(__name__)
+
 
 class DamagedLoggingAnalyzer(CSVAnalyzer):
     """
     This class provides methods to analyze the data about damaged wood from the CSV file.
     """
 
-    def __init__(self, out_dir="plots"):
+    def __init__(
+        self,
+        out_dir="plots",
+        oracle_engine="numpy",
+        jobs=1,
+        rebuild_plots=False,
+        profiler=None,
+        model_store=None,
+        plot_output="png",
+        check_incremental=False,
+        k_splits=9,
+        degrees=None,
+        degree_search="grid",
+        patience=2,
+        plot_writers=1,
+        png_compression=None,
+        dpi=None,
+        journal=None,
+    ):
         super().__init__()
-        self.__year_dict = {}
+        self.__cube = np.empty((0, 0, 0, 0))
+        self.__species_index = {}
+        self.__reason_index = {}
+        self.__owner_index = {}
         self.__species = []
         self.__reasons = []
         self.__owners = []
         self.__years = []
+        self.__regions = []
+        self.__presence = np.empty((0, 0, 0, 0), dtype=bool)
+        self.__series_presence = np.empty((0, 0, 0), dtype=bool)
+
+        self.__profiler = profiler or Profiler()
 
         self.__out_dir = out_dir
-        self.__plotter = Plotter(out_dir)
+        self.__plotter_args = (
+            out_dir,
+            jobs,
+            rebuild_plots,
+            self.__profiler,
+            plot_output,
+            plot_writers,
+            QUEUE_SIZE,
+            png_compression,
+            dpi,
+        )
+        self.__plotter = None
+        self.__plot_options = (plot_output, png_compression, dpi)
+        self.__journal = journal
 
-        self.__wood_oracle = WoodOracle()
+        self.__wood_oracle = WoodOracle(
+            oracle_engine,
+            self.__profiler,
+            model_store,
+            Path(out_dir) / "incremental_models.npz",
+            check_incremental,
+            k_splits,
+            degrees,
+            degree_search,
+            patience,
+        )
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.__plotter is not None:
+            # The plots of units, which this run skipped, are not stale
+            partial = self.__journal is not None and self.__journal.partial
+            self.__plotter.close(prune=exc_type is None and not partial)
+        if self.__wood_oracle.store is not None:
+            self.__wood_oracle.store.close()
+        if self.__journal is not None:
+            self.__journal.close()
         super().__exit__(exc_type, exc_val, exc_tb)
 
+    def get_plotter(self):
+        """
+        Returns the plotter for the analyzed years. It is created on first use, so that matplotlib is only imported
+        by the modes which plot.
+        :return:
+        """
+        if self.__plotter is None:
+            from damagedlogginganalyzer.Plotter import Plotter
+
+            self.__plotter = Plotter(*self.__plotter_args)
+        self.__plotter.set_x_axis(self.__years)
+        return self.__plotter
+
+    def read_in_csv(self, csv_file, cache_dir=None, rebuild_cache=False, dimension_keys=DIMENSION_KEYS):
+        """
+        Read in a CSV file with the statistic, either a prepared CSV or the raw GENESIS export.
+        :param csv_file: Path to the CSV file.
+        :param cache_dir: Directory for the parsed csv, None disables the cache.
+        :param rebuild_cache: Parse the CSV file again and replace its cached version.
+        :param dimension_keys: Keys of the dimension columns of raw GENESIS exports.
+        :return:
+        """
+        with self.__profiler.stage("read_in_csv"):
+            super().read_in_csv(csv_file, cache_dir, rebuild_cache, dimension_keys)
+
+    def read_in_csvs(
+        self, csv_files, cache_dir=None, rebuild_cache=False, dimension_keys=DIMENSION_KEYS, jobs=1, on_conflict="last"
+    ):
+        """
+        Read in CSV files with the statistic of several regions or table releases as one statistic with a region
+        column, see CSVAnalyzer.read_in_csvs. Files without the column REGION_KEY are one region named like the file,
+        a single file is read in like by read_in_csv.
+        :param csv_files: Paths to the CSV files.
+        :param cache_dir: Directory for the parsed csv files, None disables the cache.
+        :param rebuild_cache: Parse the CSV files again and replace their cached versions.
+        :param dimension_keys: Keys of the dimension columns besides the region.
+        :param jobs: Number of processes, which parse the files.
+        :param on_conflict: How different values of the same row in several files are combined: "last", "first" or
+            "error".
+        :return:
+        """
+        with self.__profiler.stage("read_in_csv"):
+            super().read_in_csvs(csv_files, cache_dir, rebuild_cache, dimension_keys, REGION_KEY, jobs, on_conflict)
+
+    def compact(self, float_dtype="float32"):
+        """
+        Replaces the CSV by its compact representation with categorical dimensions and float value columns, see
+        CSVAnalyzer.compact.
+        :param float_dtype: Type of the value columns, "float32" or "float64". The amounts of float32 are only exact
+            to about 7 digits.
+        :return:
+        """
+        keys = self.get_keys()
+        super().compact([key for key in [REGION_KEY] + DIMENSION_KEYS if key in keys], float_dtype)
+
     def analyze(
         self,
         *,
@@ -34,131 +173,458 @@ class DamagedLoggingAnalyzer(CSVAnalyzer):
         plot_temporal_dependencies_all=False,
         predict_temporal_dependencies=False,
         calculate_most_dangerous_reasons=False,
+        region=None,
     ):
         """
         Solves the question in the README.md
+        :param region: Region to analyze, if the statistic has a region column. None analyzes the sum of all regions.
         :return:
         """
-        self.__year_dict = self.get_dict_with_df_same_key_value("Jahr")
-        self.__species = self.__year_dict[2020]["Baumart"].unique()
-        self.__reasons = self.__year_dict[2020].filter(like="Einschlagsursache:").columns
-        self.__owners = self.__year_dict[2020]["Waldeigentum"].unique()
-        self.__years = np.zeros(self.__year_dict.keys().__len__())
-        idx = 0
-        for year in self.__year_dict:
-            self.__years[idx] = year
-            idx += 1
-        self.__plotter.set_x_axis(self.__years)
+        # Dense year x species x owner x reason cube, all series are read as views from it
+        with self.__profiler.stage("get_dense_array"):
+            if REGION_KEY in self.get_keys():
+                cube, (region_index, *indexes) = self.get_dense_array(
+                    [REGION_KEY] + DIMENSION_KEYS, value_like="Einschlagsursache:"
+                )
+                self.__regions = list(region_index)
+                if region is None:
+                    # Amounts missing in all regions stay missing
+                    self.__cube = np.where(np.isnan(cube).all(axis=0), np.nan, np.nansum(cube, axis=0))
+                else:
+                    self.__cube = cube[self.select_labels(region_index, [region])[0]]
+            else:
+                if region is not None:
+                    raise KeyError(f"Your CSV does not contain regions! Can not analyze the region {region}")
+                self.__cube, indexes = self.get_dense_array(DIMENSION_KEYS, value_like="Einschlagsursache:")
+            year_index, self.__species_index, self.__owner_index, self.__reason_index = indexes
+        self.__species = list(self.__species_index)
+        self.__reasons = list(self.__reason_index)
+        self.__owners = list(self.__owner_index)
+
+        # Years in ascending order, whatever the order of the rows in the CSV
+        years = np.array(list(year_index), dtype=float)
+        order = np.argsort(years, kind="stable")
+        self.__years = years[order]
+        self.__cube = self.__cube[order]
+
+        # Which years have a value for each series, empty series are neither plotted nor fitted
+        self.__presence = ~np.isnan(self.__cube)
+        self.__series_presence = self.__presence.any(axis=0)
+        # Each series is extracted once and passed to the consumers of all enabled modes
+        consumers = {}
         if plot_temporal_dependencies_all:
-            print("Plotting Temporal Dependencies (all specie, reason and owner combinations)...")
-            self.temporal_plot_all_combinations()
-            print(f"Plots saved in: {self.__out_dir}")
+            _logger.info("Plotting Temporal Dependencies (all specie, reason and owner combinations)...")
+            consumers["plot_temporal_dependencies_all"] = self.temporal_plot_consumer()
         if plot_reason_dependencies:
-            print("Plotting Reason Dependencies ...")
-            self.reason_dependencies_plot()
-            print(f"Plots saved in: {self.__out_dir}")
+            _logger.info("Plotting Reason Dependencies ...")
+            consumers["plot_reason_dependencies"] = self.reason_plot_consumer()
         if plot_owner_dependencies:
-            print("Plotting Owner Dependencies ...")
-            self.owner_dependencies_plot()
-            print(f"Plots saved in: {self.__out_dir}")
+            _logger.info("Plotting Owner Dependencies ...")
+            consumers["plot_owner_dependencies"] = self.owner_plot_consumer()
         if predict_temporal_dependencies:
             # Predict the amount of damaged wood in 2024
-            self.predict_temporal_dependencies()
+            consumers["predict"] = self.prediction_consumer()
+        if consumers and self.__journal is not None:
+            self.__journal.start(self.fingerprint())
+            # The forecasts of the resumed units are part of the results table
+            self.__wood_oracle.results.extend(self.__journal.results("predict"))
+        if consumers:
+            self.analyze_series(consumers)
+        if plot_temporal_dependencies_all or plot_reason_dependencies or plot_owner_dependencies:
+            _logger.info("Plots saved in: %s", self.__out_dir)
         if calculate_most_dangerous_reasons:
-            self.calculate_most_dangerous_reasons()
+            with self.__profiler.stage("calculate_most_dangerous_reasons"):
+                self.calculate_most_dangerous_reasons()
 
     def calculate_most_dangerous_reasons(self):
         """
-        Calculates the most dangerous reasons for each specie.
+        Calculates the most dangerous reasons for each specie and prints them, whatever the level of the logging.
         :return:
         """
-        total_amounts = {}
-        for specie in self.__species:
-            amounts = {}
-            for reason in self.__reasons:
-                if reason not in total_amounts:
-                    total_amounts[reason] = 0
-                amounts[reason] = self.collect_temporal_dependencies(specie, reason, "Insgesamt").sum()
-                total_amounts[reason] += amounts[reason]
-
+        ranking = self.rank_amounts(["species", "reason"], ["species"])
+        # The buffered messages of the analysis are written before the result
+        for handler in logging.getLogger("damagedlogginganalyzer").handlers:
+            handler.flush()
+        for specie, amounts in ranking.groupby("species", sort=False):
             print(f"Most dangerous reasons for {specie}:")
-            sorted_amounts = sorted(amounts.items(), key=lambda x: x[1], reverse=True)
-            for reason, value in sorted_amounts:
+            for reason, value in zip(amounts["reason"], amounts["amount"]):
                 print(f"{reason}: {value}")
 
+    def rank_amounts(
+        self,
+        group_by=("species", "reason"),
+        rank_within=(),
+        years=None,
+        species=None,
+        owners=("Insgesamt",),
+        reasons=None,
+    ):
+        """
+        Sums the amounts of damaged wood for each combination of the group_by dimensions and ranks the combinations.
+        All combinations are summed with one reduction of the cube.
+        :param group_by: Dimensions to group by, any of "year", "species", "owner" and "reason"
+        :param rank_within: Dimensions of group_by, within which the combinations are ranked and their shares are
+            calculated, e.g. ["species"] ranks the reasons of each species. Empty ranks all combinations together.
+        :param years: First and last year to sum over, None sums over all years
+        :param species: Species to sum over, None sums over all species
+        :param owners: Owners to sum over, None sums over all owners. Defaults to "Insgesamt", which contains the others
+        :param reasons: Reasons to sum over with or without the prefix "Einschlagsursache: ", None sums over all reasons
+        :return: Data frame with one row for each combination, its amount, its share of the amount of all combinations
+            it is ranked with and its rank, 1 is the largest amount
+        """
+        group_by = list(group_by)
+        rank_within = list(rank_within)
+        if not group_by or not set(group_by) <= set(DIMENSIONS) or len(set(group_by)) != len(group_by):
+            raise ValueError(f"Can not group by {group_by}! Possible dimensions are {list(DIMENSIONS)}")
+        if not set(rank_within) <= set(group_by):
+            raise ValueError(f"Can only rank within dimensions of {group_by}, but got {rank_within}!")
+
+        years_idx = np.arange(len(self.__years))
+        if years is not None:
+            first, last = years
+            years_idx = np.flatnonzero((self.__years >= first) & (self.__years <= last))
+        selections = [
+            years_idx,
+            self.select_labels(self.__species_index, species),
+            self.select_labels(self.__owner_index, owners),
+            self.select_labels(self.__reason_index, reasons),
+        ]
+        labels = [self.__years.astype(int), self.__species, self.__owners, self.__reasons]
+        labels = [np.asarray(label, dtype=object)[selection] for label, selection in zip(labels, selections)]
+
+        # Sum over all other dimensions and move the dimensions to rank within in front of the ranked ones
+        group_axes = sorted(DIMENSIONS[dimension] for dimension in group_by)
+        reduce_axes = tuple(axis for axis in DIMENSIONS.values() if axis not in group_axes)
+        amounts = np.nansum(self.__cube[np.ix_(*selections)], axis=reduce_axes)
+        dimensions = rank_within + [dimension for dimension in group_by if dimension not in rank_within]
+        amounts = np.transpose(amounts, [group_axes.index(DIMENSIONS[dimension]) for dimension in dimensions])
+        amounts = amounts.reshape(int(np.prod(amounts.shape[: len(rank_within)])), -1)
+
+        order = np.argsort(-amounts, axis=1, kind="stable")
+        ranks = np.empty_like(order)
+        np.put_along_axis(ranks, order, np.arange(1, amounts.shape[1] + 1)[None, :], axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            shares = amounts / amounts.sum(axis=1, keepdims=True)
+
+        index = pd.MultiIndex.from_product([labels[DIMENSIONS[dimension]] for dimension in dimensions])
+        ranking = index.to_frame(index=False, name=dimensions)
+        ranking["amount"] = amounts.ravel()
+        ranking["share"] = shares.ravel()
+        ranking["rank"] = ranks.ravel()
+        # Rows of each group in the order of their rank
+        rows = (np.arange(amounts.shape[0])[:, None] * amounts.shape[1] + order).ravel()
+        return ranking.iloc[rows].reset_index(drop=True)
+
+    def select_labels(self, label_index, labels):
+        """
+        Returns the indexes of labels in the cube.
+        :param label_index: Dictionary, which maps each label of a dimension to its index
+        :param labels: Labels with or without the prefix "Einschlagsursache: ", None selects all labels
+        :return:
+        """
+        if labels is None:
+            return np.arange(len(label_index))
+        indexes = {label.removeprefix("Einschlagsursache: "): idx for label, idx in label_index.items()}
+        indexes.update(label_index)
+        try:
+            return np.array([indexes[label] for label in labels], dtype=np.intp)
+        except KeyError as error:
+            raise KeyError(f"Your CSV does not contain {error}! Possible values are {list(label_index)}")
+
+    def iter_series(self):
+        """
+        Yields the key (species, reason, owner) and the amounts of each series with a value in any year.
+        The series are ordered by species, reason and owner.
+        :return:
+        """
+        for specie, reason, owner in itertools.product(self.__species, self.__reasons, self.__owners):
+            if self.is_present(specie, reason, owner):
+                yield (specie, reason, owner), self.collect_temporal_dependencies(specie, reason, owner)
+
+    def analyze_series(self, consumers):
+        """
+        Passes each series of iter_series once to all consumers and waits for their plots.
+        :param consumers: Dictionary with the name and the generator of each consumer. The consumers receive the key and
+            the amounts of each series with send() and None after the last series.
+        :return:
+        """
+        with self.__profiler.stage("analyze_series"):
+            last_checkpoint = time.monotonic()
+            try:
+                for consumer in consumers.values():
+                    next(consumer)
+                for item in itertools.chain(self.iter_series(), [None]):
+                    for name, consumer in consumers.items():
+                        with self.__profiler.stage(name):
+                            try:
+                                consumer.send(item)
+                            except StopIteration:
+                                pass
+                    if self.__journal is not None and time.monotonic() - last_checkpoint > CHECKPOINT_SECONDS:
+                        self.checkpoint()
+                        last_checkpoint = time.monotonic()
+            finally:
+                # The units completed before an error are kept for a resumed run
+                self.checkpoint()
+
+    def checkpoint(self):
+        """
+        Waits until the plots of the completed units are written and writes the units to the journal.
+        :return:
+        """
+        if self.__plotter is not None:
+            self.__plotter.wait()
+        if self.__journal is not None:
+            self.__journal.commit()
+
+    def is_pending(self, mode, unit):
+        """
+        Checks, whether a unit of a mode has to be processed by this run, see Journal.is_pending.
+        :param mode: Mode, the name of its consumer
+        :param unit: Labels of the series or group of series
+        :return:
+        """
+        return self.__journal is None or self.__journal.is_pending(mode, unit)
+
+    def complete(self, mode, unit, result=None):
+        """
+        Records a processed unit of a mode in the journal.
+        :param mode: Mode, the name of its consumer
+        :param unit: Labels of the series or group of series
+        :param result: Result of the unit, which can be stored as JSON
+        :return:
+        """
+        if self.__journal is not None:
+            self.__journal.add(mode, unit, result)
+
+    def fingerprint(self):
+        """
+        Calculates a hash of everything the results of the modes depend on, the analyzed amounts, the options of the
+        model selection and of the plots. Journals of other fingerprints are not resumed.
+        :return:
+        """
+        oracle = self.__wood_oracle
+        options = [oracle.engine, oracle.k_splits, oracle.degrees, oracle.search, oracle.patience, self.__plot_options]
+        labels = [self.__years.tolist(), self.__species, self.__reasons, self.__owners]
+        digest = hashlib.sha256(json.dumps([options, labels]).encode())
+        digest.update(np.ascontiguousarray(self.__cube, dtype=float).tobytes())
+        return digest.hexdigest()
+
     def temporal_plot_all_combinations(self):
         """
         Plots all temporal dependencies for each specie, reason and owner.
         :return:
         """
-        for specie in self.__species:
-            for reason in self.__reasons:
-                for owner in self.__owners:
-                    amounts = self.collect_temporal_dependencies(specie, reason, owner)
-                    self.__plotter.plot_temporal_dependencies(amounts, specie, reason, owner)
+        self.analyze_series({"plot_temporal_dependencies_all": self.temporal_plot_consumer()})
 
     def owner_dependencies_plot(self):
         """
         Plots all temporal dependencies for each specie and reason for all owners.
         :return:
         """
-        amounts = {}
-        for specie in self.__species:
-            amounts[specie] = {}
-            for reason in self.__reasons:
-                for owner in self.__owners:
-                    amounts[specie][owner] = self.collect_temporal_dependencies(specie, reason, owner)
-                reason = reason.removeprefix("Einschlagsursache: ")
-                self.__plotter.plot_temporal_dependencies_from_species_owner_dict(amounts[specie], specie, reason)
+        self.analyze_series({"plot_owner_dependencies": self.owner_plot_consumer()})
 
     def reason_dependencies_plot(self):
         """
         Plots all temporal dependencies for each specie and owner for all reasons.
         :return:
         """
-        amounts = {}
-        for specie in self.__species:
-            amounts[specie] = {}
-            for owner in self.__owners:
-                for reason in self.__reasons:
-                    amounts[specie][reason] = self.collect_temporal_dependencies(specie, reason, owner)
-                self.__plotter.plot_temporal_dependencies_from_species_reason_dict(amounts[specie], specie, owner)
+        self.analyze_series({"plot_reason_dependencies": self.reason_plot_consumer()})
 
-    def collect_temporal_dependencies(self, species="", reason="", origin=""):
+    def predict_temporal_dependencies(self):
         """
-        Collects the temporal dependencies for a specific species, reason and origin.
-        :param species: Species of the tree
-        :param reason: Reason for the damaged wood
-        :param origin: Origin/ owner of the tree
+        Predicts the amount of damaged wood in 2024. And plots the predicted function.
+        :return:
+        """
+        self.analyze_series({"predict": self.prediction_consumer()})
+
+    def temporal_plot_consumer(self):
+        """
+        Consumer of analyze_series, which plots the temporal dependencies of each series.
         :return:
         """
-        amounts = np.zeros(self.__year_dict.keys().__len__())
+        while (item := (yield)) is not None:
+            key, amounts = item
+            if self.is_pending("plot_temporal_dependencies_all", key):
+                self.get_plotter().plot_temporal_dependencies(amounts, *key)
+                self.complete("plot_temporal_dependencies_all", key)
 
-        idx = 0
-        for year in self.__year_dict:
-            all_species_in_year = self.__year_dict[year][self.__year_dict[year]["Baumart"] == species]
-            all_orig_all_spec_in_year = all_species_in_year[all_species_in_year["Waldeigentum"] == origin]
-            amounts[idx] = all_orig_all_spec_in_year[reason].iloc[0]
-            idx += 1
-        return amounts
+    def owner_plot_consumer(self):
+        """
+        Consumer of analyze_series, which plots the temporal dependencies of all owners for each specie and reason.
+        Only the series of one specie and reason are kept at a time.
+        :return:
+        """
+        group, amounts = None, {}
+        while (item := (yield)) is not None:
+            (specie, reason, owner), series = item
+            if (specie, reason) != group:
+                self.plot_owner_group(group, amounts)
+                group, amounts = (specie, reason), {}
+            amounts[owner] = series
+        self.plot_owner_group(group, amounts)
 
-    def predict_temporal_dependencies(self):
+    def plot_owner_group(self, group, amounts):
         """
-        Predicts the amount of damaged wood in 2024. And plots the predicted function.
+        Plots the temporal dependencies of all owners for a specific specie and reason.
+        :param group: Specie and reason, None for no group
+        :param amounts: Dictionary with the owners and their amounts
+        :return:
+        """
+        if group is None or not self.is_pending("plot_owner_dependencies", group):
+            return
+        specie, reason = group
+        reason = reason.removeprefix("Einschlagsursache: ")
+        self.get_plotter().plot_temporal_dependencies_from_species_owner_dict(amounts, specie, reason)
+        self.complete("plot_owner_dependencies", group)
+
+    def reason_plot_consumer(self):
+        """
+        Consumer of analyze_series, which plots the temporal dependencies of all reasons for each specie and owner.
+        Only the series of one specie are kept at a time.
         :return:
         """
-        x = self.__years.reshape(-1, 1)
+        specie, amounts = None, {}
+        while (item := (yield)) is not None:
+            (item_specie, reason, owner), series = item
+            if item_specie != specie:
+                self.plot_reason_groups(specie, amounts)
+                specie, amounts = item_specie, {}
+            amounts.setdefault(owner, {})[reason] = series
+        self.plot_reason_groups(specie, amounts)
 
-        amounts = {}
-        for specie in self.__species:
-            amounts[specie] = {}
-            for reason in self.__reasons:
-                for owner in self.__owners:
-                    y = self.collect_temporal_dependencies(specie, reason, owner)
-                    train_predict, train_score, value_2024, degree = self.__wood_oracle.predict_wood_logging(
-                        x, y, specie, reason, owner
-                    )
+    def plot_reason_groups(self, specie, amounts):
+        """
+        Plots the temporal dependencies of all reasons for a specific specie and each owner.
+        :param specie: Specie, None for no specie
+        :param amounts: Dictionary with the owners and for each owner a dictionary with the reasons and their amounts
+        :return:
+        """
+        for owner in self.__owners:
+            if owner in amounts and self.is_pending("plot_reason_dependencies", (specie, owner)):
+                self.get_plotter().plot_temporal_dependencies_from_species_reason_dict(amounts[owner], specie, owner)
+                self.complete("plot_reason_dependencies", (specie, owner))
 
-                    self.__plotter.plot_predictions(
-                        y, train_predict, train_score, value_2024, degree, specie, reason, owner
-                    )
+    def prediction_consumer(self, batch_size=PREDICTION_BATCH_SIZE):
+        """
+        Consumer of analyze_series, which predicts the amount of damaged wood in 2024 and plots the predicted function
+        for each series. The series are predicted in batches.
+        :param batch_size: Maximum number of series, which are predicted at once
+        :return:
+        """
+        keys, y = [], []
+        while (item := (yield)) is not None:
+            (specie, reason, owner), series = item
+            if not self.is_pending("predict", (specie, reason, owner)):
+                continue
+            # Series, whose folds have less than 2 validation values, can not be cross validated
+            present = ~np.isnan(series)
+            if not self.__wood_oracle.can_cross_validate(present):
+                _logger.warning(
+                    "Skipping %s, %s, %s: %s years with a value are too few for %s folds",
+                    specie,
+                    reason,
+                    owner,
+                    np.count_nonzero(present),
+                    self.__wood_oracle.k_splits,
+                )
+                self.complete("predict", (specie, reason, owner))
+                continue
+            keys.append((specie, reason, owner))
+            y.append(series)
+            if len(keys) == batch_size:
+                self.predict_batch(keys, y)
+                keys, y = [], []
+        if keys:
+            self.predict_batch(keys, y)
+
+    def predict_batch(self, keys, y):
+        """
+        Predicts the amount of damaged wood in 2024 for a batch of series and plots the predicted functions.
+        :param keys: Species, reason and owner of each series
+        :param y: Amounts of each series
+        :return:
+        """
+        y = np.stack(y)
+        train_predict, train_score, value_2024, degree = self.forecast_series(keys, y)
+        # The forecasts of the batch are the last rows of the results table
+        rows = self.__wood_oracle.results[len(self.__wood_oracle.results) - len(keys) :]
+
+        for idx, (specie, reason, owner) in enumerate(keys):
+            _logger.info("%s, %s, %s in 2024: %s", specie, reason, owner, value_2024[idx : idx + 1])
+            self.get_plotter().plot_predictions(
+                y[idx],
+                train_predict[idx],
+                train_score[idx],
+                value_2024[idx : idx + 1],
+                degree[idx],
+                specie,
+                reason,
+                owner,
+            )
+            self.complete("predict", (specie, reason, owner), rows[idx])
+
+    def forecast_series(self, keys, y=None, record=True):
+        """
+        Predicts the amount of damaged wood in 2024 for series without plotting them.
+        :param keys: Species, reason and owner of each series
+        :param y: Amounts of each series, None collects them from the CSV
+        :param record: Add the series to the table of write_forecasts
+        :return: Predictions for the years, training scores, values in 2024 and degrees of the series
+        """
+        if y is None:
+            y = np.stack([self.collect_temporal_dependencies(*key) for key in keys])
+        return self.__wood_oracle.predict_many(
+            self.__years.reshape(-1, 1),
+            y,
+            [{"species": specie, "reason": reason, "owner": owner} for specie, reason, owner in keys],
+            record,
+        )
+
+    def get_labels(self):
+        """
+        Returns the labels of the dimensions of the analyzed CSV, the years in ascending order. The regions are empty
+        for statistics without region column.
+        :return: Dictionary with the name of each dimension and its labels
+        """
+        return {
+            "year": self.__years.astype(int).tolist(),
+            "species": list(self.__species),
+            "owner": list(self.__owners),
+            "reason": list(self.__reasons),
+            "region": list(self.__regions),
+        }
+
+    def write_forecasts(self, file_path):
+        """
+        Writes the selected degree, the validation error of each degree, the training score and the forecast for 2024
+        of each predicted series as CSV or, if the file ends with .json, as JSON file.
+        :param file_path: Path of the file
+        :return:
+        """
+        self.__wood_oracle.write_results(file_path)
+
+    def is_present(self, species="", reason="", origin=""):
+        """
+        Checks, whether the CSV contains a value for a specific species, reason and origin in any year.
+        :param species: Species of the tree
+        :param reason: Reason for the damaged wood
+        :param origin: Origin/ owner of the tree
+        :return:
+        """
+        return self.__series_presence[
+            self.__species_index[species], self.__owner_index[origin], self.__reason_index[reason]
+        ]
+
+    def collect_temporal_dependencies(self, species="", reason="", origin=""):
+        """
+        Collects the temporal dependencies for a specific species, reason and origin.
+        :param species: Species of the tree
+        :param reason: Reason for the damaged wood
+        :param origin: Origin/ owner of the tree
+        :return: View on the amounts for each year
+        """
+        with self.__profiler.stage("collect_temporal_dependencies"):
+            return self.__cube[
+                :, self.__species_index[species], self.__owner_index[origin], self.__reason_index[reason]
+            ]
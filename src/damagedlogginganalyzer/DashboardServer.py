@@ -0,0 +1,293 @@
+import json
+import logging
+import math
+
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+_logger = logging.getLogger(__name__)
+
+# Page of the dashboard, the series are plotted client-side as SVG, so that it works without any network access
+DASHBOARD_HTML = """<!DOCTYPE html>
+<html lang="de">
+<head>
+<meta charset="utf-8">
+<title>DamagedLoggingAnalyzer</title>
+<style>
+body { font-family: sans-serif; margin: 2em; }
+select { margin-right: 1em; max-width: 22em; }
+svg { border: 1px solid #ccc; margin-top: 1em; }
+td, th { padding: 0.2em 1em; text-align: left; }
+#forecast { color: magenta; margin-top: 0.5em; }
+</style>
+</head>
+<body>
+<h1>DamagedLoggingAnalyzer</h1>
+<div>
+<label>Baumart <select id="species"></select></label>
+<label>Einschlagsursache <select id="reason"></select></label>
+<label>Waldeigentum <select id="owner"></select></label>
+</div>
+<svg id="plot" width="900" height="450"></svg>
+<div id="forecast"></div>
+<h2>Einschlagsursachen der Baumart</h2>
+<table id="ranking"></table>
+<script>
+const selects = ["species", "reason", "owner"].map((id) => document.getElementById(id));
+
+// The labels come from the CSV, so they are set as text and never parsed as HTML
+function element(tag, text) {
+  const node = document.createElement(tag);
+  node.textContent = text;
+  return node;
+}
+
+function row(tag, texts) {
+  const node = document.createElement("tr");
+  node.append(...texts.map((text) => element(tag, text)));
+  return node;
+}
+
+async function get(path, params) {
+  const response = await fetch(path + "?" + new URLSearchParams(params));
+  return response.json();
+}
+
+function draw(years, lines) {
+  const svg = document.getElementById("plot");
+  const [width, height, margin] = [900, 450, 60];
+  const values = lines.flatMap((line) => line.values).filter((value) => value !== null);
+  const [low, high] = [Math.min(0, ...values), Math.max(1, ...values)];
+  const [first, last] = [years[0], years[years.length - 1] + 1];
+  const px = (year) => margin + ((year - first) / Math.max(last - first, 1)) * (width - 2 * margin);
+  const py = (value) => height - margin - ((value - low) / (high - low)) * (height - 2 * margin);
+  let content = `<line x1="${margin}" y1="${py(low)}" x2="${width - margin}" y2="${py(low)}" stroke="black"/>`;
+  content += `<line x1="${margin}" y1="${py(low)}" x2="${margin}" y2="${py(high)}" stroke="black"/>`;
+  content += `<text x="${margin - 5}" y="${py(high)}" text-anchor="end">${high.toFixed(1)}</text>`;
+  content += `<text x="${margin - 5}" y="${py(low)}" text-anchor="end">${low.toFixed(1)}</text>`;
+  content += `<text x="${px(first)}" y="${height - margin + 20}">${first}</text>`;
+  content += `<text x="${px(last)}" y="${height - margin + 20}" text-anchor="end">${last}</text>`;
+  for (const line of lines) {
+    const points = line.years.map((year, idx) => [year, line.values[idx]]).filter(([, value]) => value !== null);
+    const path = points.map(([year, value]) => `${px(year)},${py(value)}`).join(" ");
+    content += `<polyline points="${path}" fill="none" stroke="${line.color}" stroke-width="${line.width}"/>`;
+    for (const [year, value] of points) {
+      content += `<circle cx="${px(year)}" cy="${py(value)}" r="${line.radius}" fill="${line.color}"/>`;
+    }
+  }
+  svg.innerHTML = content;
+}
+
+async function update() {
+  const [species, reason, owner] = selects.map((select) => select.value);
+  const series = await get("/api/series", { species, reason, owner });
+  const forecast = await get("/api/forecast", { species, reason, owner });
+  const lines = [{ years: series.years, values: series.amounts, color: "red", width: 0, radius: 4 }];
+  const text = document.getElementById("forecast");
+  if (forecast.error) {
+    text.textContent = forecast.error;
+  } else {
+    const years = series.years.concat([2024]);
+    const values = forecast.fit.concat([forecast.forecast_2024]);
+    lines.push({ years, values, color: "steelblue", width: 3, radius: 0 });
+    text.textContent = `Polynomial Regression, Grad ${forecast.degree}, Training R² ${forecast.train_r2.toFixed(2)}, `
+      + `Prognose 2024: ${forecast.forecast_2024.toFixed(1)}`;
+  }
+  draw(series.years, lines);
+
+  const ranking = await get("/api/ranking", { group_by: "reason", species, owners: owner });
+  document.getElementById("ranking").replaceChildren(
+    row("th", ["Rang", "Einschlagsursache", "Menge", "Anteil"]),
+    ...ranking.map((line) => row("td", [
+      line.rank, line.reason, line.amount.toFixed(1), `${((line.share || 0) * 100).toFixed(1)} %`,
+    ])),
+  );
+}
+
+async function init() {
+  const labels = await get("/api/labels", {});
+  for (const [select, dimension] of [[selects[0], "species"], [selects[1], "reason"], [selects[2], "owner"]]) {
+    select.replaceChildren(...labels[dimension].map((label) => element("option", label)));
+    select.addEventListener("change", update);
+  }
+  update();
+}
+
+init();
+</script>
+</body>
+</html>
+"""
+
+
+def to_json_values(values):
+    """
+    Converts an array to a list for JSON, NaN becomes None.
+    :param values: Array of floats
+    :return:
+    """
+    return [None if math.isnan(value) else value for value in map(float, values)]
+
+
+class DashboardServer:
+    """
+    This class serves a local dashboard of an analyzed CSV. The page plots the series client-side with the data of a
+    small JSON API:
+    - /api/labels: Labels of the years, species, owners and reasons
+    - /api/series?species=&reason=&owner=: Amounts of a series for each year
+    - /api/forecast?species=&reason=&owner=: Selected degree, training R² score, fit and forecast for 2024 of a series
+    - /api/ranking?group_by=&rank_within=&years=&species=&owners=&reasons=: Ranking of
+      DamagedLoggingAnalyzer.rank_amounts, lists are separated by commas
+    The labels are computed on start, everything else on the first request. All responses are cached, the least
+    recently used ones are evicted above cache_size responses.
+    """
+
+    def __init__(self, analyzer, host="127.0.0.1", port=8000, cache_size=4096):
+        """
+        :param analyzer: DamagedLoggingAnalyzer, which analyzed the CSV
+        :param host: Host to listen on, only the local machine by default
+        :param port: Port to listen on
+        :param cache_size: Maximum number of cached responses
+        """
+        self.__analyzer = analyzer
+        self.__host = host
+        self.__port = port
+        self.__cache_size = cache_size
+        self.__cache = OrderedDict()
+        self.__routes = {
+            "/": self.dashboard,
+            "/api/labels": self.labels,
+            "/api/series": self.series,
+            "/api/forecast": self.forecast,
+            "/api/ranking": self.ranking,
+        }
+        self.respond("/api/labels")
+
+    def respond(self, path, query=""):
+        """
+        Returns the cached response to a request or computes it.
+        :param path: Path of the request
+        :param query: Query string of the request
+        :return: HTTP status, content type and body of the response
+        """
+        params = {name: values[-1] for name, values in parse_qs(query).items()}
+        key = (path, tuple(sorted(params.items())))
+        if key in self.__cache:
+            self.__cache.move_to_end(key)
+            return self.__cache[key]
+
+        route = self.__routes.get(path)
+        if route is None:
+            return 404, "application/json", json.dumps({"error": f"Unknown path {path}"}).encode()
+        try:
+            body = route(**params)
+            response = 200, "text/html" if path == "/" else "application/json", body.encode()
+        except (KeyError, TypeError, ValueError) as error:
+            # str() of a KeyError quotes its message
+            message = error.args[0] if isinstance(error, KeyError) and error.args else str(error)
+            response = 400, "application/json", json.dumps({"error": f"{message}"}).encode()
+
+        self.__cache[key] = response
+        if len(self.__cache) > self.__cache_size:
+            self.__cache.popitem(last=False)
+        return response
+
+    def dashboard(self):
+        """
+        Returns the page of the dashboard.
+        :return:
+        """
+        return DASHBOARD_HTML
+
+    def labels(self):
+        """
+        Returns the labels of the dimensions as JSON.
+        :return:
+        """
+        return json.dumps(self.__analyzer.get_labels())
+
+    def series(self, species, reason, owner):
+        """
+        Returns the amounts of a series for each year as JSON.
+        :param species: Species of the tree
+        :param reason: Reason for the damaged wood
+        :param owner: Owner of the tree
+        :return:
+        """
+        amounts = self.__analyzer.collect_temporal_dependencies(species, reason, owner)
+        return json.dumps({"years": self.__analyzer.get_labels()["year"], "amounts": to_json_values(amounts)})
+
+    def forecast(self, species, reason, owner):
+        """
+        Returns the selected degree, training R² score, fit for each year and forecast for 2024 of a series as JSON.
+        :param species: Species of the tree
+        :param reason: Reason for the damaged wood
+        :param owner: Owner of the tree
+        :return:
+        """
+        # The forecasts are only cached here, they would grow the results table of the analyzer without limit
+        train_predict, train_score, value_2024, degree = self.__analyzer.forecast_series(
+            [(species, reason, owner)], record=False
+        )
+        return json.dumps(
+            {
+                "degree": int(degree[0]),
+                "train_r2": float(train_score[0]),
+                "fit": to_json_values(train_predict[0]),
+                "forecast_2024": float(value_2024[0]),
+            }
+        )
+
+    def ranking(self, group_by="species,reason", rank_within="", years=None, species=None, owners=None, reasons=None):
+        """
+        Returns the ranking of DamagedLoggingAnalyzer.rank_amounts as JSON list of rows.
+        :param group_by: Dimensions to group by, separated by commas
+        :param rank_within: Dimensions to rank within, separated by commas
+        :param years: First and last year, separated by a comma, None sums over all years
+        :param species: Species, separated by commas, None sums over all species
+        :param owners: Owners, separated by commas, None sums over "Insgesamt"
+        :param reasons: Reasons, separated by commas, None sums over all reasons
+        :return:
+        """
+
+        def split(values):
+            return None if values is None else [value for value in values.split(",") if value]
+
+        ranking = self.__analyzer.rank_amounts(
+            split(group_by),
+            split(rank_within),
+            None if years is None else [int(year) for year in split(years)],
+            split(species),
+            ("Insgesamt",) if owners is None else split(owners),
+            split(reasons),
+        )
+        return ranking.to_json(orient="records")
+
+    def serve_forever(self):
+        """
+        Serves the dashboard until the process is interrupted.
+        :return:
+        """
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                status, content_type, body = server.respond(url.path, url.query)
+                self.send_response(status)
+                self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                _logger.debug("%s - %s", self.address_string(), format % args)
+
+        # The analyzer is not thread-safe, so the requests are handled one after another
+        with HTTPServer((self.__host, self.__port), Handler) as http_server:
+            _logger.info("Serving the dashboard on http://%s:%s", *http_server.server_address[:2])
+            try:
+                http_server.serve_forever()
+            except KeyboardInterrupt:
+                _logger.info("Stopped serving the dashboard")
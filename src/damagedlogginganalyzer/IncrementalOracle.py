@@ -0,0 +1,421 @@
+import hashlib
+import json
+import logging
+import os
+import numpy as np
+
+from pathlib import Path
+
+from damagedlogginganalyzer.Oracle import Oracle, r2_scores, validation_errors, vandermonde
+
+_logger = logging.getLogger(__name__)
+
+# Increase when the layout of the state file changes, so that all states are built again
+STATE_VERSION = 1
+
+# Arrays of the sufficient statistics of each series in the state file
+STATE_ARRAYS = ["positions", "r", "qty", "counts", "y_sums", "yy", "phi_y", "phi_phi"]
+
+
+def givens_append(r, qty, row, y, mask):
+    """
+    Appends one sample to many QR factorizations with Givens rotations, the old samples are not needed.
+    After the update r.T @ r and r.T @ qty equal X.T @ X and X.T @ y of all samples, which were appended.
+    :param r: Upper triangular factors of shape (..., n_columns, n_columns), updated in place
+    :param qty: Q.T @ y of shape (..., n_columns), updated in place
+    :param row: Row of the design matrix of shape (n_columns,)
+    :param y: Label of the sample of shape (...)
+    :param mask: Boolean array of shape (...), which is False for the factorizations which do not get the sample
+    :return:
+    """
+    row = np.where(mask[..., None], row, 0.0)
+    y = np.where(mask, y, 0.0)
+    for column in range(r.shape[-1]):
+        diagonal = r[..., column, column]
+        value = row[..., column]
+        radius = np.hypot(diagonal, value)
+        # Rows without the sample are left untouched, instead of being rotated by -1
+        rotate = value != 0
+        radius = np.where(rotate, radius, 1.0)
+        cos = np.where(rotate, diagonal / radius, 1.0)
+        sin = np.where(rotate, value / radius, 0.0)
+
+        r_row = r[..., column, :].copy()
+        r[..., column, :] = cos[..., None] * r_row + sin[..., None] * row
+        row = cos[..., None] * row - sin[..., None] * r_row
+        qty_value = qty[..., column].copy()
+        qty[..., column] = cos * qty_value + sin * y
+        y = cos * y - sin * qty_value
+
+
+def sufficient_r2_scores(coefficients, counts, y_sums, yy, phi_y, phi_phi):
+    """
+    Calculates R² scores like r2_scores from the sufficient statistics of the samples instead of the samples.
+    :param coefficients: Coefficients of shape (..., n_columns)
+    :param counts: Number of samples of shape (...)
+    :param y_sums: Sum of the labels of shape (...)
+    :param yy: Sum of the squared labels of shape (...)
+    :param phi_y: X.T @ y of shape (..., n_columns)
+    :param phi_phi: X.T @ X of shape (..., n_columns, n_columns)
+    :return: Scores of shape (...)
+    """
+    columns = coefficients.shape[-1]
+    phi_y = phi_y[..., :columns]
+    phi_phi = phi_phi[..., :columns, :columns]
+    numerator = yy - 2 * np.einsum("...c,...c->...", coefficients, phi_y)
+    numerator += np.einsum("...c,...cd,...d->...", coefficients, phi_phi, coefficients)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denominator = yy - y_sums**2 / counts
+
+        # The sums cancel to rounding errors instead of 0 for constant labels and perfect predictions
+        tolerance = 1e-12 * np.maximum(yy, 1.0)
+        numerator = np.where(numerator > tolerance, numerator, 0.0)
+        denominator = np.where(denominator > tolerance, denominator, 0.0)
+        scores = np.where(denominator != 0, 1 - numerator / denominator, np.where(numerator != 0, 0.0, 1.0))
+    return np.where(counts < 2, np.nan, scores)
+
+
+class IncrementalOracle(Oracle):
+    """
+    This class selects the degree of the polynomial regression like the numpy engine of the Oracle, but keeps
+    sufficient statistics of each series, so that the models are updated from the new years only, when years are
+    appended to the series.
+
+    A sample is assigned to the fold of its position modulo k_splits and the features are centered and scaled with the
+    years of the first run. The shuffled folds of KFold and the center and scale of the numpy engine change, whenever
+    a year is appended, so the selected degrees can differ from the ones of the numpy engine. For each series the state
+    keeps the QR factor and Q.T @ y of the training samples of each fold and of all samples, which are updated with
+    Givens rotations, and the sums of the validation samples of each fold, from which the validation scores follow.
+    """
+
+    def __init__(
+        self, state_path=None, check=False, profiler=None, k_splits=9, degrees=None, search="grid", patience=2
+    ):
+        """
+        :param state_path: Path of the state file (.npz), None keeps the state only in memory
+        :param check: Compare the updated models with a full refit of all years
+        :param profiler: Profiler, which records the stages
+        :param k_splits: Number of folds
+        :param degrees: Degrees to search, 1 to 14 by default
+        :param search: Strategy to search the best degree, see DEGREE_SEARCHES of the Oracle
+        :param patience: Number of degrees without a lower validation error, after which the pruned search stops
+        """
+        super().__init__("incremental", profiler, k_splits, degrees, search, patience)
+        self.state_path = None if state_path is None else Path(state_path)
+        self.check = check
+        self.__state = None
+
+    def empty_state(self, x):
+        """
+        Returns a state without series for the features x.
+        :param x: Features, array of shape (n_samples, 1)
+        :return:
+        """
+        x = np.asarray(x, dtype=float).ravel()
+        center = x.mean()
+        scale = np.abs(x - center).max() or 1.0
+        columns = max(self.degrees) + 1
+        return {
+            "config": self.config(),
+            "years": x,
+            "center": center,
+            "scale": scale,
+            "keys": [],
+            "digests": [],
+            "positions": np.zeros(0, dtype=int),
+            "r": np.zeros((0, self.k_splits + 1, columns, columns)),
+            "qty": np.zeros((0, self.k_splits + 1, columns)),
+            "counts": np.zeros((0, self.k_splits)),
+            "y_sums": np.zeros((0, self.k_splits)),
+            "yy": np.zeros((0, self.k_splits)),
+            "phi_y": np.zeros((0, self.k_splits, columns)),
+            "phi_phi": np.zeros((0, self.k_splits, columns, columns)),
+        }
+
+    def config(self):
+        """
+        Returns everything the state depends on, states of other configurations are built again.
+        :return:
+        """
+        return json.dumps({"version": STATE_VERSION, "k_splits": self.k_splits, "degrees": self.degrees})
+
+    def load_state(self, x):
+        """
+        Returns the state, it is read from the state file on first use. The state is built again, if it belongs to
+        another configuration or its years are not the first years of x.
+        :param x: Features, array of shape (n_samples, 1)
+        :return:
+        """
+        x = np.asarray(x, dtype=float).ravel()
+        if self.__state is None and self.state_path is not None and self.state_path.exists():
+            with np.load(self.state_path) as arrays:
+                self.__state = {name: arrays[name] for name in arrays.files}
+            self.__state["keys"] = list(self.__state["keys"])
+            self.__state["digests"] = list(self.__state["digests"])
+            self.__state["config"] = str(self.__state["config"])
+
+        state = self.__state
+        if (
+            state is None
+            or state["config"] != self.config()
+            or not np.array_equal(x[: len(state["years"])], state["years"])
+        ):
+            if state is not None:
+                _logger.info("The incremental models do not match the years or the configuration, fitting all years")
+            state = self.__state = self.empty_state(x)
+        elif len(x) > len(state["years"]):
+            state["years"] = x
+        return state
+
+    def save_state(self):
+        """
+        Writes the state to the state file, the old file is replaced at once.
+        :return:
+        """
+        if self.state_path is None or self.__state is None:
+            return
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_name(self.state_path.name + ".tmp")
+        with open(tmp_path, "wb") as file:
+            np.savez(file, **{**self.__state, "keys": np.array(self.__state["keys"], dtype=str)})
+        os.replace(tmp_path, self.state_path)
+
+    def append(self, state, rows, x, y, start):
+        """
+        Appends the samples of x to the sufficient statistics of some series of the state.
+        :param state: State
+        :param rows: Indices of the series in the state
+        :param x: Features, array of shape (n_samples, 1)
+        :param y: Labels, array of shape (n_series, n_samples), NaN is left out
+        :param start: Position of the first sample, which decides its fold
+        :return:
+        """
+        basis = vandermonde(x, state["center"], state["scale"], max(self.degrees))
+        r, qty = state["r"][rows], state["qty"][rows]
+        counts, y_sums, yy = state["counts"][rows], state["y_sums"][rows], state["yy"][rows]
+        phi_y, phi_phi = state["phi_y"][rows], state["phi_phi"][rows]
+        folds = np.arange(self.k_splits + 1)
+        for position, row, labels in zip(range(start, start + len(basis)), basis, np.asarray(y, dtype=float).T):
+            fold = position % self.k_splits
+            present = ~np.isnan(labels)
+            labels = np.where(present, labels, 0.0)
+
+            # The sample trains all folds but its own and the final models, and validates its own fold
+            givens_append(r, qty, row, labels[:, None], present[:, None] & (folds != fold))
+            counts[:, fold] += present
+            y_sums[:, fold] += labels
+            yy[:, fold] += labels**2
+            phi_y[:, fold] += labels[:, None] * row
+            phi_phi[:, fold] += present[:, None, None] * np.outer(row, row)
+
+        state["r"][rows], state["qty"][rows] = r, qty
+        state["counts"][rows], state["y_sums"][rows], state["yy"][rows] = counts, y_sums, yy
+        state["phi_y"][rows], state["phi_phi"][rows] = phi_y, phi_phi
+        state["positions"][rows] = start + len(basis)
+
+    def update(self, x, y, keys):
+        """
+        Updates the sufficient statistics of the series with the years, which were appended since the last update.
+        Series, which are new or whose old values changed, are fitted with all years.
+        :param x: Features, array of shape (n_samples, 1)
+        :param y: Labels, array of shape (n_series, n_samples)
+        :param keys: Keys, which identify the series across runs
+        :return: State and the indices of the series in the state
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        state = self.load_state(x)
+        index = {key: row for row, key in enumerate(state["keys"])}
+
+        with self.profiler.stage("update_models"):
+            rows = []
+            starts = []
+            for series, key in zip(y, keys):
+                row = index.get(key)
+                start = 0 if row is None else int(state["positions"][row])
+                if row is not None and state["digests"][row] != self.digest(series[:start]):
+                    _logger.info("Old values of %s changed, fitting all years", key)
+                    start = 0
+                if row is None:
+                    row = index[key] = len(state["keys"])
+                    state["keys"].append(key)
+                    state["digests"].append("")
+                    for name in STATE_ARRAYS:
+                        state[name] = np.concatenate([state[name], np.zeros((1,) + state[name].shape[1:])])
+                    state["positions"] = state["positions"].astype(int)
+                elif start == 0:
+                    for name in STATE_ARRAYS:
+                        state[name][row] = 0
+                rows.append(row)
+                starts.append(start)
+                state["digests"][row] = self.digest(series)
+
+            # Series with the same number of appended years are updated together
+            rows, starts = np.array(rows, dtype=int), np.array(starts, dtype=int)
+            for start in np.unique(starts):
+                if start < len(x):
+                    group = np.flatnonzero(starts == start)
+                    self.append(state, rows[group], x[start:], y[group, start:], start)
+        return state, rows
+
+    @staticmethod
+    def digest(series):
+        """
+        Calculates the digest of the values of a series, which detects changes of old values.
+        :param series: Values of the series
+        :return:
+        """
+        return hashlib.sha256(np.ascontiguousarray(series, dtype=float).tobytes()).hexdigest()
+
+    def select_state_degrees(self, state, rows):
+        """
+        Performs the k-fold cross validation of some series of the state from their sufficient statistics. The pruned
+        search skips the degrees with more coefficients than training samples in a fold.
+        :param state: State
+        :param rows: Indices of the series in the state
+        :return: Index of the best degree of shape (n_series,), average validation errors of shape
+            (n_degrees, n_series), training scores of the final models of shape (n_degrees, n_series) and their
+            coefficients of shape (n_degrees, max_degree + 1, n_series)
+        """
+        with self.profiler.stage("select_degrees"):
+            r, qty = state["r"][rows], state["qty"][rows]
+            sums = [state[name][rows] for name in ["counts", "y_sums", "yy", "phi_y", "phi_phi"]]
+            totals = [values.sum(axis=1) for values in sums]
+            min_train_counts = (totals[0][:, None] - sums[0]).min(axis=1)
+
+            a_test_errors = np.full((len(self.degrees), len(rows)), np.nan)
+            train_scores = np.full((len(self.degrees), len(rows)), np.nan)
+            coefficients = np.zeros((len(self.degrees), len(rows), max(self.degrees) + 1))
+            active = np.arange(len(rows))
+            best_errors = np.full(len(rows), np.inf)
+            rises = np.zeros(len(rows), dtype=int)
+            for degree_idx, degree in enumerate(self.degrees):
+                if self.search == "pruned":
+                    active = active[min_train_counts[active] > degree]
+                    if len(active) == 0:
+                        break
+                # The grid search evaluates all series without copying the state
+                index = active if self.search == "pruned" else slice(None)
+
+                # The QR factor of the first columns of the design matrix is the leading block of the QR factor
+                r_degree = r[index, :, : degree + 1, : degree + 1]
+                fold_coefficients = (np.linalg.pinv(r_degree) @ qty[index, :, : degree + 1, None])[..., 0]
+                test_scores = sufficient_r2_scores(fold_coefficients[:, :-1], *[values[index] for values in sums])
+                a_test_errors[degree_idx, index] = validation_errors(test_scores, axis=1)
+                train_scores[degree_idx, index] = sufficient_r2_scores(
+                    fold_coefficients[:, -1], *[values[index] for values in totals]
+                )
+                coefficients[degree_idx, index, : degree + 1] = fold_coefficients[:, -1]
+
+                if self.search == "pruned":
+                    best_errors[active], rises[active], searching = self.continue_search(
+                        a_test_errors[degree_idx, active], best_errors[active], rises[active]
+                    )
+                    active = active[searching]
+
+        best_idx = self.best_degree_indices(a_test_errors)
+        return best_idx, a_test_errors, train_scores, coefficients.transpose(0, 2, 1)
+
+    def refit(self, x, y, center, scale):
+        """
+        Performs the k-fold cross validation with the folds and basis of the state from all samples, which checks the
+        incremental updates.
+        :param x: Features, array of shape (n_samples, 1)
+        :param y: Labels, array of shape (n_series, n_samples)
+        :param center: Center of the features
+        :param scale: Scale of the features
+        :return: Average validation errors of shape (n_degrees, n_series), training scores of the final models of
+            shape (n_degrees, n_series) and their coefficients of shape (n_degrees, max_degree + 1, n_series)
+        """
+        max_degree = max(self.degrees)
+        degree_masks = np.arange(max_degree + 1) <= np.array(self.degrees)[:, None]
+        a_test_errors = np.empty((len(self.degrees), len(y)))
+        train_scores = np.empty((len(self.degrees), len(y)))
+        coefficients = np.empty((len(self.degrees), max_degree + 1, len(y)))
+
+        patterns, inverse = np.unique(~np.isnan(y), axis=0, return_inverse=True)
+        for pattern_idx, pattern in enumerate(patterns):
+            group = np.flatnonzero(inverse.ravel() == pattern_idx)
+            positions = np.flatnonzero(pattern)
+            basis = vandermonde(x[positions], center, scale, max_degree)
+            folds = positions % self.k_splits
+            train_masks = np.vstack([folds != np.arange(self.k_splits)[:, None], np.ones(len(positions), dtype=bool)])
+            designs = basis * train_masks[None, :, :, None] * degree_masks[:, None, None, :]
+            y_group = y[group][:, positions].T
+            fold_coefficients = np.linalg.pinv(designs) @ y_group
+            predictions = basis @ fold_coefficients
+
+            test_scores = r2_scores(y_group, predictions[:, :-1], ~train_masks[:-1])
+            a_test_errors[:, group] = validation_errors(test_scores, axis=1)
+            train_scores[:, group] = r2_scores(y_group, predictions[:, -1:], train_masks[-1:])[:, 0]
+            coefficients[:, :, group] = fold_coefficients[:, -1]
+        return a_test_errors, train_scores, coefficients
+
+    def fit_many(self, x, y, keys, x_predict=None):
+        """
+        Updates, selects and fits the models of many series with the same years and predicts their values.
+        :param x: Input data, array of shape (n_years, 1)
+        :param y: Output data, array of shape (n_series, n_years)
+        :param keys: Keys, which identify the series across runs
+        :param x_predict: Years to predict, defaults to the years of x and 2024
+        :return: List with the degree, training score, validation errors of all degrees, predictions for x_predict,
+            coefficients, center and scale of each series
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        x_2024 = np.vstack([x, [[2024]]]) if x_predict is None else x_predict
+        state, rows = self.update(x, y, keys)
+        best_idx, a_test_errors, train_scores, coefficients = self.select_state_degrees(state, rows)
+        self.save_state()
+
+        if self.check:
+            with self.profiler.stage("check_models"):
+                self.check_refit(x, y, state, (a_test_errors, train_scores, coefficients))
+
+        series_idx = np.arange(len(y))
+        coefficients = coefficients[best_idx, :, series_idx]
+        predictions = coefficients @ vandermonde(x_2024, state["center"], state["scale"], max(self.degrees)).T
+        return [
+            {
+                "degree": self.degrees[best_idx[idx]],
+                "train_score": train_scores[best_idx[idx], idx],
+                "test_errors": a_test_errors[:, idx],
+                "predictions": predictions[idx],
+                "coefficients": coefficients[idx],
+                "center": state["center"],
+                "scale": state["scale"],
+            }
+            for idx in series_idx
+        ]
+
+    def check_refit(self, x, y, state, updated, tolerance=1e-4):
+        """
+        Compares the validation errors, training scores and fits of the updated models with a full refit. The
+        coefficients themselves are not compared, high degrees are too ill-conditioned for that.
+        :param x: Features, array of shape (n_samples, 1)
+        :param y: Labels, array of shape (n_series, n_samples)
+        :param state: State
+        :param updated: Validation errors, training scores and coefficients of the updated models
+        :param tolerance: Largest accepted difference relative to the absolute value, but at least 1
+        :return: Largest relative difference
+        """
+        refitted = self.refit(x, y, state["center"], state["scale"])
+        basis = vandermonde(x, state["center"], state["scale"], max(self.degrees))
+        difference = 0.0
+        # The degrees skipped by the pruned search are not compared
+        skipped = np.isnan(updated[0]) if self.search == "pruned" else np.zeros(updated[0].shape, dtype=bool)
+        pairs = zip(updated[:2] + (basis @ updated[2],), refitted[:2] + (basis @ refitted[2],))
+        for updated_values, refitted_values in pairs:
+            compared = ~(skipped[:, None] if updated_values.ndim == 3 else skipped)
+            finite = np.isfinite(refitted_values) & compared
+            if not np.array_equal(finite, np.isfinite(updated_values) & compared):
+                difference = np.inf
+            elif finite.any():
+                relative = np.abs(updated_values - refitted_values) / np.maximum(np.abs(refitted_values), 1.0)
+                difference = max(difference, relative[finite].max())
+
+        if difference > tolerance:
+            _logger.warning("The incremental models differ from a full refit by %s", difference)
+        else:
+            _logger.info("The incremental models match a full refit, largest relative difference %s", difference)
+        return difference
@@ -0,0 +1,200 @@
+import hashlib
+import json
+import logging
+import os
+
+from pathlib import Path
+
+_logger = logging.getLogger(__name__)
+
+# Increase when the records of the journal change, so that older journals are not resumed
+JOURNAL_VERSION = 1
+
+
+def shard_of(unit, n_shards):
+    """
+    Returns the shard of a work unit. The shard only depends on the labels of the unit, so every node assigns the same
+    units to the same shards, whatever the other units of the statistic.
+    :param unit: Labels of the unit, e.g. species, reason and owner
+    :param n_shards: Number of shards
+    :return:
+    """
+    digest = hashlib.sha256("\x1f".join(unit).encode()).digest()
+    return int.from_bytes(digest[:8], "big") % n_shards
+
+
+class Journal:
+    """
+    This class records the completed work units of an analysis in output-path/journal.jsonl, so that an interrupted
+    run can be resumed without processing the completed units again. A unit is one series or one group of series of a
+    mode, e.g. ("predict", ["Eiche", "Einschlagsursache: Insekten", "Privatwald"]), and is recorded with its result.
+    The units can be split into shards, which are processed by different runs. Each shard has its own journal
+    journal-<shard>-of-<n_shards>.jsonl, a resumed run reads the journals of all shards in the output path.
+    The records are only written by commit(), after the outputs of the units are written.
+    """
+
+    def __init__(self, out_dir, shard=None, resume=False):
+        """
+        :param out_dir: Directory of the journals
+        :param shard: Index of the shard and number of shards, None processes all units
+        :param resume: Skip the units, which are recorded in the journals of the output path
+        """
+        self.__out_dir = Path(out_dir)
+        self.__shard, self.__n_shards = shard or (0, 1)
+        if not 0 <= self.__shard < self.__n_shards:
+            raise ValueError(f"Shard {self.__shard} does not exist, the shards are 0 to {self.__n_shards - 1}!")
+        self.__resume = resume
+        name = "journal.jsonl" if shard is None else f"journal-{self.__shard}-of-{self.__n_shards}.jsonl"
+        self.file_path = self.__out_dir / name
+        self.__done = {}
+        self.__pending = []
+        self.__file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self, fingerprint):
+        """
+        Reads the completed units of the journals with the same fingerprint, if the run is resumed, and opens the
+        journal of this run.
+        :param fingerprint: Hash of everything the results depend on, e.g. the data and the options
+        :return:
+        """
+        self.close()
+        self.__done = {}
+        header = {"version": JOURNAL_VERSION, "fingerprint": fingerprint}
+        if self.__resume:
+            for file_path in sorted(self.__out_dir.glob("journal*.jsonl")):
+                self.read(file_path, header)
+            _logger.info("Resuming %s completed units", len(self.__done))
+
+        own_units = self.__resume and self.file_path.exists() and self.read_header(self.file_path) == header
+        self.__out_dir.mkdir(parents=True, exist_ok=True)
+        # An incomplete last record of an interrupted run is terminated, so that it does not swallow the next one
+        complete = not own_units or self.file_path.read_bytes().endswith(b"\n")
+        self.__file = open(self.file_path, "a" if own_units else "w", encoding="utf-8")
+        if not own_units:
+            self.__file.write(json.dumps(header) + "\n")
+        elif not complete:
+            self.__file.write("\n")
+        self.__file.flush()
+
+    @staticmethod
+    def read_header(file_path):
+        """
+        Returns the header of a journal.
+        :param file_path: Path of the journal
+        :return:
+        """
+        with open(file_path, encoding="utf-8") as file:
+            try:
+                return json.loads(file.readline())
+            except json.JSONDecodeError:
+                return None
+
+    def read(self, file_path, header):
+        """
+        Reads the completed units of a journal, if it has the header of this run.
+        :param file_path: Path of the journal
+        :param header: Header of this run
+        :return:
+        """
+        with open(file_path, encoding="utf-8") as file:
+            lines = file.read().splitlines()
+        try:
+            matches = bool(lines) and json.loads(lines[0]) == header
+        except json.JSONDecodeError:
+            matches = False
+        if not matches:
+            _logger.info("Ignoring %s, it belongs to other data or options", file_path)
+            return
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # The last record of an interrupted run can be incomplete
+                _logger.debug("Ignoring an incomplete record of %s", file_path)
+                continue
+            self.__done[record["mode"], tuple(record["unit"])] = record.get("result")
+
+    def owns(self, unit):
+        """
+        Checks, whether a unit belongs to the shard of this run.
+        :param unit: Labels of the unit
+        :return:
+        """
+        return self.__n_shards == 1 or shard_of(unit, self.__n_shards) == self.__shard
+
+    def is_pending(self, mode, unit):
+        """
+        Checks, whether a unit has to be processed by this run, i.e. it belongs to its shard and is not completed.
+        :param mode: Mode of the unit
+        :param unit: Labels of the unit
+        :return:
+        """
+        return self.owns(unit) and (mode, tuple(unit)) not in self.__done
+
+    def results(self, mode):
+        """
+        Returns the results of the completed units of a mode in the shard of this run.
+        :param mode: Mode of the units
+        :return: List with the result of each unit, which has one
+        """
+        return [
+            result
+            for (unit_mode, unit), result in self.__done.items()
+            if unit_mode == mode and result is not None and self.owns(unit)
+        ]
+
+    def add(self, mode, unit, result=None):
+        """
+        Adds a completed unit, it is written to the journal by the next commit().
+        :param mode: Mode of the unit
+        :param unit: Labels of the unit
+        :param result: Result of the unit, which can be stored as JSON
+        :return:
+        """
+        self.__pending.append({"mode": mode, "unit": list(unit), "result": result})
+
+    @property
+    def partial(self):
+        """
+        Whether this run processes only a part of the units, because it is resumed or processes one of several shards.
+        :return:
+        """
+        return self.__resume or self.__n_shards > 1
+
+    @property
+    def pending(self):
+        """
+        Number of units, which are not written to the journal yet.
+        :return:
+        """
+        return len(self.__pending)
+
+    def commit(self):
+        """
+        Writes the added units to the journal and to the disk.
+        :return:
+        """
+        if self.__file is None or not self.__pending:
+            return
+        pending, self.__pending = self.__pending, []
+        self.__file.write("".join(json.dumps(record) + "\n" for record in pending))
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+        for record in pending:
+            self.__done[record["mode"], tuple(record["unit"])] = record["result"]
+
+    def close(self):
+        """
+        Closes the journal, units, which were not committed, are dropped.
+        :return:
+        """
+        self.__pending = []
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
@@ -0,0 +1,148 @@
+import sqlite3
+import time
+import numpy as np
+
+from pathlib import Path
+
+# Increase when the stored results change, so that all models are fitted again
+STORE_VERSION = 3
+
+# Maximum number of parameters of one SQLite statement in old SQLite versions
+CHUNK_SIZE = 500
+
+
+def to_blob(array):
+    """
+    Converts an array to bytes for the store, None stays None.
+    :param array: Array or None
+    :return:
+    """
+    return None if array is None else np.asarray(array, dtype=float).tobytes()
+
+
+def from_blob(blob):
+    """
+    Converts bytes of the store back to an array, None stays None.
+    :param blob: Bytes or None
+    :return:
+    """
+    return None if blob is None else np.frombuffer(blob, dtype=float).copy()
+
+
+class ModelStore:
+    """
+    This class stores the selected models of series in a SQLite database, so that series, which did not change, are
+    not fitted again by later runs. The results are stored by a key, which has to identify the series and everything
+    the model selection depends on. The least recently used results are evicted, if the store contains more than
+    max_entries results.
+    """
+
+    COLUMNS = ["degree", "train_score", "test_errors", "predictions", "coefficients", "center", "scale"]
+
+    def __init__(self, file_path, max_entries=100000, rebuild=False):
+        self.__file_path = Path(file_path)
+        self.__max_entries = max_entries
+        self.__rebuild = rebuild
+        self.__connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def connection(self):
+        """
+        Returns the connection to the database, it is opened and the table is created on first use.
+        :return:
+        """
+        if self.__connection is None:
+            self.__file_path.parent.mkdir(parents=True, exist_ok=True)
+            self.__connection = sqlite3.connect(self.__file_path)
+            self.__connection.execute(
+                "CREATE TABLE IF NOT EXISTS models (key TEXT PRIMARY KEY, version INTEGER, degree INTEGER, "
+                "train_score REAL, test_errors BLOB, predictions BLOB, coefficients BLOB, center REAL, scale REAL, "
+                "last_used REAL)"
+            )
+        return self.__connection
+
+    def get_many(self, keys):
+        """
+        Returns the stored results of the keys and marks them as used.
+        :param keys: Keys of the results
+        :return: Dictionary with the key and the result of each stored key
+        """
+        if self.__rebuild or not keys:
+            return {}
+
+        connection = self.connection()
+        results = {}
+        for start in range(0, len(keys), CHUNK_SIZE):
+            chunk = list(keys[start : start + CHUNK_SIZE])
+            rows = connection.execute(
+                f"SELECT key, {', '.join(self.COLUMNS)} FROM models "
+                f"WHERE version = ? AND key IN ({', '.join('?' * len(chunk))})",
+                [STORE_VERSION] + chunk,
+            )
+            for key, degree, train_score, test_errors, predictions, coefficients, center, scale in rows:
+                results[key] = {
+                    "degree": degree,
+                    "train_score": train_score,
+                    "test_errors": from_blob(test_errors),
+                    "predictions": from_blob(predictions),
+                    "coefficients": from_blob(coefficients),
+                    "center": center,
+                    "scale": scale,
+                }
+
+        now = time.time()
+        connection.executemany("UPDATE models SET last_used = ? WHERE key = ?", [(now, key) for key in results])
+        connection.commit()
+        return results
+
+    def put_many(self, results):
+        """
+        Stores results and evicts the least recently used results above the maximum number of results.
+        :param results: Dictionary with the key and the result of each series, see get_many
+        :return:
+        """
+        if not results:
+            return
+
+        connection = self.connection()
+        now = time.time()
+        connection.executemany(
+            "INSERT OR REPLACE INTO models VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    key,
+                    STORE_VERSION,
+                    int(result["degree"]),
+                    float(result["train_score"]),
+                    to_blob(result["test_errors"]),
+                    to_blob(result["predictions"]),
+                    to_blob(result.get("coefficients")),
+                    result.get("center"),
+                    result.get("scale"),
+                    now,
+                )
+                for key, result in results.items()
+            ],
+        )
+        connection.execute(
+            "DELETE FROM models WHERE key NOT IN (SELECT key FROM models ORDER BY last_used DESC LIMIT ?)",
+            [self.__max_entries],
+        )
+        connection.commit()
+
+    def __len__(self):
+        return self.connection().execute("SELECT COUNT(*) FROM models").fetchone()[0]
+
+    def close(self):
+        """
+        Closes the connection to the database.
+        :return:
+        """
+        if self.__connection is not None:
+            self.__connection.close()
+            self.__connection = None
@@ -1,8 +1,115 @@
+import logging
 import numpy as np
 
-from sklearn.linear_model import LinearRegression
-from sklearn.preprocessing import PolynomialFeatures
-from sklearn.model_selection import KFold
+from damagedlogginganalyzer.Profiler import Profiler
+
+_logger = logging.getLogger(__name__)
+
+# Strategies to search the best degree: grid evaluates all degrees, pruned skips the degrees, which are
+# underdetermined by a training fold, and stops once the validation error did not improve for a number of degrees
+DEGREE_SEARCHES = ["grid", "pruned"]
+
+# Minimum number of folds with a validation score, i.e. with at least 2 validation samples, to select a degree
+MIN_SCORED_FOLDS = 2
+
+# Singular values below this fraction of the largest one are treated as zero by the least squares solver, the cutoff of
+# scipy.linalg.lstsq, which sklearn.linear_model.LinearRegression uses
+RCOND = np.finfo(float).eps
+
+
+class PolynomialModel:
+    """
+    This class represents polynomial regression models fitted by the numpy and incremental engines of the Oracle.
+    The numpy engine fits the powers of the raw features like sklearn (center 0, scale 1), the incremental engine
+    stores its polynomials in a centered and scaled basis, so that high degrees stay well-conditioned.
+    """
+
+    def __init__(self, coefficients, center=0.0, scale=1.0):
+        self.coefficients = coefficients
+        self.center = center
+        self.scale = scale
+
+    @property
+    def degree(self):
+        return self.coefficients.shape[0] - 1
+
+    def predict(self, x):
+        """
+        Predicts the labels for the given features.
+        :param x: Features, array of shape (n_samples, 1)
+        :return: Labels of shape (n_samples,) or (n_samples, n_series) for a model fitted on several series
+        """
+        return vandermonde(x, self.center, self.scale, self.degree) @ self.coefficients
+
+
+def vandermonde(x, center, scale, degree):
+    """
+    Builds the Vandermonde matrix [1, t, ..., t^degree] of the centered and scaled features t = (x - center) / scale.
+    :param x: Features, array of shape (n_samples, 1)
+    :param center: Center of the features
+    :param scale: Scale of the features
+    :param degree: Maximum degree
+    :return:
+    """
+    t = (np.asarray(x, dtype=float).ravel() - center) / scale
+    return np.vander(t, degree + 1, increasing=True)
+
+
+def evaluate_polynomials(basis, coefficients):
+    """
+    Evaluates polynomials at the features of a Vandermonde matrix. The powers are added one after another, a matrix
+    multiplication would round the predictions of a series differently depending on the number of series.
+    :param basis: Vandermonde matrix of shape (n_samples, n_powers)
+    :param coefficients: Coefficients of shape (..., n_powers, n_series)
+    :return: Predictions of shape (..., n_samples, n_series)
+    """
+    predictions = np.zeros(coefficients.shape[:-2] + (basis.shape[0], coefficients.shape[-1]))
+    for power in range(basis.shape[1]):
+        predictions += basis[:, power, None] * coefficients[..., power, None, :]
+    return predictions
+
+
+def r2_scores(y, predictions, masks):
+    """
+    Calculates the R² score (1 is best) like sklearn.metrics.r2_score for each selection of samples in masks.
+    :param y: Labels, array of shape (n_samples, n_series)
+    :param predictions: Predictions, array of shape (..., n_masks, n_samples, n_series)
+    :param masks: Boolean array of shape (n_masks, n_samples) selecting the samples of each score
+    :return: Scores of shape (..., n_masks, n_series)
+    """
+    # The samples are the last axis of contiguous arrays, so that numpy sums the samples of each series in the same
+    # order, whatever the number of series
+    y = np.ascontiguousarray(np.asarray(y, dtype=float).T)
+    predictions = np.ascontiguousarray(np.swapaxes(predictions, -1, -2))
+    weights = masks[:, None, :].astype(float)
+    counts = weights.sum(axis=2)
+    y_mean = (weights * y).sum(axis=2) / counts
+    numerator = (weights * (y - predictions) ** 2).sum(axis=-1)
+    denominator = (weights * (y - y_mean[:, :, None]) ** 2).sum(axis=2)
+
+    # Constant labels score 1 for perfect predictions and 0 otherwise, as sklearn does
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scores = np.where(denominator != 0, 1 - numerator / denominator, np.where(numerator != 0, 0.0, 1.0))
+    return np.where(counts < 2, np.nan, scores)
+
+
+def validation_errors(test_scores, axis):
+    """
+    Averages the validation scores of the folds to the validation error abs(mean(scores)). Folds with less than 2
+    validation samples have no score (NaN) and are left out, the error is NaN, if less than MIN_SCORED_FOLDS folds
+    have a score.
+    :param test_scores: Validation scores of the folds
+    :param axis: Axis of the folds
+    :return:
+    """
+    # The folds are the last axis of a contiguous array, so that numpy sums the folds of each series in the same order,
+    # whatever the number of series
+    test_scores = np.ascontiguousarray(np.moveaxis(test_scores, axis, -1))
+    scored = ~np.isnan(test_scores)
+    n_scored = scored.sum(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        errors = np.abs(np.where(scored, test_scores, 0.0).sum(axis=-1) / n_scored)
+    return np.where(n_scored < MIN_SCORED_FOLDS, np.nan, errors)
 
 
 class Oracle:
@@ -10,48 +117,368 @@ class Oracle:
     This class provides methods to perform k-fold cross validation to find the best degree for the polynomial regression
     """
 
-    def __init__(self):
-        self.k_splits = 9
+    def __init__(self, engine="numpy", profiler=None, k_splits=9, degrees=None, search="grid", patience=2):
+        """
+        :param engine: Engine of the cross validation
+        :param profiler: Profiler, which records the stages
+        :param k_splits: Number of folds
+        :param degrees: Degrees to search, 1 to 14 by default
+        :param search: Strategy to search the best degree, see DEGREE_SEARCHES
+        :param patience: Number of degrees without a lower validation error, after which the pruned search stops
+        """
+        if search not in DEGREE_SEARCHES:
+            raise ValueError(f"Unknown degree search {search}, choose one of {', '.join(DEGREE_SEARCHES)}!")
+        if k_splits < 2:
+            raise ValueError(f"The cross validation needs at least 2 folds, not {k_splits}!")
+        self.k_splits = k_splits
+        self.degrees = list(range(1, 15)) if degrees is None else sorted(set(degrees))
+        self.search = search
+        self.patience = patience
+        self.engine = engine
+        self.profiler = profiler or Profiler()
+        self.results = []
+        self.__factorizations = {}
+        self.__ranks = {}
+
+    def k_fold_masks(self, n_samples):
+        """
+        Calculates the training masks of the k folds, the folds are equal to the ones of
+        sklearn.model_selection.KFold(n_splits=self.k_splits, shuffle=True, random_state=0).
+        :param n_samples: Number of samples
+        :return: Boolean array of shape (k_splits, n_samples), which is True for the training samples of each fold
+        """
+        indices = np.arange(n_samples)
+        np.random.RandomState(0).shuffle(indices)
+
+        fold_sizes = np.full(self.k_splits, n_samples // self.k_splits)
+        fold_sizes[: n_samples % self.k_splits] += 1
 
-    def k_fold_cross_validation(self, x, y):
+        train_masks = np.ones((self.k_splits, n_samples), dtype=bool)
+        start = 0
+        for fold, fold_size in enumerate(fold_sizes):
+            train_masks[fold, indices[start : start + fold_size]] = False
+            start += fold_size
+        return train_masks
+
+    def factorize(self, x):
+        """
+        Calculates the x-side of the least squares problems of all degrees and folds. The design matrix contains the
+        powers of the raw features like sklearn.preprocessing.PolynomialFeatures, the training designs are centered
+        with their column means like sklearn.linear_model.LinearRegression does. The result only depends on x, the
+        degrees and the number of splits, so it is calculated once and shared by all series with the same x.
+        :param x: Features, array of shape (n_samples, 1)
+        :return: Design matrix of shape (n_samples, max_degree + 1), the training masks of shape
+            (k_splits + 1, n_samples) and the column means of the training designs of shape
+            (k_splits + 1, max_degree + 1)
+        """
+        x = np.asarray(x, dtype=float).ravel()
+        key = (x.tobytes(), tuple(self.degrees), self.k_splits)
+        if key in self.__factorizations:
+            return self.__factorizations[key]
+
+        with self.profiler.stage("factorize"):
+            basis = vandermonde(x, 0.0, 1.0, max(self.degrees))
+            # The last fold contains all samples and is used to fit the final models
+            train_masks = np.vstack([self.k_fold_masks(len(x)), np.ones(len(x), dtype=bool)])
+            offsets = np.array([basis[train_mask].mean(axis=0) for train_mask in train_masks])
+
+        self.__factorizations[key] = basis, train_masks, offsets
+        return self.__factorizations[key]
+
+    def fit_degree(self, x, y, degree):
+        """
+        Fits the polynomial regression models of one degree for all folds and series. Each series is solved like
+        sklearn.linear_model.LinearRegression does, a solve with several right-hand sides would round the result of a
+        series differently depending on the other series of the batch.
+        :param x: Features, array of shape (n_samples, 1)
+        :param y: Labels, array of shape (n_samples, n_series)
+        :param degree: Degree of the polynomials
+        :return: Coefficients of the powers of the features of shape (k_splits + 1, max_degree + 1, n_series), the
+            intercept is the coefficient of the power 0 and the coefficients above the degree are zero
+        """
+        basis, train_masks, offsets = self.factorize(x)
+        coefficients = np.zeros((len(train_masks), basis.shape[1], y.shape[1]))
+        for fold, (train_mask, offset) in enumerate(zip(train_masks, offsets)):
+            offset = offset[: degree + 1]
+            design = basis[train_mask, : degree + 1] - offset
+            for series, y_train in enumerate(y[train_mask].T):
+                y_offset = y_train.mean()
+                series_coefficients = np.linalg.lstsq(design, y_train - y_offset, rcond=RCOND)[0]
+                coefficients[fold, : degree + 1, series] = series_coefficients
+                coefficients[fold, 0, series] += y_offset - offset @ series_coefficients
+        return coefficients
+
+    def select_degrees(self, x, y):
+        """
+        Performs k-fold cross validation for many series with the same features at once. The pruned search skips the
+        degrees, which are underdetermined by a training fold, and stops the search of a series once its validation
+        error did not improve for patience consecutive degrees. The errors, scores and coefficients of the skipped
+        degrees are NaN.
+        :param x: Features, array of shape (n_samples, 1)
+        :param y: Labels, array of shape (n_samples, n_series)
+        :return: Index of the best degree of shape (n_series,), average validation errors of shape
+            (n_degrees, n_series), training scores of the final models of shape (n_degrees, n_series) and the
+            coefficients of the powers of the features of shape (n_degrees, max_degree + 1, n_series)
+        """
+        basis, train_masks, _ = self.factorize(x)
+        y = np.asarray(y, dtype=float)
+        n_series = y.shape[1]
+        a_test_errors = np.full((len(self.degrees), n_series), np.nan)
+        train_scores = np.full((len(self.degrees), n_series), np.nan)
+        coefficients = np.full((len(self.degrees), basis.shape[1], n_series), np.nan)
+
+        degree_indices = range(len(self.degrees))
+        if self.search == "pruned":
+            # Higher degrees have more columns, so they are underdetermined as well
+            degree_indices = np.flatnonzero(np.logical_and.accumulate(self.full_rank_degrees(x)))
+
+        with self.profiler.stage("select_degrees"):
+            active = np.arange(n_series)
+            best_errors = np.full(n_series, np.inf)
+            rises = np.zeros(n_series, dtype=int)
+            for degree_idx in degree_indices:
+                y_active = y[:, active]
+                fold_coefficients = self.fit_degree(x, y_active, self.degrees[degree_idx])
+                predictions = evaluate_polynomials(basis, fold_coefficients)
+                train_scores[degree_idx, active] = r2_scores(y_active, predictions[-1:], train_masks[-1:])[0]
+                test_scores = r2_scores(y_active, predictions[:-1], ~train_masks[:-1])
+                a_test_errors[degree_idx, active] = validation_errors(test_scores, axis=0)
+                coefficients[degree_idx, :, active] = fold_coefficients[-1].T
+
+                if self.search == "pruned":
+                    best_errors[active], rises[active], searching = self.continue_search(
+                        a_test_errors[degree_idx, active], best_errors[active], rises[active]
+                    )
+                    active = active[searching]
+                    if len(active) == 0:
+                        break
+
+        best_idx = self.best_degree_indices(a_test_errors)
+        return best_idx, a_test_errors, train_scores, coefficients
+
+    def full_rank_degrees(self, x):
+        """
+        Checks for each degree, whether the training samples of all folds determine its polynomial, i.e. the raw
+        training design matrices have full column rank. The result only depends on x, so it is calculated once for
+        each x.
+        :param x: Features, array of shape (n_samples, 1)
+        :return: Boolean array of shape (n_degrees,)
+        """
+        key = np.asarray(x, dtype=float).tobytes(), tuple(self.degrees), self.k_splits
+        if key not in self.__ranks:
+            basis, train_masks, _ = self.factorize(x)
+            self.__ranks[key] = np.array(
+                [
+                    all(
+                        np.linalg.matrix_rank(basis[train_mask, : degree + 1]) == degree + 1
+                        for train_mask in train_masks[:-1]
+                    )
+                    for degree in self.degrees
+                ]
+            )
+        return self.__ranks[key]
+
+    def continue_search(self, errors, best_errors, rises):
+        """
+        Updates the state of the pruned search with the validation errors of the next degree.
+        :param errors: Validation errors of the degree
+        :param best_errors: Lowest validation errors of the lower degrees
+        :param rises: Number of consecutive degrees without a lower validation error
+        :return: Updated best errors and rises, and which series continue the search
+        """
+        improved = errors < best_errors
+        best_errors = np.where(improved, errors, best_errors)
+        rises = np.where(improved, 0, rises + 1)
+        return best_errors, rises, rises < self.patience
+
+    def scored_folds(self, present):
+        """
+        Returns the number of folds with at least 2 validation samples, which have a validation score.
+        :param present: Boolean array of shape (n_samples,), which is True for the samples with a value
+        :return:
+        """
+        if self.engine == "incremental":
+            # The incremental engine assigns the samples to the folds by their position
+            fold_sizes = np.bincount(np.flatnonzero(present) % self.k_splits, minlength=self.k_splits)
+        else:
+            n_samples = np.count_nonzero(present)
+            fold_sizes = np.full(self.k_splits, n_samples // self.k_splits)
+            fold_sizes[: n_samples % self.k_splits] += 1
+        return int(np.count_nonzero(fold_sizes >= 2))
+
+    def can_cross_validate(self, present):
+        """
+        Checks, whether the samples of a series are enough to select its degree, i.e. at least MIN_SCORED_FOLDS folds
+        have a validation score.
+        :param present: Boolean array of shape (n_samples,), which is True for the samples with a value
+        :return:
+        """
+        return self.scored_folds(present) >= MIN_SCORED_FOLDS
+
+    def best_degree_indices(self, a_test_errors):
+        """
+        Returns the index of the degree with the lowest validation error, degrees without a validation error (NaN),
+        e.g. skipped by the pruned search, are ignored.
+        :param a_test_errors: Average validation errors of shape (n_degrees, ...)
+        :return:
+        """
+        a_test_errors = np.asarray(a_test_errors, dtype=float)
+        if np.isnan(a_test_errors).all(axis=0).any():
+            raise ValueError(
+                f"Can not select a degree, less than {MIN_SCORED_FOLDS} of the {self.k_splits} folds have 2 "
+                "validation values!"
+            )
+        return np.argmin(np.where(np.isnan(a_test_errors), np.inf, a_test_errors), axis=0)
+
+    def k_fold_cross_validation(self, x, y, key=None):
         """
         Performs k-fold cross validation to find the best degree for the polynomial regression model.
         :param x: Features
         :param y: Labels
+        :param key: Dictionary with the columns, which identify the series in the results table
         :return:
         """
-        degrees = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14]
+        if self.engine == "sklearn":
+            return self.sklearn_k_fold_cross_validation(x, y, key)
 
-        kf = KFold(n_splits=self.k_splits, shuffle=True, random_state=0)
-        a_train_errors = []
-        a_test_errors = []
-        for degree in degrees:
-            train_scores = []
-            test_scores = []
-            for train_index, val_index in kf.split(x):
-                x_train, x_test = x[train_index], x[val_index]
-                y_train, y_test = y[train_index], y[val_index]
+        best_idx, a_test_errors, train_scores, coefficients = self.select_degrees(
+            x, np.asarray(y, dtype=float).reshape(-1, 1)
+        )
+        best_idx = int(best_idx[0])
+        best_degree = self.degrees[best_idx]
+        best_model = PolynomialModel(coefficients[best_idx, : best_degree + 1, 0])
+        train_score = train_scores[best_idx, 0]
+        self.record_selection(a_test_errors[:, 0], best_idx, train_score, key)
+        return best_model, best_degree, train_score
 
-                model, train_score, test_score = self.polynomial_regression(x_train, y_train, x_test, y_test, degree)
+    def record_selection(self, test_errors, best_idx, train_score, key=None):
+        """
+        Logs the result of the k-fold cross validation and adds it to the results table.
+        :param test_errors: Average validation errors of all degrees
+        :param best_idx: Index of the best degree
+        :param train_score: Training score of the best model
+        :param key: Dictionary with the columns, which identify the series in the results table
+        :return: Row of the results table
+        """
+        _logger.info(
+            "Minimum value: %s at index %s\nBest degree: %s\nTrain R² score (1 is best) for the best model: %s\n",
+            test_errors[best_idx],
+            best_idx,
+            self.degrees[best_idx],
+            train_score,
+        )
+        row = dict(key or {})
+        row["best_degree"] = self.degrees[best_idx]
+        row["train_r2"] = float(train_score)
+        row.update({f"cv_error_degree_{degree}": float(error) for degree, error in zip(self.degrees, test_errors)})
+        if self.search != "grid":
+            skipped = [str(degree) for degree, error in zip(self.degrees, test_errors) if np.isnan(error)]
+            _logger.info("Skipped degrees: %s", ", ".join(skipped) or "none")
+            row["skipped_degrees"] = " ".join(skipped)
+        self.results.append(row)
+        return row
 
-                train_scores.append(train_score)
-                test_scores.append(test_score)
+    def write_results(self, file_path):
+        """
+        Writes the results table of all cross validations as CSV or, if the file ends with .json, as JSON file.
+        :param file_path: Path of the file
+        :return:
+        """
+        import pandas as pd
 
-            # Calculate average training and validation scores
-            avg_train_score = np.abs(np.mean(train_scores))
-            avg_val_score = np.abs(np.mean(test_scores))
+        from damagedlogginganalyzer.CSVAnalyzer import write_table
 
-            a_train_errors.append(avg_train_score)
-            a_test_errors.append(avg_val_score)
+        write_table(pd.DataFrame(self.results), file_path)
 
-        minimum_value = np.min(a_test_errors)
-        best_degree = degrees[a_test_errors.index(minimum_value)]
-        print(f"Minimum value: {minimum_value} at index {a_test_errors.index(minimum_value)}")
-        print(f"Best degree: {best_degree}")
+    def sklearn_k_fold_cross_validation(self, x, y, key=None):
+        """
+        Performs k-fold cross validation to find the best degree for the polynomial regression model by fitting
+        one sklearn model for each degree and fold. This is the reference for the numpy engine.
+        :param x: Features
+        :param y: Labels
+        :param key: Dictionary with the columns, which identify the series in the results table
+        :return:
+        """
+        best_model, best_idx, a_test_errors, train_score = self.sklearn_select_degree(x, y)
+        self.record_selection(a_test_errors, best_idx, train_score, key)
+        return best_model, self.degrees[best_idx], train_score
 
-        best_model, train_score, _ = self.polynomial_regression(x, y, [], [], best_degree)
-        print(f"Train R² score (1 is best) for the best model: {train_score}\n")
-        return best_model, best_degree, train_score
+    def sklearn_select_degree(self, x, y):
+        """
+        Selects the best degree with sklearn models and fits its model on all samples.
+        :param x: Features
+        :param y: Labels
+        :return: The best model, index of its degree, average validation errors of all degrees and the training score
+        """
+        best_idx, a_test_errors, models, train_scores = self.sklearn_select_degrees(x, np.reshape(y, (-1, 1)))
+        return models[0], int(best_idx[0]), a_test_errors[:, 0], train_scores[0]
+
+    def sklearn_select_degrees(self, x, y):
+        """
+        Selects the best degree of many series with the same features with sklearn models and fits their models on all
+        samples. The folds and the polynomial features of each degree are built once and shared by all series, one
+        model is fitted for each degree, fold and series.
+        :param x: Features, array of shape (n_samples, 1)
+        :param y: Labels, array of shape (n_samples, n_series)
+        :return: Index of the best degree of shape (n_series,), average validation errors of shape
+            (n_degrees, n_series), the best model and its training score of each series
+        """
+        # sklearn is only imported for this engine, it takes longer to import than the numpy engine needs to run
+        from sklearn.linear_model import LinearRegression
+        from sklearn.model_selection import KFold
+        from sklearn.pipeline import Pipeline
+        from sklearn.preprocessing import PolynomialFeatures
+
+        y = np.asarray(y, dtype=float)
+        n_series = y.shape[1]
+        folds = list(KFold(n_splits=self.k_splits, shuffle=True, random_state=0).split(x))
+        designs = {}
+        a_test_errors = np.full((len(self.degrees), n_series), np.nan)
+
+        active = np.arange(n_series)
+        best_errors = np.full(n_series, np.inf)
+        rises = np.zeros(n_series, dtype=int)
+        for degree_idx, degree in enumerate(self.degrees):
+            # The features are not scaled, so high degrees lose the numerical rank long before the training samples
+            # run out. Higher degrees have more columns, so they are underdetermined as well
+            if self.search == "pruned" and (
+                len(active) == 0
+                or not all(
+                    np.linalg.matrix_rank(np.vander(x[train_index].ravel(), degree + 1)) == degree + 1
+                    for train_index, _ in folds
+                )
+            ):
+                break
+
+            poly_features = PolynomialFeatures(degree=degree)
+            x_poly = poly_features.fit_transform(x)
+            designs[degree] = poly_features, x_poly
+            test_scores = np.full((len(folds), len(active)), np.nan)
+            with self.profiler.stage(f"fit_degree_{degree}"):
+                for fold, (train_index, val_index) in enumerate(folds):
+                    for idx, series in enumerate(active):
+                        model = LinearRegression().fit(x_poly[train_index], y[train_index, series])
+                        # The R² score of less than 2 validation samples is not defined
+                        if len(val_index) >= 2:
+                            test_scores[fold, idx] = model.score(x_poly[val_index], y[val_index, series])
+
+            # Calculate average validation scores
+            a_test_errors[degree_idx, active] = validation_errors(test_scores, axis=0)
+            if self.search == "pruned":
+                best_errors[active], rises[active], searching = self.continue_search(
+                    a_test_errors[degree_idx, active], best_errors[active], rises[active]
+                )
+                active = active[searching]
+
+        best_idx = self.best_degree_indices(a_test_errors)
+        best_models = []
+        train_scores = []
+        for series, degree_idx in enumerate(best_idx):
+            poly_features, x_poly = designs[self.degrees[degree_idx]]
+            model = LinearRegression().fit(x_poly, y[:, series])
+            best_models.append(Pipeline([("poly", poly_features), ("linear", model)]))
+            train_scores.append(model.score(x_poly, y[:, series]))
+        return best_idx, a_test_errors, best_models, np.array(train_scores)
 
     @staticmethod
     def polynomial_regression(x_train, y_train, x_test, y_test, degree):
@@ -64,6 +491,9 @@ class Oracle:
         :param degree: Degree of the polynomial
         :return:
         """
+        from sklearn.linear_model import LinearRegression
+        from sklearn.preprocessing import PolynomialFeatures
+
         poly_features = PolynomialFeatures(degree=degree)
         x_train_poly = poly_features.fit_transform(x_train)
         x_test_poly = poly_features.transform(x_test) if len(y_test) > 0 else None
@@ -0,0 +1,112 @@
+import logging
+import queue
+import threading
+import time
+
+from pathlib import Path
+
+_logger = logging.getLogger(__name__)
+
+# Marks the end of the queue for a writer thread
+STOP = None
+
+# Default maximum number of rendered plots in the queue, e.g. about 10 MB of PNG plots
+QUEUE_SIZE = 64
+
+
+class PlotWriter:
+    """
+    This class writes rendered plots to files in background threads, so that the rendering of the next plots and the
+    model fits continue while slow storage, e.g. a network file system, writes the previous plots.
+    The plots are handed over as bytes through a bounded queue. If the writers fall behind, write() blocks until there
+    is room in the queue, so the buffered plots never need more memory than queue_size plots. Errors of the writer
+    threads are collected and returned by wait().
+    """
+
+    def __init__(self, threads=1, queue_size=QUEUE_SIZE):
+        """
+        :param threads: Number of writer threads, 0 writes each plot at once in the calling thread
+        :param queue_size: Maximum number of plots in the queue
+        """
+        self.__threads = []
+        self.__n_threads = threads
+        self.__queue = queue.Queue(queue_size)
+        self.__lock = threading.Lock()
+        self.__errors = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, file_path, data):
+        """
+        Writes the bytes of a plot to its file, the directory is created if it does not exist.
+        :param file_path: Path of the file
+        :param data: Bytes of the plot
+        :return: Seconds the call waited for room in the queue
+        """
+        if self.__n_threads == 0:
+            self.write_file(Path(file_path), data)
+            return 0.0
+
+        if not self.__threads:
+            self.__threads = [
+                threading.Thread(target=self.__run, name=f"PlotWriter-{idx}", daemon=True)
+                for idx in range(self.__n_threads)
+            ]
+            for thread in self.__threads:
+                thread.start()
+
+        start = time.perf_counter()
+        self.__queue.put((Path(file_path), data))
+        return time.perf_counter() - start
+
+    @staticmethod
+    def write_file(file_path, data):
+        """
+        Writes the bytes of a plot to its file.
+        :param file_path: Path of the file
+        :param data: Bytes of the plot
+        :return:
+        """
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_bytes(data)
+
+    def __run(self):
+        while True:
+            item = self.__queue.get()
+            try:
+                if item is STOP:
+                    return
+                self.write_file(*item)
+            except Exception as error:
+                _logger.debug("Writing %s failed: %s", item[0], error)
+                with self.__lock:
+                    self.__errors.append((item[0], error))
+            finally:
+                self.__queue.task_done()
+
+    def wait(self):
+        """
+        Waits until all queued plots are written.
+        :return: Path and error of each plot, which could not be written since the last call
+        """
+        self.__queue.join()
+        with self.__lock:
+            errors, self.__errors = self.__errors, []
+        return errors
+
+    def close(self):
+        """
+        Waits for all queued plots and stops the writer threads.
+        :return: See wait
+        """
+        errors = self.wait()
+        for _ in self.__threads:
+            self.__queue.put(STOP)
+        for thread in self.__threads:
+            thread.join()
+        self.__threads = []
+        return errors
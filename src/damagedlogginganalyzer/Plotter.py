@@ -1,16 +1,294 @@
-import matplotlib.pyplot as plt
+import functools
+import hashlib
+import io
+import json
+import matplotlib
+import numpy as np
+import time
 
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
 from pathlib import Path
 
+from damagedlogginganalyzer.PlotWriter import QUEUE_SIZE, PlotWriter
+from damagedlogginganalyzer.Profiler import Profiler
+
+# Increase when the drawing code changes, so that all plots are rendered again by incremental runs
+STYLE_VERSION = 2
+
+# Maximum number of figure templates per process, there is one template per kind of plot and labels of its legend
+TEMPLATE_CACHE_SIZE = 32
+
+# Resolution of the thumbnails, e.g. 350x300 pixels instead of 1400x1200 for the plots of each combination
+THUMBNAIL_DPI = 25
+
+# File name and savefig arguments of each plot for the outputs, which write one file per plot
+PLOT_OUTPUTS = {
+    "png": ("plot.png", {}),
+    "svg": ("plot.svg", {}),
+    "pdf": ("plot.pdf", {}),
+    "thumbnail": ("thumbnail.png", {"dpi": THUMBNAIL_DPI}),
+}
+
+# The output "multipage" writes all plots of one kind as pages of one PDF
+OUTPUTS = list(PLOT_OUTPUTS) + ["multipage"]
+
+
+def savefig_options(output, dpi=None, png_compression=None):
+    """
+    Returns the savefig arguments of the plots of an output.
+    :param output: Output, see OUTPUTS
+    :param dpi: Resolution of the plots, None keeps the default of matplotlib, thumbnails keep THUMBNAIL_DPI
+    :param png_compression: zlib compression level of PNG files from 0 (none, fastest) to 9 (smallest), None keeps
+        the default of Pillow
+    :return:
+    """
+    kwargs = dict(PLOT_OUTPUTS.get(output, (None, {}))[1])
+    if dpi is not None and output != "thumbnail":
+        kwargs["dpi"] = dpi
+    if png_compression is not None and output in ("png", "thumbnail"):
+        kwargs["pil_kwargs"] = {"compress_level": png_compression}
+    return kwargs
+
+
+def hash_plot_inputs(*inputs):
+    """
+    Calculates a content hash of the inputs of a plot.
+    :param inputs: Arrays, dictionaries, sequences, functions or scalars the plot is drawn from
+    :return: Hex digest of the hash
+    """
+    digest = hashlib.sha256(f"{STYLE_VERSION} {matplotlib.__version__}".encode())
+
+    def update(value):
+        if isinstance(value, np.ndarray):
+            digest.update(f"array {value.dtype} {value.shape}".encode())
+            digest.update(np.ascontiguousarray(value).tobytes())
+        elif isinstance(value, dict):
+            digest.update(b"dict")
+            for key, item in value.items():
+                update(key)
+                update(item)
+        elif isinstance(value, (list, tuple)):
+            digest.update(f"sequence {len(value)}".encode())
+            for item in value:
+                update(item)
+        elif callable(value):
+            digest.update(f"function {value.__module__}.{value.__qualname__}".encode())
+        else:
+            digest.update(f"{type(value).__name__} {value!r}".encode())
+
+    for plot_input in inputs:
+        update(plot_input)
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def figure_template(kind, figsize, labels=()):
+    """
+    Builds the figure of a kind of plot once with empty artists, so that later plots of the kind only update the data
+    and the texts of the artists instead of building and laying out a new figure. The templates are cached per
+    process.
+    :param kind: Kind of the plot, "temporal_dependencies", "temporal_dependencies_dict" or "predictions"
+    :param figsize: Size of the figure
+    :param labels: Labels of the lines of "temporal_dependencies_dict"
+    :return: Dictionary with the figure, axes, lines and text of the plot and whether the layout is done
+    """
+    figure = Figure(figsize=figsize)
+    FigureCanvasAgg(figure)
+    template = {"figure": figure, "text": None, "laid_out": False}
+
+    if kind == "temporal_dependencies":
+        template["axes"] = axes = figure.add_subplot()
+        template["lines"] = axes.plot([], [], marker="o", linestyle="-")
+    elif kind == "temporal_dependencies_dict":
+        template["axes"] = axes = figure.add_subplot()
+        color_map = matplotlib.colormaps["tab10"].resampled(len(labels))  # Use a colormap with enough colors
+        template["lines"] = [axes.plot([], [], label=label, color=color_map(i))[0] for i, label in enumerate(labels)]
+        axes.legend(title="Categories", bbox_to_anchor=(1.05, 1), loc="upper left")
+    elif kind == "predictions":
+        template["axes"] = axes = figure.add_subplot(2, 1, 1)
+        template["lines"] = axes.plot([], [], ".r", markersize=8, label="Samples") + axes.plot(
+            [], [], linewidth=5, color="tab:blue", label="Model"
+        )
+        template["text"] = axes.text(0, 0, "", fontsize=22, color="magenta")
+    else:
+        raise ValueError(f"Unknown kind of plot {kind!r}")
+    return template
+
+
+def update_template(template, x, series):
+    """
+    Sets the data of the lines of a template and rescales its axes to the data.
+    :param template: Template of figure_template
+    :param x: X-axis of the plot
+    :param series: Y values of each line
+    :return: Figure and axes of the plot
+    """
+    for line, y in zip(template["lines"], series):
+        line.set_data(x, y)
+    template["axes"].relim()
+    template["axes"].autoscale_view()
+    return template["figure"], template["axes"]
+
+
+def draw_temporal_dependencies(x, amounts):
+    """
+    Draws the temporal dependencies for a specific species, reason and origin.
+    :param x: X-axis of the plot
+    :param amounts: Amounts of damaged wood
+    :return: Figure and axes of the plot
+    """
+    return update_template(figure_template("temporal_dependencies", (14, 12)), x, [amounts])
+
+
+def draw_temporal_dependencies_dict(x, species_dict, figsize):
+    """
+    Draws the temporal dependencies of all series in a dictionary into one plot.
+    :param x: X-axis of the plot
+    :param species_dict: Dictionary with the labels and their data points
+    :param figsize: Size of the figure
+    :return: Figure and axes of the plot
+    """
+    template = figure_template("temporal_dependencies_dict", figsize, tuple(species_dict))
+    figure, axes = update_template(template, x, species_dict.values())
+    axes.grid(True)
+    # The layout is calculated once for the labels of the legend
+    if not template["laid_out"]:
+        figure.tight_layout(rect=[0.05, 0.05, 0.95, 0.95])
+        template["laid_out"] = True
+    return figure, axes
+
+
+def draw_predictions(x, y, x_predict, train_score, value_2024, degree):
+    """
+    Draws the samples and the predicted function.
+    :param x: X-axis of the plot
+    :param y: Y values
+    :param x_predict: Predicted X values
+    :param train_score: Training score
+    :param value_2024: Value in 2024
+    :param degree: Degree of the polynomial
+    :return: Figure and axes of the plot
+    """
+    template = figure_template("predictions", (10, 10))
+    figure, axes = update_template(template, x, [y, x_predict])
+    template["text"].set_position((x[0], -np.nanmax(y)))
+    template["text"].set_text(
+        f"Polynomial Regression\nBest Degree (1 is best): {degree}\nModel: Training R² Error: "
+        f"{train_score:.2f}\nPrediction 2024 {value_2024}"
+    )
+    return figure, axes
+
+
+def draw_temporal_plot(draw, data, species, reason, origin):
+    """
+    Draws a temporal plot and adds labels, title and grid.
+    Only the object-oriented matplotlib API is used, so plots can be rendered in parallel processes.
+    :param draw: Function, which draws the plot from data and returns its figure and axes
+    :param data: Arguments of draw
+    :param species: Species of the tree
+    :param reason: Reason for the damage
+    :param origin: Origin/ owner of the tree
+    :return: Figure of the plot
+    """
+    figure, axes = draw(*data)
+
+    axes.set_xlabel("Jahr")
+    axes.set_ylabel(f"Anzahl an toten {species} durch {reason} besitzt bei {origin} (1000 cbm)")
+    axes.set_title(f"Anzahl an toten {species} durch {reason} besitzt bei {origin} über die Jahre")
+
+    axes.grid(True)
+    return figure
+
+
+def render_temporal_plot(draw, data, species, reason, origin, file_path, savefig_kwargs=None, writer=None):
+    """
+    Renders a temporal plot by drawing it and saving it. With a writer, the plot is saved to memory and the writer
+    writes it to the file in the background.
+    :param draw: Function, which draws the plot from data and returns its figure and axes
+    :param data: Arguments of draw
+    :param species: Species of the tree
+    :param reason: Reason for the damage
+    :param origin: Origin/ owner of the tree
+    :param file_path: Path of the saved plot or PdfPages, to which the plot is added as page
+    :param savefig_kwargs: Further arguments of savefig, e.g. the dpi
+    :param writer: PlotWriter, which writes the saved plot, None saves the plot directly to the file
+    :return: Wall and CPU time in seconds of drawing the figure, of saving it and of waiting for room in the queue of
+        the writer
+    """
+    start = time.perf_counter(), time.process_time()
+    figure = draw_temporal_plot(draw, data, species, reason, origin)
+    drawn = time.perf_counter(), time.process_time()
+
+    buffer = None
+    if isinstance(file_path, PdfPages):
+        file_path.savefig(figure, **(savefig_kwargs or {}))
+    elif writer is not None:
+        buffer = io.BytesIO()
+        figure.savefig(buffer, format=file_path.suffix[1:], **(savefig_kwargs or {}))
+    else:
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        figure.savefig(file_path, **(savefig_kwargs or {}))
+    saved = time.perf_counter(), time.process_time()
+    timings = {
+        "figure": (drawn[0] - start[0], drawn[1] - start[1]),
+        "savefig": (saved[0] - drawn[0], saved[1] - drawn[1]),
+    }
+    if buffer is not None:
+        timings["write_queue"] = (writer.write(file_path, buffer.getvalue()), 0.0)
+    return timings
+
 
 class Plotter:
     """
     This class provides methods to plot the wood data.
+    The plots are saved as one file per plot in the format of the output, see PLOT_OUTPUTS, or with the output
+    "multipage" as pages of one PDF per kind of plot, e.g. output_directory/all_owners.pdf.
+    With one job, the plots are rendered to memory and written to their files by the threads of a PlotWriter, errors
+    of the writers are raised by wait().
     """
 
-    def __init__(self, out_dir):
+    def __init__(
+        self,
+        out_dir,
+        jobs=1,
+        rebuild=False,
+        profiler=None,
+        output="png",
+        writers=1,
+        queue_size=QUEUE_SIZE,
+        png_compression=None,
+        dpi=None,
+    ):
+        if output not in OUTPUTS:
+            raise ValueError(f"Unknown output {output!r}, expected one of {OUTPUTS}")
         self.__out_dir = Path(out_dir)
+        self.__output = output
+        self.__savefig_kwargs = savefig_options(output, dpi, png_compression)
+        # Only changed options are hashed, so that the plots of the default options are not rendered again
+        self.__options = {name: value for name, value in [("dpi", dpi), ("png", png_compression)] if value is not None}
+        self.__writer = PlotWriter(writers, queue_size)
+        self.__documents = {}
+        self.__profiler = profiler or Profiler()
         self.__x = []
+        self.__jobs = jobs
+        self.__pool = None
+        self.__futures = []
+
+        # The manifest maps each plot to the hash of its inputs, unchanged plots are skipped unless rebuild is set
+        self.__rebuild = rebuild
+        self.__manifest_path = self.__out_dir / "manifest.json"
+        self.__manifest = json.loads(self.__manifest_path.read_text()) if self.__manifest_path.exists() else {}
+        self.__visited = set()
+        self.__kinds = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close(prune=exc_type is None)
 
     def set_x_axis(self, x):
         """
@@ -36,28 +314,144 @@ class Plotter:
         origin = origin.replace(" ", "_")
         return species, reason, origin
 
-    def finish_temporal_plot(self, species, reason, origin, dir=Path()):
+    def finish_temporal_plot(self, draw, data, species, reason, origin, dir=Path(), kind=None):
         """
-        Finishes the temporal plot by adding labels, title, grid, saving the plot and closing it.
+        Finishes the temporal plot by rendering and saving it. Plots whose inputs did not change since the last run
+        are skipped. With more than one job, the plot is rendered in a process pool and the call returns immediately,
+        use wait() to wait for all submitted plots.
+        :param draw: Function, which draws the plot from data and returns its figure and axes
+        :param data: Arguments of draw
         :param species: Species of the tree
         :param reason: Reason for the damage
         :param origin: Origin/ owner of the tree
         :param dir: Save plot in output_directory/dir
+        :param kind: Kind of the plot, stale plots are pruned per kind. Defaults to the name of draw.
         :return:
         """
-        plt.xlabel("Jahr")
-        plt.ylabel(f"Anzahl an toten {species} durch {reason} besitzt bei {origin} (1000 cbm)")
-        plt.title(f"Anzahl an toten {species} durch {reason} besitzt bei {origin} über die Jahre")
+        if self.__output == "multipage":
+            self.add_page(draw, data, species, reason, origin, dir, kind or draw.__name__)
+            return
 
-        plt.grid(True)
+        file_name = PLOT_OUTPUTS[self.__output][0]
+        species_dir, reason_dir, origin_dir = self.preprocess_metadata(species, reason, origin)
+        file_path = Path(f"{self.__out_dir / dir}/{species_dir}/{reason_dir}/{origin_dir}") / file_name
 
-        species, reason, origin = self.preprocess_metadata(species, reason, origin)
-        directory_path = Path(f"{self.__out_dir / dir}/{species}/{reason}/{origin}")
-        directory_path.mkdir(parents=True, exist_ok=True)
-        file_path = directory_path / "plot.png"
+        key = file_path.relative_to(self.__out_dir).as_posix()
+        options = [self.__options] if self.__options else []
+        entry = {"hash": hash_plot_inputs(draw, data, species, reason, origin, *options), "kind": kind or draw.__name__}
+        self.__visited.add(key)
+        self.__kinds.add(entry["kind"])
+        if not self.__rebuild and self.__manifest.get(key) == entry and file_path.exists():
+            return
+
+        if self.__jobs == 1:
+            self.add_timings(
+                render_temporal_plot(
+                    draw, data, species, reason, origin, file_path, self.__savefig_kwargs, self.__writer
+                )
+            )
+            self.__manifest[key] = entry
+            return
+
+        if self.__pool is None:
+            self.__pool = ProcessPoolExecutor(self.__jobs)
+        future = self.__pool.submit(
+            render_temporal_plot, draw, data, species, reason, origin, file_path, self.__savefig_kwargs
+        )
+        self.__futures.append((future, key, entry))
+
+    def add_page(self, draw, data, species, reason, origin, dir, kind):
+        """
+        Renders the temporal plot as next page of the PDF of its kind. The PDFs are written again by each run and
+        the pages are rendered in this process in the order of the calls, independent of the number of jobs.
+        :param draw: Function, which draws the plot from data and returns its figure and axes
+        :param data: Arguments of draw
+        :param species: Species of the tree
+        :param reason: Reason for the damage
+        :param origin: Origin/ owner of the tree
+        :param dir: Save the PDF in output_directory/dir
+        :param kind: Kind of the plot, the name of the PDF
+        :return:
+        """
+        file_path = self.__out_dir / dir / f"{kind.removeprefix('draw_')}.pdf"
+        if file_path not in self.__documents:
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            self.__documents[file_path] = PdfPages(file_path)
+        self.add_timings(
+            render_temporal_plot(
+                draw, data, species, reason, origin, self.__documents[file_path], self.__savefig_kwargs
+            )
+        )
+
+    def wait(self):
+        """
+        Waits until all submitted plots are rendered and written and raises the first error of the rendering
+        processes or of the writers. Plots, which could not be written, are rendered again by the next run.
+        :return:
+        """
+        futures, self.__futures = self.__futures, []
+        for future, key, entry in futures:
+            self.add_timings(future.result())
+            self.__manifest[key] = entry
+
+        with self.__profiler.stage("write_plots"):
+            errors = self.__writer.wait()
+        for file_path, _ in errors:
+            self.__manifest.pop(file_path.relative_to(self.__out_dir).as_posix(), None)
+        if errors:
+            file_path, error = errors[0]
+            raise OSError(f"Could not write {len(errors)} of the plots, e.g. {file_path}: {error}") from error
 
-        plt.savefig(file_path)
-        plt.close()
+    def add_timings(self, timings):
+        """
+        Adds the timings of a rendered plot to the profiler.
+        :param timings: Wall and CPU time of each rendering stage, as returned by render_temporal_plot
+        :return:
+        """
+        for stage, (wall, cpu) in timings.items():
+            self.__profiler.add(stage, wall, cpu)
+
+    def prune(self):
+        """
+        Removes the plots of all kinds plotted in this run, which were not plotted again, e.g. because their series
+        are no longer part of the data. Only the plots of the output of this run are removed.
+        :return:
+        """
+        file_name = PLOT_OUTPUTS.get(self.__output, (None,))[0]
+        for key, entry in list(self.__manifest.items()):
+            if entry["kind"] not in self.__kinds or key in self.__visited or Path(key).name != file_name:
+                continue
+            del self.__manifest[key]
+
+            file_path = self.__out_dir / key
+            file_path.unlink(missing_ok=True)
+            for directory in file_path.parents:
+                if directory == self.__out_dir or not directory.is_dir() or any(directory.iterdir()):
+                    break
+                directory.rmdir()
+
+    def close(self, prune=True):
+        """
+        Waits for all submitted plots, shuts down the process pool, prunes stale plots, saves the manifest and closes
+        the PDFs of the output "multipage".
+        :param prune: Prune stale plots, should be False if the run did not finish
+        :return:
+        """
+        try:
+            self.wait()
+            if prune:
+                self.prune()
+        finally:
+            documents, self.__documents = self.__documents, {}
+            for document in documents.values():
+                document.close()
+            if self.__pool is not None:
+                self.__pool.shutdown(cancel_futures=True)
+                self.__pool = None
+            self.__writer.close()
+            if self.__visited:
+                self.__manifest_path.parent.mkdir(parents=True, exist_ok=True)
+                self.__manifest_path.write_text(json.dumps(self.__manifest, indent=1, sort_keys=True))
 
     def plot_predictions(self, y, x_predict, train_score, value_2024, degree, species, reason, origin):
         """
@@ -76,22 +470,15 @@ class Plotter:
 
         species, reason, origin = self.preprocess_metadata(species, reason, origin)
 
-        plt.figure(figsize=(10, 10))
-        plt.subplot(2, 1, 1)
-        plt.plot(self.__x, y, ".r", markersize=8, label="Samples")
-        plt.plot(self.__x, x_predict, linewidth=5, color="tab:blue", label="Model")
-
-        plt.text(
-            2006,
-            -max(y),
-            f"Polynomial Regression\nBest Degree (1 is best): {degree}\nModel: Training R² Error: "
-            f"{train_score:.2f}\nPrediction 2024 {value_2024}",
-            fontsize=22,
-            color="magenta",
+        self.finish_temporal_plot(
+            draw_predictions,
+            (self.__x, y, x_predict, train_score, value_2024, degree),
+            species,
+            reason,
+            origin,
+            Path("Prediction_2024"),
         )
 
-        self.finish_temporal_plot(species, reason, origin, Path("Prediction_2024"))
-
     def plot_temporal_dependencies_from_species_reason_dict(self, species_dict, species="", origin=""):
         """
         Plots the temporal dependencies for a specific species, origin and all reasons combined.
@@ -100,19 +487,15 @@ class Plotter:
         :param origin: Origin/ owner of the tree
         :return:
         """
-        plt.figure(figsize=(12, 10))
-
-        color_map = plt.cm.get_cmap("tab10", len(species_dict))  # Use a colormap with enough colors
-
-        for i, (key, data_points) in enumerate(species_dict.items()):
-            key = key.removeprefix("Einschlagsursache: ")
-            plt.plot(self.__x, data_points, label=key, color=color_map(i))
-
-        plt.legend(title="Categories", bbox_to_anchor=(1.05, 1), loc="upper left")
-        plt.grid(True)
-        plt.tight_layout(rect=[0.05, 0.05, 0.95, 0.95])
-
-        self.finish_temporal_plot(species, "all_reasons", origin)
+        species_dict = {key.removeprefix("Einschlagsursache: "): value for key, value in species_dict.items()}
+        self.finish_temporal_plot(
+            draw_temporal_dependencies_dict,
+            (self.__x, species_dict, (12, 10)),
+            species,
+            "all_reasons",
+            origin,
+            kind="all_reasons",
+        )
 
     def plot_temporal_dependencies_from_species_owner_dict(self, species_dict, species="", reason=""):
         """
@@ -122,17 +505,14 @@ class Plotter:
         :param reason: Reason for the damage
         :return:
         """
-        plt.figure(figsize=(18, 10))
-
-        color_map = plt.cm.get_cmap("tab10", len(species_dict))  # Use a colormap with enough colors
-
-        for i, (key, data_points) in enumerate(species_dict.items()):
-            plt.plot(self.__x, data_points, label=key, color=color_map(i))
-
-        plt.legend(title="Categories", bbox_to_anchor=(1.05, 1), loc="upper left")
-        plt.grid(True)
-        plt.tight_layout(rect=[0.05, 0.05, 0.95, 0.95])
-        self.finish_temporal_plot(species, reason, "all_owners")
+        self.finish_temporal_plot(
+            draw_temporal_dependencies_dict,
+            (self.__x, dict(species_dict), (18, 10)),
+            species,
+            reason,
+            "all_owners",
+            kind="all_owners",
+        )
 
     def plot_temporal_dependencies(self, amounts, species="", reason="", origin=""):
         """
@@ -143,8 +523,5 @@ class Plotter:
         :param origin: Origin/ owner of the tree
         :return:
         """
-        plt.figure(figsize=(14, 12))
-        plt.plot(self.__x, amounts, marker="o", linestyle="-")
-
         reason = reason.removeprefix("Einschlagsursache: ")
-        self.finish_temporal_plot(species, reason, origin)
+        self.finish_temporal_plot(draw_temporal_dependencies, (self.__x, amounts), species, reason, origin)
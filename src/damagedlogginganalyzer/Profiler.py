@@ -0,0 +1,174 @@
+import contextlib
+import cProfile
+import json
+import time
+import tracemalloc
+
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # pragma: no cover, not available on Windows
+    resource = None
+
+# Returned by disabled profilers, so that instrumented code only pays for one method call
+NO_STAGE = contextlib.nullcontext()
+
+
+def max_rss_bytes():
+    """
+    Returns the peak resident set size of the process or None if it is not available on this platform.
+    :return:
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Profiler:
+    """
+    This class records wall time, CPU time, call counts and memory of the stages of an analysis. The memory of a stage
+    is the peak of the memory allocated during it (tracemalloc) and the peak RSS of the process at its end.
+    Stages are nested, each one is recorded under the path of the enclosing stages, e.g. "predict/select_degrees".
+    A disabled profiler records nothing and costs almost nothing.
+    """
+
+    def __init__(self, enabled=False, memory=False, profile_dir=None):
+        """
+        :param enabled: Record the stages
+        :param memory: Also trace the peak of the allocated memory of each stage with tracemalloc (slow)
+        :param profile_dir: Directory for one cProfile dump per stage, None disables cProfile
+        """
+        self.enabled = enabled or memory or profile_dir is not None
+        self.__memory = memory
+        self.__profile_dir = None if profile_dir is None else Path(profile_dir)
+        self.__stages = {}
+        self.__stack = []
+        self.__profiles = {}
+
+        if self.__memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def stage(self, name):
+        """
+        Returns a context manager, which records the enclosed code as stage.
+        :param name: Name of the stage
+        :return:
+        """
+        if not self.enabled:
+            return NO_STAGE
+        return self.__record_stage(name)
+
+    @contextlib.contextmanager
+    def __record_stage(self, name):
+        path = "/".join([frame["path"] for frame in self.__stack[-1:]] + [name])
+        frame = {"path": path, "peak": 0, "start": 0}
+        self.__stages.setdefault(path, {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0})
+
+        # The peak of the enclosing stage is saved, before it is reset for this stage
+        if self.__memory:
+            frame["start"], peak = tracemalloc.get_traced_memory()
+            if self.__stack:
+                self.__stack[-1]["peak"] = max(self.__stack[-1]["peak"], peak)
+            tracemalloc.reset_peak()
+
+        # cProfile can only profile one stage at a time, the enclosing stage is paused
+        profile = None
+        if self.__profile_dir is not None:
+            if self.__stack and self.__stack[-1].get("profile") is not None:
+                self.__stack[-1]["profile"].disable()
+            profile = frame["profile"] = self.__profiles.setdefault(path, cProfile.Profile())
+            profile.enable()
+
+        self.__stack.append(frame)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            self.__stack.pop()
+            if profile is not None:
+                profile.disable()
+                if self.__stack and self.__stack[-1].get("profile") is not None:
+                    self.__stack[-1]["profile"].enable()
+
+            peak = None
+            if self.__memory:
+                peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+                if self.__stack:
+                    self.__stack[-1]["peak"] = max(self.__stack[-1]["peak"], peak)
+                # Only the memory allocated on top of the memory at the start of the stage is reported
+                peak -= frame["start"]
+            self.__add(path, wall, cpu, peak)
+
+    def add(self, name, wall, cpu, calls=1):
+        """
+        Adds the times of a stage, which was measured elsewhere, e.g. in another process, to the current stage.
+        :param name: Name of the stage
+        :param wall: Wall time in seconds
+        :param cpu: CPU time in seconds
+        :param calls: Number of calls
+        :return:
+        """
+        if not self.enabled:
+            return
+        self.__add("/".join([frame["path"] for frame in self.__stack[-1:]] + [name]), wall, cpu, None, calls)
+
+    def __add(self, path, wall, cpu, peak, calls=1):
+        stage = self.__stages.setdefault(path, {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0})
+        stage["calls"] += calls
+        stage["wall_seconds"] += wall
+        stage["cpu_seconds"] += cpu
+        if peak is not None:
+            stage["peak_traced_bytes"] = max(stage.get("peak_traced_bytes", 0), peak)
+        rss = max_rss_bytes()
+        if rss is not None:
+            stage["max_rss_bytes"] = rss
+
+    def report(self):
+        """
+        Returns the recorded stages.
+        :return: Dictionary with the path of each stage and its calls, wall and CPU time in seconds and memory in bytes
+        """
+        return {"stages": self.__stages, "max_rss_bytes": max_rss_bytes()}
+
+    def write_json(self, file_path):
+        """
+        Writes the report as JSON file.
+        :param file_path: Path of the JSON file
+        :return:
+        """
+        file_path = Path(file_path)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_text(json.dumps(self.report(), indent=1))
+
+    def print_report(self):
+        """
+        Prints the recorded stages as table.
+        :return:
+        """
+        print(f"{'Stage':<70} {'Calls':>7} {'Wall (s)':>9} {'CPU (s)':>9} {'Peak (MB)':>10}")
+        for path, stage in self.__stages.items():
+            peak = f"{stage['peak_traced_bytes'] / 2**20:.1f}" if "peak_traced_bytes" in stage else "-"
+            print(
+                f"{path:<70} {stage['calls']:>7} {stage['wall_seconds']:>9.3f} {stage['cpu_seconds']:>9.3f} {peak:>10}"
+            )
+
+    def close(self):
+        """
+        Writes the cProfile dumps of all stages and stops tracing the memory.
+        :return:
+        """
+        if self.__profile_dir is not None and self.__profiles:
+            self.__profile_dir.mkdir(parents=True, exist_ok=True)
+            for path, profile in self.__profiles.items():
+                profile.dump_stats(self.__profile_dir / f"{path.replace('/', '.')}.prof")
+        if self.__memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
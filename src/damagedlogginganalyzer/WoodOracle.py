@@ -1,6 +1,12 @@
-from sklearn.preprocessing import PolynomialFeatures
+import hashlib
+import json
+import logging
+import numpy as np
 
-from damagedlogginganalyzer.Oracle import Oracle
+from damagedlogginganalyzer.IncrementalOracle import IncrementalOracle
+from damagedlogginganalyzer.Oracle import MIN_SCORED_FOLDS, Oracle, evaluate_polynomials, vandermonde
+
+_logger = logging.getLogger(__name__)
 
 
 class WoodOracle(Oracle):
@@ -8,8 +14,26 @@ class WoodOracle(Oracle):
     This class provides methods to predict the amount of damaged wood in 2024.
     """
 
-    def __init__(self):
-        super().__init__()
+    def __init__(
+        self,
+        engine="numpy",
+        profiler=None,
+        store=None,
+        state_path=None,
+        check_incremental=False,
+        k_splits=9,
+        degrees=None,
+        search="grid",
+        patience=2,
+    ):
+        super().__init__(engine, profiler, k_splits, degrees, search, patience)
+        self.store = store
+        # The incremental engine keeps its models in its own state file instead of the model store
+        self.incremental = None
+        if engine == "incremental":
+            self.incremental = IncrementalOracle(
+                state_path, check_incremental, self.profiler, k_splits, degrees, search, patience
+            )
 
     def predict_wood_logging(self, x, y, species, reason, origin):
         """
@@ -21,12 +45,139 @@ class WoodOracle(Oracle):
         :param origin: Origin/ owner of the tree
         :return:
         """
-        model, degree, train_score = self.k_fold_cross_validation(x, y)
+        model, degree, train_score = self.k_fold_cross_validation(
+            x, y, {"species": species, "reason": reason, "owner": origin}
+        )
+
+        value_2024 = model.predict(np.array([[2024]]))
+        _logger.info("%s, %s, %s in 2024: %s", species, reason, origin, value_2024)
+        # The cross validation added the row of this series to the results table
+        self.results[-1]["forecast_2024"] = float(value_2024[0])
+
+        return model.predict(x), train_score, value_2024, degree
+
+    def predict_many(self, x, y, keys=None, record=True):
+        """
+        Predicts the amount of damaged wood in 2024 for many series with the same years at once.
+        The models of all series are selected and fitted with a few matrix multiplications. Missing values (NaN) are
+        left out, series with the same missing years are fitted together. With a model store, only the series which
+        are not stored from an earlier run are fitted. The incremental engine only fits the years, which were appended
+        since its last run.
+        :param x: Input data, array of shape (n_years, 1)
+        :param y: Output data, array of shape (n_series, n_years)
+        :param keys: Dictionaries with the columns, which identify each series in the results table
+        :param record: Add the series to the results table
+        :return: Predictions of shape (n_series, n_years), training scores, values in 2024 and degrees of shape
+            (n_series,)
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        keys = [None] * len(y) if keys is None else keys
+
+        if self.incremental is not None:
+            series_keys = [json.dumps(key, sort_keys=True) if key else str(idx) for idx, key in enumerate(keys)]
+            results = self.incremental.fit_many(x, y, series_keys, np.vstack([x, [[2024]]]))
+        else:
+            results = self.fit_missing(x, y)
+
+        for result, key in zip(results, keys if record else []):
+            row = self.record_selection(
+                result["test_errors"], self.degrees.index(result["degree"]), result["train_score"], key
+            )
+            row["forecast_2024"] = float(result["predictions"][-1])
+
+        predictions = np.array([result["predictions"] for result in results]).reshape(len(y), len(x) + 1)
+        train_scores = np.array([result["train_score"] for result in results])
+        degrees = np.array([result["degree"] for result in results], dtype=int)
+        return predictions[:, :-1], train_scores, predictions[:, -1], degrees
+
+    def fit_missing(self, x, y):
+        """
+        Selects and fits the models of the series, which are not stored from an earlier run, and stores them.
+        :param x: Input data, array of shape (n_years, 1)
+        :param y: Output data, array of shape (n_series, n_years)
+        :return: List with the result of each series, see fit_many
+        """
+        stored = {}
+        if self.store is not None:
+            hashes = self.hash_series(x, y)
+            with self.profiler.stage("load_models"):
+                stored = self.store.get_many(hashes)
+            missing = [idx for idx, series_hash in enumerate(hashes) if series_hash not in stored]
+        else:
+            missing = list(range(len(y)))
 
-        poly_features = PolynomialFeatures(degree=degree)
-        x_poly = poly_features.fit_transform(x)
+        x_2024 = np.vstack([x, [[2024]]])
+        fitted = {}
+        patterns, inverse = np.unique(~np.isnan(y[missing]), axis=0, return_inverse=True)
+        for pattern_idx, pattern in enumerate(patterns):
+            group = [missing[idx] for idx in np.flatnonzero(inverse.ravel() == pattern_idx)]
+            # Indexing the years returns a transposed layout, which would change the summation order of the scores
+            y_group = np.ascontiguousarray(y[group][:, pattern])
+            fitted.update(zip(group, self.fit_many(x[pattern], y_group, x_2024)))
+        if self.store is not None:
+            with self.profiler.stage("store_models"):
+                self.store.put_many({hashes[idx]: result for idx, result in fitted.items()})
+        return [fitted[idx] if idx in fitted else stored[hashes[idx]] for idx in range(len(y))]
 
-        value_2024 = model.predict(poly_features.transform([[2024]]))
-        print(f"{species}, {reason}, {origin} in 2024:", value_2024)
+    def fit_many(self, x, y, x_predict=None):
+        """
+        Selects and fits the models of many series with the same years and predicts their values.
+        :param x: Input data, array of shape (n_years, 1)
+        :param y: Output data, array of shape (n_series, n_years)
+        :param x_predict: Years to predict, defaults to the years of x and 2024
+        :return: List with the degree, training score, validation errors of all degrees, predictions for x_predict and
+            for the numpy engine the coefficients of the powers of the years of each series
+        """
+        if not self.can_cross_validate(np.ones(len(x), dtype=bool)):
+            raise ValueError(
+                f"Can not cross validate series with {len(x)} values in {self.k_splits} folds, less than "
+                f"{MIN_SCORED_FOLDS} folds have 2 validation values!"
+            )
+        x_2024 = np.vstack([x, [[2024]]]) if x_predict is None else x_predict
+        if self.engine == "sklearn":
+            best_idx, a_test_errors, models, train_scores = self.sklearn_select_degrees(x, y.T)
+            return [
+                {
+                    "degree": self.degrees[best_idx[idx]],
+                    "train_score": train_scores[idx],
+                    "test_errors": a_test_errors[:, idx],
+                    "predictions": model.predict(x_2024),
+                }
+                for idx, model in enumerate(models)
+            ]
 
-        return model.predict(x_poly), train_score, value_2024, degree
+        best_idx, a_test_errors, train_scores, coefficients = self.select_degrees(x, y.T)
+        series_idx = np.arange(y.shape[0])
+
+        # Coefficients of the best degree for each series, evaluated for all series at once
+        coefficients = coefficients[best_idx, :, series_idx]
+        predictions = evaluate_polynomials(vandermonde(x_2024, 0.0, 1.0, max(self.degrees)), coefficients.T).T
+        return [
+            {
+                "degree": self.degrees[best_idx[idx]],
+                "train_score": train_scores[best_idx[idx], idx],
+                "test_errors": a_test_errors[:, idx],
+                "predictions": predictions[idx],
+                "coefficients": coefficients[idx],
+            }
+            for idx in series_idx
+        ]
+
+    def hash_series(self, x, y):
+        """
+        Calculates the keys of the series in the model store from everything the model selection depends on.
+        :param x: Input data, array of shape (n_years, 1)
+        :param y: Output data, array of shape (n_series, n_years)
+        :return: List with the key of each series
+        """
+        # The folds are shuffled with the fixed random state 0 of KFold
+        search = "" if self.search == "grid" else f" {self.search} {self.patience}"
+        digest = hashlib.sha256(f"{self.engine} {self.k_splits} {self.degrees} 0 2024{search}".encode())
+        digest.update(np.ascontiguousarray(x, dtype=float).tobytes())
+        hashes = []
+        for series in y:
+            series_digest = digest.copy()
+            series_digest.update(np.ascontiguousarray(series, dtype=float).tobytes())
+            hashes.append(series_digest.hexdigest())
+        return hashes
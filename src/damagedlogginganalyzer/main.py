@@ -1,7 +1,11 @@
 import argparse
+import glob
+import logging
+import logging.handlers
 import sys
 
-from damagedlogginganalyzer.DamagedLoggingAnalyzer import DamagedLoggingAnalyzer
+from pathlib import Path
+
 from damagedlogginganalyzer import __version__
 
 __author__ = "HokageM"
@@ -16,7 +20,15 @@ def parse_args(args):
         action="version",
         version=f"DamagedLoggingAnalyzer {__version__}",
     )
-    parser.add_argument("csv", metavar="CSV", type=str, help="Path to the CSV containing the statistic.")
+    parser.add_argument(
+        "csv",
+        metavar="CSV",
+        type=str,
+        nargs="+",
+        help="Paths or glob patterns of the CSV files containing the statistic, e.g. the raw GENESIS exports. Several "
+        "files, e.g. one per federal state or table release, are analyzed as one statistic with a region for each "
+        "file, if they do not contain the column Bundesland.",
+    )
     parser.add_argument(
         "--calculate-most-dangerous-reasons",
         action="store_true",
@@ -49,28 +61,426 @@ def parse_args(args):
         "Plots will be saved in: output-path/Prediction_2024/Specie/Reasons/Owner/plot.png.Note: will created a "
         "new model for every specie, reason and owner combination.",
     )
+    parser.add_argument(
+        "--rank",
+        nargs="+",
+        choices=["year", "species", "owner", "reason"],
+        metavar="DIMENSION",
+        help="Ranks the summed amounts of each combination of these dimensions (year, species, owner, reason), e.g. "
+        "--rank species reason. Use --years, --species, --owners and --reasons to select the summed slice.",
+    )
+    parser.add_argument(
+        "--rank-within",
+        nargs="*",
+        choices=["year", "species", "owner", "reason"],
+        metavar="DIMENSION",
+        help="Dimensions of --rank, within which the combinations are ranked. Defaults to all but the last one.",
+    )
+    parser.add_argument("--years", nargs=2, type=int, metavar=("FIRST", "LAST"), help="Years of --rank.")
+    parser.add_argument("--species", nargs="+", help="Species of --rank, default: all.")
+    parser.add_argument("--owners", nargs="+", default=["Insgesamt"], help="Owners of --rank, default: Insgesamt.")
+    parser.add_argument("--reasons", nargs="+", help="Reasons of --rank, default: all.")
+    parser.add_argument(
+        "--ranking",
+        type=str,
+        help="Write the table of --rank to this path, as JSON if it ends with .json and as CSV otherwise, instead of "
+        "printing it.",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Serve a dashboard of the CSV on http://HOST:PORT after the other modes. It plots the series, forecasts "
+        "and rankings of any species, reason and owner, which are computed on the first request and cached.",
+    )
+    parser.add_argument(
+        "--host", type=str, default="127.0.0.1", help="Host of --serve, only the local machine by default."
+    )
+    parser.add_argument("--port", type=int, default=8000, help="Port of --serve.")
+    parser.add_argument(
+        "--region",
+        type=str,
+        help="Region of the CSV files to analyze, e.g. Bayern or the name of a file. Default: the sum of all regions.",
+    )
+    parser.add_argument(
+        "--on-conflict",
+        choices=["last", "first", "error"],
+        default="last",
+        help="How different values of the same region, year, species and owner in several CSV files are combined: "
+        "take the one of the last or first file or stop with an error. Missing values never replace present ones.",
+    )
+    parser.add_argument(
+        "--compact",
+        choices=["float32", "float64"],
+        help="Keep the CSV in a compact representation: the labels of the dimensions as categoricals and the amounts "
+        "as floats of this type. float32 needs half of the memory of float64 for the amounts, but keeps only about 7 "
+        "digits.",
+    )
+    parser.add_argument(
+        "--memory-report",
+        action="store_true",
+        help="Print the memory of each column of the CSV after reading it and after --compact.",
+    )
+    parser.add_argument(
+        "--oracle-engine",
+        choices=["numpy", "sklearn", "incremental"],
+        default="numpy",
+        help="Engine for the K-Fold Cross Validation of --predict. numpy solves each degree and fold for all series "
+        "with the same years at once like sklearn does, sklearn fits one model per degree, fold and series (slow, "
+        "reference). "
+        "incremental keeps the QR factors of each series in output-path/incremental_models.npz and only adds the "
+        "years appended since its last run, its folds are the positions of the years modulo the number of folds.",
+    )
+    parser.add_argument(
+        "--folds",
+        type=int_at_least(2),
+        default=9,
+        help="Number of folds of the K-Fold Cross Validation of --predict. Folds with less than 2 validation values "
+        "have no score, series with less than 2 scored folds are skipped.",
+    )
+    parser.add_argument(
+        "--degrees",
+        type=int_at_least(1),
+        nargs="+",
+        default=None,
+        metavar="DEGREE",
+        help="Degrees of the polynomials, which the K-Fold Cross Validation of --predict selects from, 1 to 14 by "
+        "default.",
+    )
+    parser.add_argument(
+        "--degree-search",
+        choices=["grid", "pruned"],
+        default="grid",
+        help="Search of the best degree. grid evaluates all degrees. pruned skips the degrees, which have more "
+        "coefficients than a training fold determines, and stops once the validation error did not improve for "
+        "--patience degrees. The skipped degrees are listed in --forecasts.",
+    )
+    parser.add_argument(
+        "--patience",
+        type=int_at_least(1),
+        default=2,
+        help="Number of consecutive degrees without a lower validation error, after which --degree-search pruned "
+        "stops.",
+    )
+    parser.add_argument(
+        "--check-incremental",
+        action="store_true",
+        help="Compare the models of the incremental engine with a full refit of all years and warn about differences.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of processes used to parse the CSV files and to render the plots.",
+    )
+    parser.add_argument(
+        "--rebuild-plots",
+        action="store_true",
+        help="Render all plots again. By default, plots whose inputs did not change since the last run (recorded in "
+        "output-path/manifest.json) are skipped.",
+    )
+    parser.add_argument(
+        "--plot-output",
+        choices=["png", "svg", "pdf", "thumbnail", "multipage"],
+        default="png",
+        help="Output of the plots. png, svg and pdf save each plot as plot.png, plot.svg or plot.pdf, thumbnail saves "
+        "each plot with a low resolution as thumbnail.png. multipage saves all plots of a mode as pages of one PDF in "
+        "output-path, e.g. all_owners.pdf, which is written again by each run.",
+    )
+    parser.add_argument(
+        "--plot-writers",
+        type=int,
+        default=1,
+        help="Number of threads, which write the plots to their files, while the next plots are rendered. 0 writes "
+        "each plot before the next one is rendered. With more than one job, the rendering processes write the plots.",
+    )
+    parser.add_argument(
+        "--png-compression",
+        type=int,
+        choices=range(10),
+        default=None,
+        metavar="{0..9}",
+        help="zlib compression level of the PNG plots from 0 (fastest) to 9 (smallest), 6 by default.",
+    )
+    parser.add_argument(
+        "--dpi",
+        type=float,
+        default=None,
+        help="Resolution of the plots in dots per inch, 100 by default. Thumbnails keep their resolution.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Parse the CSV without reading or writing its cached version in $XDG_CACHE_HOME/damagedlogginganalyzer "
+        "(default: ~/.cache/damagedlogginganalyzer).",
+    )
+    parser.add_argument(
+        "--rebuild-cache",
+        action="store_true",
+        help="Parse the CSV again and replace its cached version.",
+    )
+    parser.add_argument(
+        "--no-model-cache",
+        action="store_true",
+        help="Fit all models of --predict without reading or writing the models stored in output-path/models.sqlite. "
+        "By default, only series whose data changed since an earlier run are fitted.",
+    )
+    parser.add_argument(
+        "--rebuild-models",
+        action="store_true",
+        help="Fit all models of --predict again and replace the stored ones.",
+    )
+    parser.add_argument(
+        "--model-cache-size",
+        type=int,
+        default=100000,
+        help="Maximum number of stored models, the least recently used ones are evicted.",
+    )
+    parser.add_argument(
+        "--forecasts",
+        type=str,
+        help="Write the selected degree, the validation error of each degree, the training R² score and the forecast "
+        "for 2024 of each series of --predict to this path, as JSON if it ends with .json and as CSV otherwise.",
+    )
+    parser.add_argument(
+        "--log-level",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        default="INFO",
+        help="Minimum level of the printed messages, WARNING hides the progress and the diagnostics of the analysis.",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print wall time, CPU time, calls and peak memory (tracemalloc, slows down the run) of each stage.",
+    )
+    parser.add_argument(
+        "--timings-json",
+        type=str,
+        help="Write wall time, CPU time, calls and peak RSS of each stage as JSON to this path.",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        type=str,
+        help="Write one cProfile dump of each stage into this directory, e.g. predict.select_degrees.prof.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip the series and groups of series, which an earlier run with the same data and options completed. "
+        "Each run records its completed units in output-path/journal.jsonl.",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        default=None,
+        metavar="I/N",
+        help="Only process the I-th of N disjoint slices of the series, e.g. 0/4 to 3/4 on four nodes. The shard "
+        "records its units in output-path/journal-I-of-N.jsonl. A run with --resume in an output path with the "
+        "journals of all shards merges their forecasts.",
+    )
     parser.add_argument(
         "--out-dir",
         type=str,
         help="Output directory for the plots.",
         default="plots",
     )
-    return parser.parse_args(args)
+    parsed = parser.parse_args(args)
+    if parsed.degrees is not None and len(set(parsed.degrees)) < len(parsed.degrees):
+        parser.error(f"argument --degrees: {parsed.degrees} repeats a degree")
+    return parsed
+
+
+def int_at_least(minimum):
+    """
+    Returns the type of the options, which are integers of at least minimum, e.g. --folds.
+    :param minimum: Smallest valid value
+    :return: Function, which parses the value of the option
+    """
+
+    def parse(value):
+        try:
+            number = int(value)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"{value!r} is not an integer")
+        if number < minimum:
+            raise argparse.ArgumentTypeError(f"{number} is less than {minimum}")
+        return number
+
+    return parse
+
+
+def parse_shard(value):
+    """
+    Parses the shard of --shard.
+    :param value: Shard as I/N
+    :return: Index of the shard and number of shards
+    """
+    try:
+        shard, n_shards = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value!r} is not a shard like 0/4")
+    if not 0 <= shard < n_shards:
+        raise argparse.ArgumentTypeError(
+            f"Shard {shard} of {value!r} does not exist, the shards are 0 to {n_shards - 1}"
+        )
+    return shard, n_shards
+
+
+def setup_logging(loglevel):
+    """
+    Setup logging of the analysis. The messages are buffered and written to stdout in batches.
+    :param loglevel: Minimum level of the messages
+    :return: The handler, which has to be closed to write the remaining messages
+    """
+    stream_handler = logging.StreamHandler(sys.stdout)
+    handler = logging.handlers.MemoryHandler(1024, flushLevel=logging.ERROR, target=stream_handler)
+    logger = logging.getLogger("damagedlogginganalyzer")
+    logger.setLevel(loglevel)
+    logger.addHandler(handler)
+    return handler
+
+
+def expand_paths(patterns):
+    """
+    Expands glob patterns, e.g. "exports/*.csv", to the sorted paths they match. Other paths are kept as they are.
+    :param patterns: Paths or glob patterns
+    :return:
+    """
+    paths = []
+    for pattern in patterns:
+        if any(character in pattern for character in "*?["):
+            matches = sorted(glob.glob(pattern, recursive=True))
+            if not matches:
+                raise FileExistsError(
+                    f"{pattern} does not match any file!. Please enter correct Path to your CSV file!"
+                )
+            paths.extend(matches)
+        else:
+            paths.append(pattern)
+    return paths
+
+
+def print_memory_report(before, after, handler):
+    """
+    Prints the memory of each column of the CSV before and after compacting it.
+    :param before: Bytes of each column before
+    :param after: Bytes of each column after
+    :param handler: Logging handler, which is flushed before printing
+    :return:
+    """
+    import pandas as pd
+
+    report = pd.DataFrame({"bytes before": before, "bytes after": after})
+    report.loc["Total"] = report.sum()
+    report["ratio"] = (report["bytes before"] / report["bytes after"]).round(1)
+    handler.flush()
+    print(report.to_string())
+
+
+def rank(analyzer, args, handler):
+    """
+    Ranks the amounts of the selected slice and prints or writes the ranking.
+    :param analyzer: Analyzer, which analyzed the CSV
+    :param args: Parsed command line arguments
+    :param handler: Logging handler, which is flushed before printing
+    :return:
+    """
+    from damagedlogginganalyzer.CSVAnalyzer import write_table
+
+    rank_within = args.rank[:-1] if args.rank_within is None else args.rank_within
+    ranking = analyzer.rank_amounts(args.rank, rank_within, args.years, args.species, args.owners, args.reasons)
+    if args.ranking is not None:
+        write_table(ranking, args.ranking)
+        return
+    handler.flush()
+    print(ranking.to_string(index=False))
+
+
+def serve(analyzer, args, handler):
+    """
+    Serves the dashboard of the analyzed CSV until the process is interrupted.
+    :param analyzer: Analyzer, which analyzed the CSV
+    :param args: Parsed command line arguments
+    :param handler: Logging handler, which prints each message immediately while serving
+    :return:
+    """
+    from damagedlogginganalyzer.DashboardServer import DashboardServer
+
+    handler.flush()
+    handler.flushLevel = logging.DEBUG
+    DashboardServer(analyzer, args.host, args.port).serve_forever()
 
 
 def main(args):
     args = parse_args(args)
     print("DamagedLoggingAnalyzer! Pow Pow")
 
-    with DamagedLoggingAnalyzer(args.out_dir) as analyzer:
-        analyzer.read_in_csv(args.csv)
-        analyzer.analyze(
-            plot_reason_dependencies=args.plot_reason_dependencies,
-            plot_owner_dependencies=args.plot_owner_dependencies,
-            plot_temporal_dependencies_all=args.plot_temporal_dependencies_all,
-            predict_temporal_dependencies=args.predict,
-            calculate_most_dangerous_reasons=args.calculate_most_dangerous_reasons,
-        )
+    # pandas, numpy and the analysis modules are only imported once the arguments are valid
+    from damagedlogginganalyzer.CSVAnalyzer import default_cache_dir
+    from damagedlogginganalyzer.DamagedLoggingAnalyzer import DamagedLoggingAnalyzer
+    from damagedlogginganalyzer.Journal import Journal
+    from damagedlogginganalyzer.ModelStore import ModelStore
+    from damagedlogginganalyzer.Profiler import Profiler
+
+    model_store = None
+    if (args.predict or args.serve) and not args.no_model_cache:
+        model_store = ModelStore(Path(args.out_dir) / "models.sqlite", args.model_cache_size, args.rebuild_models)
+
+    handler = setup_logging(args.log_level)
+    try:
+        with Profiler(args.timings_json is not None, args.profile, args.profile_dir) as profiler:
+            with DamagedLoggingAnalyzer(
+                args.out_dir,
+                args.oracle_engine,
+                args.jobs,
+                args.rebuild_plots,
+                profiler,
+                model_store,
+                args.plot_output,
+                args.check_incremental,
+                args.folds,
+                args.degrees,
+                args.degree_search,
+                args.patience,
+                args.plot_writers,
+                args.png_compression,
+                args.dpi,
+                Journal(args.out_dir, args.shard, args.resume),
+            ) as analyzer:
+                analyzer.read_in_csvs(
+                    expand_paths(args.csv),
+                    cache_dir=None if args.no_cache else default_cache_dir(),
+                    rebuild_cache=args.rebuild_cache,
+                    jobs=args.jobs,
+                    on_conflict=args.on_conflict,
+                )
+                memory_before = analyzer.memory_usage() if args.memory_report else None
+                if args.compact is not None:
+                    analyzer.compact(args.compact)
+                if args.memory_report:
+                    print_memory_report(memory_before, analyzer.memory_usage(), handler)
+                analyzer.analyze(
+                    plot_reason_dependencies=args.plot_reason_dependencies,
+                    plot_owner_dependencies=args.plot_owner_dependencies,
+                    plot_temporal_dependencies_all=args.plot_temporal_dependencies_all,
+                    predict_temporal_dependencies=args.predict,
+                    calculate_most_dangerous_reasons=args.calculate_most_dangerous_reasons,
+                    region=args.region,
+                )
+                if args.forecasts is not None:
+                    analyzer.write_forecasts(args.forecasts)
+                if args.rank is not None:
+                    rank(analyzer, args, handler)
+                if args.serve:
+                    serve(analyzer, args, handler)
+
+            handler.flush()
+            if args.profile:
+                profiler.print_report()
+            if args.timings_json is not None:
+                profiler.write_json(args.timings_json)
+    finally:
+        logging.getLogger("damagedlogginganalyzer").removeHandler(handler)
+        handler.close()
 
 
 def run():
@@ -7,4 +7,8 @@
     - https://docs.pytest.org/en/stable/writing_plugins.html
 """
 
-# import pytest
+import sys
+from pathlib import Path
+
+# The generator of the synthetic GENESIS data is part of the benchmarks, not of the package
+sys.path.insert(0, str(Path(__file__).parents[1] / "benchmarks"))
@@ -0,0 +1,26 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+__author__ = "HokageM"
+__copyright__ = "HokageM"
+__license__ = "MIT"
+
+RUN_BENCHMARKS = Path(__file__).parents[1] / "benchmarks" / "run_benchmarks.py"
+
+
+def test_run_benchmarks(tmp_path):
+    report = tmp_path / "report.json"
+    sizes = ["--years", "10", "--species", "2", "--owners", "2", "--reasons", "2", "--regions", "2"]
+    run = [sys.executable, str(RUN_BENCHMARKS), *sizes, "--repeat", "1", "--select", "csv"]
+    subprocess.run([*run, "--output", str(report)], check=True, capture_output=True)
+
+    results = json.loads(report.read_text())
+    assert results["metadata"]["sizes"] == dict(years=10, species=2, owners=2, reasons=2, regions=2)
+    assert set(results["benchmarks"]) == {"read_in_csv", "read_in_csv_cached"}
+    assert results["benchmarks"]["read_in_csv"]["repeat"] == 1
+
+    compared = subprocess.run([*run, "--compare", str(report), "--threshold", "1000"], capture_output=True, text=True)
+    assert compared.returncode == 0
+    assert "read_in_csv_cached" in compared.stdout.splitlines()[-1]
@@ -0,0 +1,249 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import damagedlogginganalyzer.CSVAnalyzer as CSVAnalyzerModule
+from damagedlogginganalyzer.CSVAnalyzer import (
+    CSVAnalyzer,
+    combine_tables,
+    compact_table,
+    genesis_delimiter,
+    is_genesis_csv,
+    load_csv,
+    read_genesis_csv,
+)
+
+__author__ = "HokageM"
+__copyright__ = "HokageM"
+__license__ = "MIT"
+
+DATA = Path(__file__).parents[1] / "data"
+
+
+@pytest.fixture
+def csv_file(tmp_path):
+    csv = tmp_path / "wood.csv"
+    csv.write_text(
+        "Jahr,Baumart,Waldeigentum,Einschlagsursache: Wind,Einschlagsursache: Insekten,Unnamed\n"
+        "2006,Eiche,Privatwald,1,2,x\n"
+        "2006,Buche,Privatwald,3,4,x\n"
+        "2007,Eiche,Privatwald,5,-,x\n"
+        "__________,,,,,\n"
+    )
+    return csv
+
+
+def test_get_dense_array(csv_file):
+    with CSVAnalyzer() as analyzer:
+        analyzer.read_in_csv(csv_file)
+        cube, (years, species, owners, reasons) = analyzer.get_dense_array(
+            ["Jahr", "Baumart", "Waldeigentum"], value_like="Einschlagsursache:"
+        )
+
+    assert cube.shape == (2, 2, 1, 2)
+    assert list(years) == ["2006", "2007"]
+    assert list(species) == ["Eiche", "Buche"]
+    assert list(reasons) == ["Einschlagsursache: Wind", "Einschlagsursache: Insekten"]
+    np.testing.assert_array_equal(
+        cube[:, species["Eiche"], owners["Privatwald"], reasons["Einschlagsursache: Wind"]], [1, 5]
+    )
+    # "-" and combinations missing in the csv are NaN
+    assert np.isnan(cube[years["2007"], species["Eiche"], 0, reasons["Einschlagsursache: Insekten"]])
+    assert np.isnan(cube[years["2007"], species["Buche"], 0, 0])
+
+
+def test_get_dense_array_unknown_key(csv_file):
+    with CSVAnalyzer() as analyzer:
+        analyzer.read_in_csv(csv_file)
+        with pytest.raises(KeyError):
+            analyzer.get_dense_array(["Region"])
+
+
+def test_get_dict_with_df_same_key_value(csv_file):
+    with CSVAnalyzer() as analyzer:
+        analyzer.read_in_csv(csv_file)
+        species_dict = analyzer.get_dict_with_df_same_key_value("Baumart")
+
+    assert list(species_dict) == ["Eiche", "Buche"]
+    assert list(species_dict["Eiche"]["Jahr"]) == ["2006", "2007"]
+    assert list(species_dict["Eiche"].index) == [0, 2]
+    assert list(species_dict["Buche"]["Einschlagsursache: Wind"]) == [3]
+
+
+def test_read_in_csv_cache(csv_file, tmp_path, monkeypatch):
+    cache_dir = tmp_path / "cache"
+    with CSVAnalyzer() as analyzer:
+        analyzer.read_in_csv(csv_file, cache_dir=cache_dir)
+        expected = analyzer.get_dense_array(["Jahr", "Baumart"])
+    assert len(list(cache_dir.glob("*.pkl"))) == 1
+
+    # The csv is not parsed again, as long as it did not change
+    cached = next(cache_dir.glob("*.pkl"))
+    modified = cached.stat().st_mtime_ns
+    csv_file.touch()
+    with CSVAnalyzer() as analyzer:
+        analyzer.read_in_csv(csv_file, cache_dir=cache_dir)
+        np.testing.assert_array_equal(analyzer.get_dense_array(["Jahr", "Baumart"])[0], expected[0])
+    assert cached.stat().st_mtime_ns == modified
+
+    csv_file.write_text(csv_file.read_text().replace("2006,Buche,Privatwald,3", "2006,Buche,Privatwald,7"))
+    with CSVAnalyzer() as analyzer:
+        analyzer.read_in_csv(csv_file, cache_dir=cache_dir)
+        cube, (years, species, reasons) = analyzer.get_dense_array(["Jahr", "Baumart"])
+    assert cube[years["2006"], species["Buche"], reasons["Einschlagsursache: Wind"]] == 7
+
+    # A new version of the parser parses the csv again
+    monkeypatch.setattr(CSVAnalyzerModule, "CACHE_VERSION", CSVAnalyzerModule.CACHE_VERSION + 1)
+    modified = cached.stat().st_mtime_ns
+    with CSVAnalyzer() as analyzer:
+        analyzer.read_in_csv(csv_file, cache_dir=cache_dir)
+    assert cached.stat().st_mtime_ns != modified
+
+
+GENESIS_CSV = (
+    "GENESIS-Tabelle: 41261-0003\n"
+    "Schadholzeinschlag: Deutschland, Jahre, Einschlagsursache,;;;;\n"
+    "Schadholzeinschlag (1000 cbm);;;;\n"
+    ";;;Einschlagsursache;Einschlagsursache\n"
+    ";;;Wind/Sturm;Trockenheit\n"
+    "2006;Kiefer und Lärche;Privatwald;40,8;-\n"
+    "2006;Fichte, Tanne, Douglasie und sonstiges Nadelholz;Privatwald;1296,3;-\n"
+    "2020;Kiefer und Lärche;Privatwald;3086,2;2265,8\n"
+    "__________\n"
+    '"Einschlagsursache ""Sonstiges"":\n'
+    "© Statistisches Bundesamt (Destatis), 2024\n"
+)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 65536])
+def test_read_genesis_csv(tmp_path, chunk_size):
+    csv = tmp_path / "genesis.csv"
+    csv.write_bytes(GENESIS_CSV.encode("latin-1"))
+
+    assert is_genesis_csv(csv)
+    df = read_genesis_csv(csv, ["Jahr", "Baumart", "Waldeigentum"], chunk_size=chunk_size)
+
+    assert list(df.columns) == [
+        "Jahr",
+        "Baumart",
+        "Waldeigentum",
+        "Einschlagsursache: Wind/Sturm",
+        "Einschlagsursache: Trockenheit",
+    ]
+    assert list(df["Jahr"]) == [2006, 2006, 2020]
+    assert df["Baumart"][1] == "Fichte, Tanne, Douglasie und sonstiges Nadelholz"
+    assert df["Baumart"][2] == "Kiefer und Lärche"
+    np.testing.assert_array_equal(df["Einschlagsursache: Wind/Sturm"], [40.8, 1296.3, 3086.2])
+    np.testing.assert_array_equal(df["Einschlagsursache: Trockenheit"], [np.nan, np.nan, 2265.8])
+
+
+@pytest.mark.parametrize("chunk_size", [1, 65536])
+def test_read_genesis_csv_with_short_values(tmp_path, chunk_size):
+    # The missing values of a chunk with only one character per field are not truncated
+    csv = tmp_path / "genesis.csv"
+    csv.write_bytes(
+        GENESIS_CSV.split("2006;")[0].encode("latin-1") + b"2006;Eiche;Privatwald;5;-\n2007;Eiche;Privatwald;-;-\n"
+    )
+
+    df = read_genesis_csv(csv, ["Jahr", "Baumart", "Waldeigentum"], chunk_size=chunk_size)
+    np.testing.assert_array_equal(df["Einschlagsursache: Wind/Sturm"], [5, np.nan])
+    np.testing.assert_array_equal(df["Einschlagsursache: Trockenheit"], [np.nan, np.nan])
+
+
+def test_read_genesis_csv_separated_by_commas():
+    # The export of data/DamagedLoggingOriginal.csv saved again with "," as delimiter and decimal separator
+    keys = ["Jahr", "Baumart", "Waldeigentum"]
+    assert genesis_delimiter(DATA / "DamagedLoggingWood.csv") == ","
+    assert genesis_delimiter(DATA / "DamagedLoggingOriginal.csv") == ";"
+    assert genesis_delimiter(DATA / "DamagedLoggingWoodFixTable.csv") is None
+
+    commas = load_csv(DATA / "DamagedLoggingWood.csv", dimension_keys=keys)
+    original = load_csv(DATA / "DamagedLoggingOriginal.csv", dimension_keys=keys)
+
+    assert list(commas.columns) == list(original.columns)
+    assert "Fichte, Tanne, Douglasie und sonstiges Nadelholz" in set(commas["Baumart"])
+    for key in keys:
+        # The umlauts of the labels were replaced when the export was saved again
+        np.testing.assert_array_equal(pd.factorize(commas[key])[0], pd.factorize(original[key])[0])
+    np.testing.assert_array_equal(commas.iloc[:, 3:].to_numpy(), original.iloc[:, 3:].to_numpy())
+
+
+def test_read_genesis_csv_refuses_ambiguous_commas(tmp_path):
+    csv = tmp_path / "genesis.csv"
+    csv.write_bytes(GENESIS_CSV.replace(";", ",").replace("40,8,-", "40,8,1,-").encode("latin-1"))
+
+    assert genesis_delimiter(csv) == ","
+    with pytest.raises(ValueError, match="genesis.csv: line 6"):
+        read_genesis_csv(csv, ["Jahr", "Baumart", "Waldeigentum"], delimiter=",")
+
+
+def test_read_in_csv_detects_genesis_csv(tmp_path):
+    csv = tmp_path / "genesis.csv"
+    csv.write_bytes(GENESIS_CSV.encode("latin-1"))
+
+    with CSVAnalyzer() as analyzer:
+        analyzer.read_in_csv(csv, dimension_keys=["Jahr", "Baumart", "Waldeigentum"])
+        cube, (years, species, owners, reasons) = analyzer.get_dense_array(
+            ["Jahr", "Baumart", "Waldeigentum"], value_like="Einschlagsursache:"
+        )
+    assert cube[years[2020], species["Kiefer und Lärche"], owners["Privatwald"], 1] == 2265.8
+
+
+@pytest.mark.parametrize("on_conflict, wind", [("last", [1, 7, 5]), ("first", [1, 3, 5])])
+def test_read_in_csvs(tmp_path, on_conflict, wind):
+    header = "Jahr,Baumart,Waldeigentum,Einschlagsursache: Wind,Einschlagsursache: Insekten\n"
+    (tmp_path / "2023").mkdir()
+    (tmp_path / "2024").mkdir()
+    (tmp_path / "2023/Bayern.csv").write_text(header + "2006,Eiche,Privatwald,1,2\n2007,Eiche,Privatwald,3,4\n")
+    # The newer release corrects 2007, adds 2008 and does not know the insects of 2007
+    (tmp_path / "2024/Bayern.csv").write_text(header + "2007,Eiche,Privatwald,7,-\n2008,Eiche,Privatwald,5,6\n")
+    (tmp_path / "Hessen.csv").write_text(header + "2006,Eiche,Privatwald,10,20\n")
+
+    paths = [tmp_path / "2023/Bayern.csv", tmp_path / "2024/Bayern.csv", tmp_path / "Hessen.csv"]
+    with CSVAnalyzer() as analyzer:
+        analyzer.read_in_csvs(paths, dimension_keys=["Jahr", "Baumart", "Waldeigentum"], on_conflict=on_conflict)
+        table = analyzer.get_dict_with_df_same_key_value("Region")
+        with pytest.raises(ValueError, match="1 rows have different values"):
+            analyzer.read_in_csvs(paths, dimension_keys=["Jahr", "Baumart", "Waldeigentum"], on_conflict="error")
+
+    assert list(table) == ["Bayern", "Hessen"]
+    bayern = table["Bayern"]
+    assert list(bayern["Jahr"]) == [2006, 2007, 2008]
+    assert list(bayern["Einschlagsursache: Wind"]) == wind
+    assert list(bayern["Einschlagsursache: Insekten"]) == [2, 4, 6]
+    assert list(table["Hessen"]["Einschlagsursache: Wind"]) == [10]
+
+
+def test_combine_tables_keeps_regions_and_drops_duplicates():
+    table = pd.DataFrame({"Region": ["A", "B"], "Jahr": [2006, 2006], "Wert": [1.0, 2.0]})
+    combined = combine_tables([table, table.iloc[1:]], ["first", "second"], ["Jahr"], on_conflict="error")
+
+    pd.testing.assert_frame_equal(combined, table)
+
+
+def test_compact(csv_file):
+    with CSVAnalyzer() as analyzer:
+        analyzer.read_in_csv(csv_file)
+        cube, indexes = analyzer.get_dense_array(["Jahr", "Baumart", "Waldeigentum"], value_like="Einschlagsursache:")
+        before = analyzer.memory_usage()
+        analyzer.compact(["Jahr", "Baumart", "Waldeigentum"], "float64")
+        compact_cube, compact_indexes = analyzer.get_dense_array(
+            ["Jahr", "Baumart", "Waldeigentum"], value_like="Einschlagsursache:"
+        )
+
+    np.testing.assert_array_equal(compact_cube, cube)
+    assert [list(index) for index in compact_indexes] == [list(index) for index in indexes]
+    # Tiny tables do not get smaller, the report has a row per column nonetheless
+    assert list(analyzer.memory_usage().index) == list(before.index)
+
+
+def test_compact_table():
+    table = pd.DataFrame({"Jahr": [2006, 2007], "Wind": ["1.5", "-"], "Insekten": [1, 2], "Notiz": ["a", "-"]})
+    compact = compact_table(table, ["Jahr"])
+
+    assert compact["Jahr"].dtype == "category"
+    assert compact["Notiz"].dtype == "category"
+    assert compact["Wind"].dtype == compact["Insekten"].dtype == np.float32
+    assert compact["Wind"].iloc[0] == 1.5 and np.isnan(compact["Wind"].iloc[1])
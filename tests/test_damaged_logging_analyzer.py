@@ -0,0 +1,161 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from damagedlogginganalyzer.DamagedLoggingAnalyzer import DamagedLoggingAnalyzer
+from damagedlogginganalyzer.main import main
+
+from genesis_generator import write_genesis_csv
+
+__author__ = "HokageM"
+__copyright__ = "HokageM"
+__license__ = "MIT"
+
+
+@pytest.fixture
+def csv_file(tmp_path):
+    csv = tmp_path / "wood.csv"
+    csv.write_text(
+        "Jahr,Baumart,Waldeigentum,Einschlagsursache: Wind,Einschlagsursache: Insekten\n"
+        "2006,Eiche,Privatwald,1,2\n"
+        "2006,Eiche,Insgesamt,3,4\n"
+        "2006,Buche,Insgesamt,5,1\n"
+        "2007,Eiche,Insgesamt,1,-\n"
+        "2007,Buche,Insgesamt,7,8\n"
+    )
+    return csv
+
+
+@pytest.fixture
+def analyzer(csv_file, tmp_path):
+    with DamagedLoggingAnalyzer(tmp_path / "plots") as analyzer:
+        analyzer.read_in_csv(csv_file)
+        analyzer.analyze()
+        yield analyzer
+
+
+def test_rank_amounts(analyzer):
+    ranking = analyzer.rank_amounts(["species", "reason"], ["species"])
+
+    assert list(ranking.columns) == ["species", "reason", "amount", "share", "rank"]
+    assert list(ranking["species"]) == ["Eiche", "Eiche", "Buche", "Buche"]
+    assert list(ranking["reason"]) == [
+        "Einschlagsursache: Wind",
+        "Einschlagsursache: Insekten",
+        "Einschlagsursache: Wind",
+        "Einschlagsursache: Insekten",
+    ]
+    assert list(ranking["amount"]) == [4, 4, 12, 9]
+    assert list(ranking["rank"]) == [1, 2, 1, 2]
+    assert list(ranking["share"]) == pytest.approx([0.5, 0.5, 12 / 21, 9 / 21])
+
+
+def test_rank_amounts_of_slice(analyzer):
+    ranking = analyzer.rank_amounts(["year", "owner"], years=(2006, 2006), owners=None, reasons=["Insekten"])
+
+    pd.testing.assert_frame_equal(
+        ranking,
+        pd.DataFrame(
+            {
+                "year": [2006, 2006],
+                "owner": ["Insgesamt", "Privatwald"],
+                "amount": [5.0, 2.0],
+                "share": [5 / 7, 2 / 7],
+                "rank": [1, 2],
+            }
+        ),
+        check_dtype=False,
+    )
+
+
+def test_rank_amounts_unknown_dimension_or_label(analyzer):
+    with pytest.raises(ValueError):
+        analyzer.rank_amounts(["region"])
+    with pytest.raises(ValueError):
+        analyzer.rank_amounts(["species"], ["reason"])
+    with pytest.raises(KeyError):
+        analyzer.rank_amounts(["species"], species=["Kiefer"])
+
+
+def test_rank_cli(csv_file, tmp_path):
+    ranking = tmp_path / "ranking.csv"
+    main([str(csv_file), "--no-cache", "--rank", "species", "--reasons", "Wind", "--ranking", str(ranking)])
+
+    assert ranking.read_text().splitlines() == ["species,amount,share,rank", "Buche,12.0,0.75,1", "Eiche,4.0,0.25,2"]
+
+
+def test_empty_and_short_series_are_skipped(tmp_path):
+    # Years in descending order, no year is contained in all series
+    rows = [f"{year},Eiche,Insgesamt,{year - 2000},-" for year in range(2020, 2008, -1)]
+    rows += [f"{year},Buche,Insgesamt,{year - 2000},{year - 1990}" for year in range(2008, 2012)]
+    csv = tmp_path / "wood.csv"
+    csv.write_text("Jahr,Baumart,Waldeigentum,Einschlagsursache: Wind,Einschlagsursache: Insekten\n" + "\n".join(rows))
+
+    with DamagedLoggingAnalyzer(tmp_path / "plots") as analyzer:
+        analyzer.read_in_csv(csv)
+        analyzer.analyze(plot_temporal_dependencies_all=True, predict_temporal_dependencies=True)
+        wind = analyzer.collect_temporal_dependencies("Eiche", "Einschlagsursache: Wind", "Insgesamt")
+        assert np.isnan(wind[0]) and list(wind[1:4]) == [9, 10, 11]
+        assert not analyzer.is_present("Eiche", "Einschlagsursache: Insekten", "Insgesamt")
+
+    plots = sorted(path.relative_to(tmp_path / "plots").as_posix() for path in tmp_path.glob("plots/**/plot.png"))
+    assert plots == [
+        "Buche/Insekten/Insgesamt/plot.png",
+        "Buche/Wind/Insgesamt/plot.png",
+        "Eiche/Wind/Insgesamt/plot.png",
+        "Prediction_2024/Eiche/Wind/Insgesamt/plot.png",
+    ]
+
+
+def test_combined_modes_extract_each_series_once(csv_file, tmp_path, monkeypatch):
+    extracted = []
+    collect = DamagedLoggingAnalyzer.collect_temporal_dependencies
+
+    def collect_and_count(self, species, reason, origin):
+        extracted.append((species, reason, origin))
+        return collect(self, species, reason, origin)
+
+    monkeypatch.setattr(DamagedLoggingAnalyzer, "collect_temporal_dependencies", collect_and_count)
+    with DamagedLoggingAnalyzer(tmp_path / "plots") as analyzer:
+        analyzer.read_in_csv(csv_file)
+        analyzer.analyze(
+            plot_temporal_dependencies_all=True, plot_owner_dependencies=True, plot_reason_dependencies=True
+        )
+
+    assert len(extracted) == len(set(extracted)) == 6
+    plots = sorted(path.relative_to(tmp_path / "plots").as_posix() for path in tmp_path.glob("plots/**/*.png"))
+    assert "Eiche/Wind/Privatwald/plot.png" in plots
+    assert len(plots) == 6 + 4 + 3
+
+
+def test_regions(tmp_path):
+    # One GENESIS export with two regions and one of a third region without region column
+    write_genesis_csv(tmp_path / "regions.csv", years=6, species=3, owners=2, reasons=3, regions=2, missing=0)
+    write_genesis_csv(tmp_path / "Hessen.csv", years=6, species=3, owners=2, reasons=3, seed=1, missing=0)
+
+    def series(region=None, jobs=1):
+        with DamagedLoggingAnalyzer(tmp_path / "plots") as analyzer:
+            analyzer.read_in_csvs([tmp_path / "regions.csv", tmp_path / "Hessen.csv"], jobs=jobs)
+            analyzer.analyze(region=region)
+            assert analyzer.get_labels()["region"] == ["Region 1", "Region 2", "Hessen"]
+            return analyzer.collect_temporal_dependencies("Insgesamt", "Einschlagsursache: Insgesamt", "Insgesamt")
+
+    regions = [series(region) for region in ["Region 1", "Region 2", "Hessen"]]
+    np.testing.assert_allclose(series(), np.sum(regions, axis=0))
+    np.testing.assert_array_equal(series(jobs=2), series())
+
+    # A single file, as the command line passes it, has no region named like the file
+    for read_in in [
+        lambda analyzer: analyzer.read_in_csv(tmp_path / "Hessen.csv"),
+        lambda analyzer: analyzer.read_in_csvs([tmp_path / "Hessen.csv"]),
+    ]:
+        with DamagedLoggingAnalyzer(tmp_path / "plots") as analyzer:
+            read_in(analyzer)
+            analyzer.analyze()
+            assert analyzer.get_labels()["region"] == []
+            np.testing.assert_array_equal(
+                analyzer.collect_temporal_dependencies("Insgesamt", "Einschlagsursache: Insgesamt", "Insgesamt"),
+                regions[2],
+            )
+            with pytest.raises(KeyError):
+                analyzer.analyze(region="Hessen")
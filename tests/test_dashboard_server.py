@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+from damagedlogginganalyzer.DamagedLoggingAnalyzer import DamagedLoggingAnalyzer
+from damagedlogginganalyzer.DashboardServer import DashboardServer
+
+__author__ = "HokageM"
+__copyright__ = "HokageM"
+__license__ = "MIT"
+
+
+@pytest.fixture
+def server(tmp_path):
+    rows = [f"{year},Eiche,Insgesamt,{(year - 2000) ** 2},-" for year in range(2020, 2002, -1)]
+    rows += [f"{year},Buche,Insgesamt,{year - 2000},{year - 1990}" for year in range(2003, 2006)]
+    csv = tmp_path / "wood.csv"
+    csv.write_text("Jahr,Baumart,Waldeigentum,Einschlagsursache: Wind,Einschlagsursache: Insekten\n" + "\n".join(rows))
+
+    with DamagedLoggingAnalyzer(tmp_path / "plots") as analyzer:
+        analyzer.read_in_csv(csv)
+        analyzer.analyze()
+        yield DashboardServer(analyzer)
+
+
+def get(server, path, query=""):
+    status, content_type, body = server.respond(path, query)
+    assert content_type == "application/json"
+    return status, json.loads(body)
+
+
+def test_labels_and_series(server):
+    status, labels = get(server, "/api/labels")
+    assert status == 200
+    assert labels["year"] == list(range(2003, 2021))
+    assert labels["species"] == ["Eiche", "Buche"]
+
+    status, series = get(server, "/api/series", "species=Buche&reason=Einschlagsursache:+Insekten&owner=Insgesamt")
+    assert status == 200
+    assert series["amounts"][:4] == [13, 14, 15, None]
+
+
+def test_forecast_is_cached(server):
+    query = "species=Eiche&reason=Einschlagsursache:+Wind&owner=Insgesamt"
+    status, forecast = get(server, "/api/forecast", query)
+    assert status == 200
+    assert forecast["degree"] == 1
+    assert forecast["forecast_2024"] > forecast["fit"][-1] > forecast["fit"][0]
+    assert len(forecast["fit"]) == 18
+
+    # The second request is answered from the cache
+    assert server.respond("/api/forecast", query) is server.respond("/api/forecast", query)
+
+    status, error = get(server, "/api/forecast", "species=Buche&reason=Einschlagsursache:+Wind&owner=Insgesamt")
+    assert status == 400
+    assert "3 values" in error["error"]
+
+
+def test_ranking_and_errors(server):
+    status, ranking = get(server, "/api/ranking", "group_by=species&reasons=Wind")
+    assert status == 200
+    assert [row["species"] for row in ranking] == ["Eiche", "Buche"]
+    assert [row["rank"] for row in ranking] == [1, 2]
+
+    assert get(server, "/api/ranking", "group_by=color")[0] == 400
+    assert get(server, "/api/series", "species=Kiefer&reason=Wind&owner=Insgesamt")[0] == 400
+    assert get(server, "/api/unknown")[0] == 404
+    status, content_type, page = server.respond("/")
+    assert content_type == "text/html"
+    # The labels of the CSV are set as text, not as HTML
+    assert b"<option>${" not in page and b"<td>${" not in page
@@ -0,0 +1,30 @@
+import numpy as np
+
+from damagedlogginganalyzer.CSVAnalyzer import CSVAnalyzer, is_genesis_csv
+
+from genesis_generator import write_genesis_csv
+
+__author__ = "HokageM"
+__copyright__ = "HokageM"
+__license__ = "MIT"
+
+
+def test_write_genesis_csv(tmp_path):
+    csv = tmp_path / "synthetic.csv"
+    dimension_keys = write_genesis_csv(csv, years=7, species=3, owners=4, reasons=5, regions=2, missing=0)
+    assert dimension_keys == ["Bundesland", "Jahr", "Baumart", "Waldeigentum"]
+    assert is_genesis_csv(csv)
+
+    with CSVAnalyzer() as analyzer:
+        analyzer.read_in_csv(csv, dimension_keys=dimension_keys)
+        cube, (regions, years, species, owners, reasons) = analyzer.get_dense_array(
+            dimension_keys, value_like="Einschlagsursache:"
+        )
+
+    assert cube.shape == (2, 7, 3, 4, 5)
+    assert list(years) == list(range(2006, 2013))
+    assert list(species)[-1] == list(owners)[-1] == "Insgesamt"
+    assert list(reasons)[-1] == "Einschlagsursache: Insgesamt"
+    # The totals are the sums of the other labels up to the rounding of the written values
+    np.testing.assert_allclose(cube[..., -1], cube[..., :-1].sum(axis=-1), atol=0.3)
+    np.testing.assert_allclose(cube[:, :, -1], cube[:, :, :-1].sum(axis=2), atol=0.3)
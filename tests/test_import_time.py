@@ -0,0 +1,55 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+__author__ = "HokageM"
+__copyright__ = "HokageM"
+__license__ = "MIT"
+
+CSV = Path(__file__).parents[1] / "data" / "DamagedLoggingWoodFixTable.csv"
+
+# Only a sanity bound, the CLI imports in well below 0.1 s, but slow or busy machines must not fail the test
+IMPORT_BUDGET_SECONDS = 5
+
+
+def run_python(code):
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return result.stdout.strip().splitlines()[-1]
+
+
+def test_import_loads_no_heavy_dependencies():
+    loaded, seconds = run_python(
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import damagedlogginganalyzer.main\n"
+        "seconds = time.perf_counter() - start\n"
+        "print([module for module in ['pandas', 'matplotlib', 'sklearn'] if module in sys.modules], seconds)"
+    ).rsplit(" ", 1)
+    assert loaded == "[]"
+    assert float(seconds) < IMPORT_BUDGET_SECONDS
+
+
+@pytest.mark.parametrize("args", [["--version"], ["--help"]])
+def test_cli_without_mode_imports_no_heavy_dependencies(args):
+    loaded = run_python(
+        "import sys\n"
+        "from damagedlogginganalyzer.main import main\n"
+        "try:\n"
+        f"    main({args!r})\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "print([module for module in ['numpy', 'pandas', 'matplotlib', 'sklearn'] if module in sys.modules])"
+    )
+    assert loaded == "[]"
+
+
+def test_analysis_without_plots_imports_no_plotting_or_ml_dependencies():
+    loaded = run_python(
+        "import sys\n"
+        "from damagedlogginganalyzer.main import main\n"
+        f"main([{str(CSV)!r}, '--no-cache', '--calculate-most-dangerous-reasons'])\n"
+        "print([module for module in ['matplotlib', 'sklearn'] if module in sys.modules])"
+    )
+    assert loaded == "[]"
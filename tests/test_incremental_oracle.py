@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from damagedlogginganalyzer.IncrementalOracle import IncrementalOracle
+from damagedlogginganalyzer.WoodOracle import WoodOracle
+
+__author__ = "HokageM"
+__copyright__ = "HokageM"
+__license__ = "MIT"
+
+
+@pytest.fixture
+def series():
+    x = np.arange(2003, 2024, dtype=float).reshape(-1, 1)
+    t = x.ravel() - 2003
+    rng = np.random.RandomState(0)
+    y = np.stack([10 + t, 50 - 2 * t + 0.3 * t**2, rng.normal(100, 20, len(t))]) + rng.normal(0, 1, (3, len(t)))
+    y[2, 4] = np.nan
+    return x, y, ["a", "b", "c"]
+
+
+@pytest.mark.parametrize("search", ["grid", "pruned"])
+def test_appended_years_equal_a_full_refit(series, tmp_path, search):
+    x, y, keys = series
+    state_path = tmp_path / "state.npz"
+    IncrementalOracle(state_path, search=search).fit_many(x[:-3], y[:, :-3], keys)
+
+    oracle = IncrementalOracle(state_path, search=search)
+    results = oracle.fit_many(x, y, keys)
+    state, rows = oracle.update(x, y, keys)
+    assert state["positions"].tolist() == [len(x)] * 3
+
+    updated = oracle.select_state_degrees(state, rows)
+    assert oracle.check_refit(x, y, state, updated[1:]) < 1e-6
+
+    refitted = IncrementalOracle(search=search).fit_many(x, y, keys)
+    for result, expected in zip(results, refitted):
+        assert result["degree"] == expected["degree"]
+        np.testing.assert_allclose(result["predictions"], expected["predictions"], rtol=1e-6)
+        np.testing.assert_allclose(result["test_errors"], expected["test_errors"], rtol=1e-6, atol=1e-9)
+
+
+def test_changed_and_new_series_are_fitted_again(series, tmp_path):
+    x, y, keys = series
+    oracle = IncrementalOracle(tmp_path / "state.npz")
+    oracle.fit_many(x[:-1], y[:2, :-1], keys[:2])
+
+    y = y.copy()
+    y[0, 0] += 5
+    results = oracle.fit_many(x, y, keys)
+    refitted = IncrementalOracle().fit_many(x, y, keys)
+    for result, expected in zip(results, refitted):
+        np.testing.assert_allclose(result["predictions"], expected["predictions"], rtol=1e-6)
+
+    # Other years start a new state
+    state, _ = IncrementalOracle(tmp_path / "state.npz").update(x[1:], y[:, 1:], keys)
+    assert state["years"][0] == 2004
+
+
+def test_wood_oracle_incremental_engine(series, tmp_path):
+    x, y, _ = series
+    keys = [{"species": "Eiche", "reason": "Insekten", "owner": owner} for owner in ["A", "B", "C"]]
+    oracle = WoodOracle("incremental", state_path=tmp_path / "state.npz", check_incremental=True)
+    train_predict, train_score, value_2024, degree = oracle.predict_many(x, y, keys)
+
+    assert train_predict.shape == y.shape
+    expected = IncrementalOracle().fit_many(x, y, ["a", "b", "c"])
+    np.testing.assert_allclose(value_2024, [result["predictions"][-1] for result in expected])
+    assert degree.tolist() == [result["degree"] for result in expected]
+    assert [row["owner"] for row in oracle.results] == ["A", "B", "C"]
+    assert (tmp_path / "state.npz").exists()
+
+
+def test_folds_with_one_validation_value_are_left_out():
+    # With one of 18 years missing, the fold of the missing year has only 1 validation value
+    x = np.arange(2006, 2024, dtype=float).reshape(-1, 1)
+    t = x.ravel() - 2006
+    y = np.stack([50 - 2 * t + 0.3 * t**2 + np.random.RandomState(0).normal(0, 1, len(t))])
+    y[0, 3] = np.nan
+
+    oracle = IncrementalOracle(degrees=[1, 2, 3])
+    assert oracle.scored_folds(~np.isnan(y[0])) == 8
+    result = oracle.fit_many(x, y, ["a"])[0]
+    assert np.isfinite(result["test_errors"]).all()
+    assert result["degree"] == oracle.degrees[np.argmin(result["test_errors"])]
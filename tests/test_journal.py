@@ -0,0 +1,86 @@
+import csv
+
+import pytest
+
+from damagedlogginganalyzer.DamagedLoggingAnalyzer import DamagedLoggingAnalyzer
+from damagedlogginganalyzer.Journal import Journal, shard_of
+
+__author__ = "HokageM"
+__copyright__ = "HokageM"
+__license__ = "MIT"
+
+UNITS = [("Eiche", f"Einschlagsursache: {reason}", owner) for reason in ["Wind", "Insekten"] for owner in "ABCDE"]
+
+
+def test_shards_split_the_units():
+    shards = [shard_of(unit, 3) for unit in UNITS]
+    assert shards == [shard_of(unit, 3) for unit in UNITS]
+    assert all(0 <= shard < 3 for shard in shards)
+
+    owners = [[unit for unit in UNITS if Journal("unused", (idx, 3)).owns(unit)] for idx in range(3)]
+    assert sorted(unit for units in owners for unit in units) == sorted(UNITS)
+
+    with pytest.raises(ValueError):
+        Journal("unused", (3, 3))
+
+
+def test_resume_skips_committed_units(tmp_path):
+    with Journal(tmp_path) as journal:
+        journal.start("a")
+        journal.add("predict", UNITS[0], {"value": 1})
+        journal.commit()
+        journal.add("predict", UNITS[1], {"value": 2})
+    # An interrupted write leaves an incomplete record
+    with open(tmp_path / "journal.jsonl", "a") as file:
+        file.write('{"mode": "predict", "unit": ["Ei')
+
+    with Journal(tmp_path, resume=True) as journal:
+        journal.start("a")
+        assert not journal.is_pending("predict", UNITS[0])
+        assert journal.is_pending("predict", UNITS[1])
+        assert journal.results("predict") == [{"value": 1}]
+        journal.add("predict", UNITS[1], {"value": 2})
+        journal.commit()
+
+    with Journal(tmp_path, resume=True) as journal:
+        journal.start("a")
+        assert journal.results("predict") == [{"value": 1}, {"value": 2}]
+
+    # Other data or options start a new journal
+    with Journal(tmp_path, resume=True) as journal:
+        journal.start("b")
+        assert journal.is_pending("predict", UNITS[0])
+
+
+def test_merged_shards_equal_a_full_run(tmp_path):
+    rows = [
+        f"{year},Eiche,{owner},{(year - 2000) * (idx + 1)},{(year - 1990) ** 2 + idx}"
+        for year in range(2020, 2002, -1)
+        for idx, owner in enumerate("ABCDE")
+    ]
+    csv_path = tmp_path / "wood.csv"
+    csv_path.write_text(
+        "Jahr,Baumart,Waldeigentum,Einschlagsursache: Wind,Einschlagsursache: Insekten\n" + "\n".join(rows)
+    )
+
+    def run(out_dir, shard=None, resume=False):
+        forecasts = out_dir / "forecasts.csv"
+        with DamagedLoggingAnalyzer(out_dir, journal=Journal(out_dir, shard, resume)) as analyzer:
+            analyzer.read_in_csv(csv_path)
+            analyzer.analyze(predict_temporal_dependencies=True)
+            analyzer.write_forecasts(forecasts)
+        with open(forecasts, newline="") as file:
+            return sorted(tuple(row.values()) for row in csv.DictReader(file))
+
+    full = run(tmp_path / "full")
+    assert len(full) == len(UNITS)
+
+    merged = tmp_path / "merged"
+    merged.mkdir()
+    shard_rows = []
+    for idx in range(2):
+        shard_dir = tmp_path / f"shard-{idx}"
+        shard_rows += run(shard_dir, (idx, 2))
+        (merged / f"journal-{idx}-of-2.jsonl").write_bytes((shard_dir / f"journal-{idx}-of-2.jsonl").read_bytes())
+    assert sorted(shard_rows) == full
+    assert run(merged, resume=True) == full
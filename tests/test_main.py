@@ -0,0 +1,59 @@
+from pathlib import Path
+
+import pytest
+
+from damagedlogginganalyzer import __version__
+from damagedlogginganalyzer.main import main
+
+__author__ = "HokageM"
+__copyright__ = "HokageM"
+__license__ = "MIT"
+
+DATA = Path(__file__).parents[1] / "data"
+
+
+def test_version(capsys):
+    with pytest.raises(SystemExit):
+        main(["--version"])
+    assert f"DamagedLoggingAnalyzer {__version__}" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize(
+    "option, error",
+    [
+        (["--folds", "1"], "argument --folds: 1 is less than 2"),
+        (["--folds", "two"], "argument --folds: 'two' is not an integer"),
+        (["--patience", "0"], "argument --patience: 0 is less than 1"),
+        (["--degrees", "1", "0"], "argument --degrees: 0 is less than 1"),
+        (["--degrees", "1", "3", "1"], "argument --degrees: [1, 3, 1] repeats a degree"),
+    ],
+)
+def test_invalid_options(option, error, capsys):
+    with pytest.raises(SystemExit):
+        main([str(DATA / "DamagedLoggingWoodFixTable.csv"), *option])
+    assert error in capsys.readouterr().err
+
+
+@pytest.mark.parametrize(
+    "csv, most_dangerous",
+    [
+        ("DamagedLoggingWoodFixTable.csv", "Einschlagsursache: Sonstiges: 218181.0"),
+        ("DamagedLoggingOriginal.csv", "Einschlagsursache: Insgesamt: 407266.8"),
+    ],
+)
+def test_calculate_most_dangerous_reasons(csv, most_dangerous, capsys, tmp_path):
+    main([str(DATA / csv), "--no-cache", "--out-dir", str(tmp_path), "--calculate-most-dangerous-reasons"])
+    out = capsys.readouterr().out
+    assert f"Most dangerous reasons for Insgesamt:\n{most_dangerous}" in out
+
+
+def test_log_level(capsys, tmp_path):
+    csv = str(DATA / "DamagedLoggingWoodFixTable.csv")
+    main([csv, "--no-cache", "--out-dir", str(tmp_path), "--log-level", "WARNING", "--plot-owner-dependencies"])
+    assert capsys.readouterr().out == "DamagedLoggingAnalyzer! Pow Pow\n"
+
+    # The result of a mode is printed at all levels
+    main([csv, "--no-cache", "--log-level", "WARNING", "--calculate-most-dangerous-reasons"])
+    out = capsys.readouterr().out
+    assert out.startswith("DamagedLoggingAnalyzer! Pow Pow\nMost dangerous reasons for Eiche und Roteiche:\n")
+    assert "Most dangerous reasons for Insgesamt:\nEinschlagsursache: Sonstiges: 218181.0" in out
@@ -0,0 +1,43 @@
+import numpy as np
+
+from damagedlogginganalyzer.ModelStore import ModelStore
+
+__author__ = "HokageM"
+__copyright__ = "HokageM"
+__license__ = "MIT"
+
+
+def result(degree):
+    return {
+        "degree": degree,
+        "train_score": 0.5,
+        "test_errors": np.arange(3.0),
+        "predictions": np.full(4, float(degree)),
+    }
+
+
+def test_put_and_get_many(tmp_path):
+    with ModelStore(tmp_path / "models.sqlite") as store:
+        store.put_many({"a": result(1), "b": dict(result(2), coefficients=np.ones(3), center=2015.0, scale=9.0)})
+
+    with ModelStore(tmp_path / "models.sqlite") as store:
+        stored = store.get_many(["a", "b", "c"])
+    assert set(stored) == {"a", "b"}
+    assert stored["a"]["degree"] == 1 and stored["a"]["coefficients"] is None
+    np.testing.assert_array_equal(stored["b"]["predictions"], np.full(4, 2.0))
+    np.testing.assert_array_equal(stored["b"]["coefficients"], np.ones(3))
+    assert stored["b"]["center"] == 2015.0
+
+    with ModelStore(tmp_path / "models.sqlite", rebuild=True) as store:
+        assert store.get_many(["a", "b"]) == {}
+
+
+def test_least_recently_used_results_are_evicted(tmp_path):
+    with ModelStore(tmp_path / "models.sqlite", max_entries=2) as store:
+        store.put_many({"a": result(1)})
+        store.put_many({"b": result(2)})
+        store.get_many(["a"])
+        store.put_many({"c": result(3)})
+
+        assert len(store) == 2
+        assert set(store.get_many(["a", "b", "c"])) == {"a", "c"}
@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+
+from sklearn.linear_model import LinearRegression
+from sklearn.model_selection import KFold
+
+from damagedlogginganalyzer.Oracle import Oracle
+
+__author__ = "HokageM"
+__copyright__ = "HokageM"
+__license__ = "MIT"
+
+
+@pytest.fixture
+def series():
+    x = np.arange(2006, 2024, dtype=float).reshape(-1, 1)
+    rng = np.random.RandomState(42)
+    t = x.ravel() - 2006
+    return x, 100 + 3 * t - 0.4 * t**2 + rng.normal(0, 5, len(t))
+
+
+@pytest.mark.parametrize("n_samples", [18, 20, 25])
+def test_k_fold_masks_equal_sklearn(n_samples):
+    oracle = Oracle()
+    train_masks = oracle.k_fold_masks(n_samples)
+    kf = KFold(n_splits=oracle.k_splits, shuffle=True, random_state=0)
+    for train_mask, (train_index, _) in zip(train_masks, kf.split(np.zeros(n_samples))):
+        np.testing.assert_array_equal(np.flatnonzero(train_mask), train_index)
+
+
+@pytest.mark.parametrize("search", ["grid", "pruned"])
+def test_numpy_engine_equals_sklearn_engine(series, search):
+    x, y = series
+    numpy_oracle = Oracle(search=search)
+    sklearn_oracle = Oracle("sklearn", search=search)
+    assert numpy_oracle.engine == "numpy" and numpy_oracle.degrees == list(range(1, 15))
+
+    numpy_model, numpy_degree, numpy_score = numpy_oracle.k_fold_cross_validation(x, y)
+    sklearn_model, sklearn_degree, sklearn_score = sklearn_oracle.k_fold_cross_validation(x, y)
+
+    assert numpy_degree == sklearn_degree
+    assert numpy_score == pytest.approx(sklearn_score, rel=1e-6)
+    numpy_errors, sklearn_errors = (
+        [oracle.results[-1][f"cv_error_degree_{degree}"] for degree in oracle.degrees]
+        for oracle in [numpy_oracle, sklearn_oracle]
+    )
+    np.testing.assert_allclose(numpy_errors, sklearn_errors, rtol=1e-6)
+    np.testing.assert_allclose(numpy_model.predict(x), sklearn_model.predict(x), rtol=1e-5)
+    np.testing.assert_allclose(numpy_model.predict([[2024]]), sklearn_model.predict([[2024]]), rtol=1e-5)
+
+
+def test_numpy_engine_fits_like_linear_regression(series):
+    x, y = series
+    y = np.column_stack([y, (x.ravel() - 2015) ** 3, np.ones(len(x))])
+    oracle = Oracle()
+    coefficients = oracle.fit_degree(x, y, 3)
+
+    assert coefficients.shape == (10, 15, 3)
+    assert (coefficients[:, 4:] == 0).all()
+    basis = np.vander(x.ravel(), 4, increasing=True)
+    for idx in range(y.shape[1]):
+        model = LinearRegression().fit(basis, y[:, idx])
+        np.testing.assert_allclose(basis @ coefficients[-1, :4, idx], model.predict(basis), rtol=1e-6, atol=1e-4)
+
+
+def test_pruned_search_skips_degrees(series):
+    x, y = series
+    # The raw design of the centered years has full rank up to degree 8
+    x = x - 2015
+    grid = Oracle()
+    pruned = Oracle(search="pruned", patience=2)
+    grid_idx, grid_errors, _, _ = grid.select_degrees(x, y.reshape(-1, 1))
+    best_idx, a_test_errors, train_scores, _ = pruned.select_degrees(x, y.reshape(-1, 1))
+
+    # The evaluated degrees equal the grid search, the search stops 2 degrees after the best one
+    evaluated = ~np.isnan(a_test_errors[:, 0])
+    assert evaluated[: best_idx[0] + 1].all() and evaluated.sum() == best_idx[0] + 3
+    np.testing.assert_allclose(a_test_errors[evaluated], grid_errors[evaluated])
+    assert np.isnan(train_scores[~evaluated]).all()
+
+    pruned.k_fold_cross_validation(x, y, {"species": "Eiche"})
+    skipped = pruned.results[-1]["skipped_degrees"].split()
+    assert skipped == [str(degree) for degree in pruned.degrees[best_idx[0] + 3 :]]
+
+
+def test_pruned_search_caps_degrees_by_rank():
+    # 10 training samples per fold determine polynomials up to degree 9, the powers of the raw years only up to degree 2
+    x = np.arange(2004, 2024, dtype=float).reshape(-1, 1)
+    oracle = Oracle(k_splits=2, degrees=range(1, 13), search="pruned", patience=20)
+    np.testing.assert_array_equal(oracle.full_rank_degrees(x), np.arange(1, 13) <= 2)
+    np.testing.assert_array_equal(oracle.full_rank_degrees(x - 2014), np.arange(1, 13) <= 9)
+    _, a_test_errors, _, _ = oracle.select_degrees(x - 2014, np.sin(x))
+    assert np.isnan(a_test_errors[9:]).all() and not np.isnan(a_test_errors[:9]).any()
+
+    with pytest.raises(ValueError):
+        Oracle(search="random")
+
+
+def test_degrees_without_validation_error_are_refused():
+    oracle = Oracle(search="grid")
+    errors = np.array([[0.5, np.nan], [0.2, np.nan], [np.nan, np.nan]])
+    with pytest.raises(ValueError):
+        oracle.best_degree_indices(errors)
+    assert oracle.best_degree_indices(errors[:, :1]).tolist() == [1]
+
+    # 10 samples in 9 folds leave 1 fold with 2 validation samples, 11 samples leave 2
+    assert oracle.scored_folds(np.ones(10, dtype=bool)) == 1
+    assert not oracle.can_cross_validate(np.ones(10, dtype=bool))
+    assert oracle.can_cross_validate(np.ones(11, dtype=bool))
@@ -0,0 +1,168 @@
+import json
+import re
+
+import numpy as np
+import pytest
+
+from damagedlogginganalyzer.Plotter import Plotter, figure_template
+
+__author__ = "HokageM"
+__copyright__ = "HokageM"
+__license__ = "MIT"
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_plots_are_saved(tmp_path, jobs):
+    x = np.arange(2006, 2024, dtype=float)
+    amounts = np.linspace(0, 10, len(x))
+
+    with Plotter(tmp_path, jobs) as plotter:
+        plotter.set_x_axis(x)
+        plotter.plot_temporal_dependencies(
+            amounts, "Eiche und Roteiche", "Einschlagsursache: Wind/ Sturm", "Privatwald"
+        )
+        plotter.plot_temporal_dependencies_from_species_reason_dict(
+            {"Einschlagsursache: Insekten": amounts, "Einschlagsursache: Sonstiges": amounts[::-1]},
+            "Eiche",
+            "Privatwald",
+        )
+        plotter.plot_temporal_dependencies_from_species_owner_dict({"Privatwald": amounts}, "Eiche", "Insekten")
+        plotter.plot_predictions(
+            amounts, amounts, 0.5, np.array([11.0]), 1, "Eiche", "Einschlagsursache: Insekten", "Privatwald"
+        )
+
+    assert (tmp_path / "Eiche_und_Roteiche/Wind__Sturm/Privatwald/plot.png").exists()
+    assert (tmp_path / "Eiche/all_reasons/Privatwald/plot.png").exists()
+    assert (tmp_path / "Eiche/Insekten/all_owners/plot.png").exists()
+    assert (tmp_path / "Prediction_2024/Eiche/Insekten/Privatwald/plot.png").exists()
+
+
+def test_unchanged_plots_are_skipped_and_stale_plots_pruned(tmp_path):
+    x = np.arange(2006, 2024, dtype=float)
+    amounts = np.linspace(0, 10, len(x))
+    plot = tmp_path / "Eiche/Insekten/Privatwald/plot.png"
+    stale_plot = tmp_path / "Buche/Insekten/Privatwald/plot.png"
+
+    with Plotter(tmp_path) as plotter:
+        plotter.set_x_axis(x)
+        plotter.plot_temporal_dependencies(amounts, "Eiche", "Insekten", "Privatwald")
+        plotter.plot_temporal_dependencies(amounts, "Buche", "Insekten", "Privatwald")
+    assert stale_plot.exists()
+    modified = plot.stat().st_mtime_ns
+
+    with Plotter(tmp_path) as plotter:
+        plotter.set_x_axis(x)
+        plotter.plot_temporal_dependencies(amounts, "Eiche", "Insekten", "Privatwald")
+    assert plot.stat().st_mtime_ns == modified
+    assert not stale_plot.exists()
+    assert not (tmp_path / "Buche").exists()
+
+    with Plotter(tmp_path) as plotter:
+        plotter.set_x_axis(x)
+        plotter.plot_temporal_dependencies(amounts + 1, "Eiche", "Insekten", "Privatwald")
+    assert plot.stat().st_mtime_ns != modified
+
+
+@pytest.mark.parametrize(
+    "output, file_name", [("svg", "plot.svg"), ("pdf", "plot.pdf"), ("thumbnail", "thumbnail.png")]
+)
+def test_plot_outputs(tmp_path, output, file_name):
+    x = np.arange(2006, 2024, dtype=float)
+    amounts = np.linspace(0, 10, len(x))
+
+    with Plotter(tmp_path / "png") as plotter:
+        plotter.set_x_axis(x)
+        plotter.plot_temporal_dependencies(amounts, "Eiche", "Insekten", "Privatwald")
+    with Plotter(tmp_path / "png", output=output) as plotter:
+        plotter.set_x_axis(x)
+        plotter.plot_temporal_dependencies(amounts, "Eiche", "Insekten", "Privatwald")
+
+    # The plots of the other outputs are not pruned
+    assert (tmp_path / "png/Eiche/Insekten/Privatwald/plot.png").exists()
+    plot = tmp_path / "png/Eiche/Insekten/Privatwald" / file_name
+    assert plot.exists()
+    if output == "thumbnail":
+        assert plot.stat().st_size < (tmp_path / "png/Eiche/Insekten/Privatwald/plot.png").stat().st_size
+
+
+def test_multipage_output(tmp_path):
+    x = np.arange(2006, 2024, dtype=float)
+    amounts = np.linspace(0, 10, len(x))
+
+    with Plotter(tmp_path, jobs=2, output="multipage") as plotter:
+        plotter.set_x_axis(x)
+        for species in ["Eiche", "Buche", "Kiefer"]:
+            plotter.plot_temporal_dependencies(amounts, species, "Insekten", "Privatwald")
+        plotter.plot_temporal_dependencies_from_species_owner_dict({"Privatwald": amounts}, "Eiche", "Insekten")
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["all_owners.pdf", "temporal_dependencies.pdf"]
+    assert (
+        re.search(rb"/Type /Pages[^>]*/Count (\d+)", (tmp_path / "temporal_dependencies.pdf").read_bytes())[1] == b"3"
+    )
+    assert re.search(rb"/Type /Pages[^>]*/Count (\d+)", (tmp_path / "all_owners.pdf").read_bytes())[1] == b"1"
+
+
+def test_unknown_output(tmp_path):
+    with pytest.raises(ValueError):
+        Plotter(tmp_path, output="gif")
+
+
+def test_reused_figures_match_new_figures(tmp_path):
+    x = np.arange(2006, 2024, dtype=float)
+    amounts = np.linspace(0, 10, len(x))
+
+    figure_template.cache_clear()
+    with Plotter(tmp_path / "reused", rebuild=True) as plotter:
+        plotter.set_x_axis(x)
+        plotter.plot_temporal_dependencies(amounts * 100, "Buche", "Insekten", "Privatwald")
+        plotter.plot_predictions(amounts, amounts, 0.5, np.array([11.0]), 1, "Buche", "Insekten", "Privatwald")
+        plotter.plot_temporal_dependencies(amounts[::-1], "Eiche", "Insekten", "Privatwald")
+        plotter.plot_predictions(amounts[::-1], amounts, 0.7, np.array([2.0]), 3, "Eiche", "Insekten", "Privatwald")
+    assert figure_template.cache_info().currsize == 2
+
+    figure_template.cache_clear()
+    with Plotter(tmp_path / "new", rebuild=True) as plotter:
+        plotter.set_x_axis(x)
+        plotter.plot_temporal_dependencies(amounts[::-1], "Eiche", "Insekten", "Privatwald")
+        plotter.plot_predictions(amounts[::-1], amounts, 0.7, np.array([2.0]), 3, "Eiche", "Insekten", "Privatwald")
+
+    for plot in ["Eiche/Insekten/Privatwald/plot.png", "Prediction_2024/Eiche/Insekten/Privatwald/plot.png"]:
+        assert (tmp_path / "reused" / plot).read_bytes() == (tmp_path / "new" / plot).read_bytes()
+
+
+def test_writer_threads_match_direct_writes(tmp_path):
+    x = np.arange(2006, 2024, dtype=float)
+    amounts = np.linspace(0, 10, len(x))
+    for writers in [0, 2]:
+        with Plotter(tmp_path / str(writers), writers=writers, queue_size=1) as plotter:
+            plotter.set_x_axis(x)
+            for origin in ["Privatwald", "Staatswald", "Insgesamt"]:
+                plotter.plot_temporal_dependencies(amounts, "Eiche", "Insekten", origin)
+
+    for origin in ["Privatwald", "Staatswald", "Insgesamt"]:
+        plot = f"Eiche/Insekten/{origin}/plot.png"
+        assert (tmp_path / "0" / plot).read_bytes() == (tmp_path / "2" / plot).read_bytes()
+
+    # Other options render the plots again
+    with Plotter(tmp_path / "0", png_compression=0, dpi=50) as plotter:
+        plotter.set_x_axis(x)
+        plotter.plot_temporal_dependencies(amounts, "Eiche", "Insekten", "Privatwald")
+    assert (tmp_path / "0/Eiche/Insekten/Privatwald/plot.png").read_bytes() != (tmp_path / "2" / plot).read_bytes()
+
+
+def test_write_errors_are_raised_by_wait(tmp_path):
+    x = np.arange(2006, 2024, dtype=float)
+    # A file blocks the directory of the plot
+    (tmp_path / "Eiche").write_text("")
+
+    plotter = Plotter(tmp_path)
+    plotter.set_x_axis(x)
+    plotter.plot_temporal_dependencies(np.ones(len(x)), "Eiche", "Insekten", "Privatwald")
+    plotter.plot_temporal_dependencies(np.ones(len(x)), "Buche", "Insekten", "Privatwald")
+    with pytest.raises(OSError, match="Could not write 1 of the plots"):
+        plotter.wait()
+    plotter.close()
+
+    # Only the written plot is recorded in the manifest, so the other one is rendered again by the next run
+    assert (tmp_path / "Buche/Insekten/Privatwald/plot.png").exists()
+    assert list(json.loads((tmp_path / "manifest.json").read_text())) == ["Buche/Insekten/Privatwald/plot.png"]
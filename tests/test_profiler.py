@@ -0,0 +1,49 @@
+import json
+import pstats
+
+from damagedlogginganalyzer.main import main
+from damagedlogginganalyzer.Profiler import NO_STAGE, Profiler
+
+__author__ = "HokageM"
+__copyright__ = "HokageM"
+__license__ = "MIT"
+
+
+def test_disabled_profiler_records_nothing():
+    profiler = Profiler()
+    assert profiler.stage("load") is NO_STAGE
+    with profiler.stage("load"):
+        profiler.add("savefig", 1.0, 1.0)
+    assert profiler.report()["stages"] == {}
+
+
+def test_nested_stages(tmp_path):
+    with Profiler(memory=True, profile_dir=tmp_path) as profiler:
+        for _ in range(2):
+            with profiler.stage("predict"):
+                with profiler.stage("fit"):
+                    data = bytearray(1 << 20)
+                del data
+                profiler.add("savefig", 0.5, 0.25)
+
+    stages = profiler.report()["stages"]
+    assert list(stages) == ["predict", "predict/fit", "predict/savefig"]
+    assert stages["predict"]["calls"] == stages["predict/fit"]["calls"] == stages["predict/savefig"]["calls"] == 2
+    assert stages["predict/savefig"]["wall_seconds"] == 1.0
+    assert stages["predict/fit"]["peak_traced_bytes"] >= 1 << 20
+    assert stages["predict"]["peak_traced_bytes"] >= 1 << 20
+    assert "predict.fit.prof" in {file.name for file in tmp_path.iterdir()}
+    pstats.Stats(str(tmp_path / "predict.fit.prof"))
+
+
+def test_timings_json(tmp_path):
+    timings = tmp_path / "timings.json"
+    csv = tmp_path / "wood.csv"
+    csv.write_text(
+        "Jahr,Baumart,Waldeigentum,Einschlagsursache: Wind\n" "2006,Eiche,Insgesamt,1\n" "2007,Eiche,Insgesamt,2\n"
+    )
+    main([str(csv), "--no-cache", "--calculate-most-dangerous-reasons", "--timings-json", str(timings)])
+
+    stages = json.loads(timings.read_text())["stages"]
+    assert list(stages) == ["read_in_csv", "get_dense_array", "calculate_most_dangerous_reasons"]
+    assert all(stage["calls"] == 1 and stage["wall_seconds"] >= 0 for stage in stages.values())
@@ -0,0 +1,181 @@
+import json
+
+import numpy as np
+import pytest
+
+from sklearn.model_selection import KFold
+from sklearn.preprocessing import PolynomialFeatures
+
+from damagedlogginganalyzer.ModelStore import ModelStore
+from damagedlogginganalyzer.Oracle import Oracle
+from damagedlogginganalyzer.WoodOracle import WoodOracle
+
+__author__ = "HokageM"
+__copyright__ = "HokageM"
+__license__ = "MIT"
+
+
+@pytest.mark.parametrize("engine", ["numpy", "sklearn"])
+def test_predict_many_equals_predict_wood_logging(engine):
+    x = np.arange(2006, 2024, dtype=float).reshape(-1, 1)
+    t = x.ravel() - 2006
+    rng = np.random.RandomState(0)
+    y = np.stack([10 + t, 50 - 2 * t + 0.3 * t**2, rng.normal(100, 20, len(t))]) + rng.normal(0, 1, (3, len(t)))
+
+    oracle = WoodOracle(engine)
+    oracle.degrees = [1, 2, 3]
+    train_predict, train_score, value_2024, degree = oracle.predict_many(x, y)
+
+    assert train_predict.shape == y.shape
+    for idx, series in enumerate(y):
+        expected = oracle.predict_wood_logging(x, series, "Eiche", "Insekten", "Privatwald")
+        np.testing.assert_allclose(train_predict[idx], expected[0], rtol=1e-9)
+        assert train_score[idx] == pytest.approx(expected[1])
+        assert value_2024[idx] == pytest.approx(expected[2][0])
+        assert degree[idx] == expected[3]
+
+
+def test_predict_many_results_table(tmp_path):
+    x = np.arange(2006, 2024, dtype=float).reshape(-1, 1)
+    y = np.stack([10 + x.ravel() - 2006, np.full(len(x), 5.0)])
+    keys = [{"species": "Eiche", "reason": "Insekten", "owner": owner} for owner in ["Privatwald", "Insgesamt"]]
+
+    oracle = WoodOracle()
+    _, train_score, value_2024, degree = oracle.predict_many(x, y, keys)
+
+    assert [row["owner"] for row in oracle.results] == ["Privatwald", "Insgesamt"]
+    assert [row["best_degree"] for row in oracle.results] == list(degree)
+    assert [row["forecast_2024"] for row in oracle.results] == pytest.approx(value_2024)
+    assert [row["train_r2"] for row in oracle.results] == pytest.approx(train_score)
+    assert len([column for column in oracle.results[0] if column.startswith("cv_error_degree_")]) == 14
+
+    # Forecasts, which are not recorded, e.g. of the dashboard, leave the results table as it is
+    oracle.predict_many(x, y, keys, record=False)
+    assert len(oracle.results) == 2
+
+    oracle.write_results(tmp_path / "forecasts.json")
+    oracle.write_results(tmp_path / "forecasts.csv")
+    written = json.loads((tmp_path / "forecasts.json").read_text())
+    assert [row["owner"] for row in written] == ["Privatwald", "Insgesamt"]
+    assert [row["forecast_2024"] for row in written] == pytest.approx(value_2024)
+    assert (tmp_path / "forecasts.csv").read_text().startswith("species,reason,owner,best_degree,train_r2,")
+
+
+@pytest.mark.parametrize("engine", ["numpy", "sklearn"])
+def test_predict_many_with_model_store(engine, tmp_path, monkeypatch):
+    x = np.arange(2006, 2024, dtype=float).reshape(-1, 1)
+    rng = np.random.RandomState(0)
+    y = rng.normal(100, 20, (3, len(x)))
+
+    oracle = WoodOracle(engine)
+    oracle.degrees = [1, 2, 3]
+    expected = oracle.predict_many(x, y)
+
+    with ModelStore(tmp_path / "models.sqlite") as store:
+        oracle = WoodOracle(engine, store=store)
+        oracle.degrees = [1, 2, 3]
+        oracle.predict_many(x, y)
+
+        # Only the changed series is fitted again
+        fit_many = oracle.fit_many
+        fitted = []
+        monkeypatch.setattr(oracle, "fit_many", lambda x, y, *args: fitted.append(len(y)) or fit_many(x, y, *args))
+        y[1, 0] += 1
+        changed = oracle.predict_many(x, y)
+        assert fitted == [1]
+
+        y[1, 0] -= 1
+        cached = oracle.predict_many(x, y)
+        assert fitted == [1]
+
+    assert not np.allclose(changed[0][1], expected[0][1])
+    for cached_array, expected_array in zip(cached, expected):
+        np.testing.assert_array_equal(cached_array, expected_array)
+    assert oracle.results[-3:] == oracle.results[:3]
+
+
+def test_predict_many_does_not_depend_on_the_batch():
+    # The model store and the shards of the journal reuse the models of series, which were fitted in other batches
+    x = np.arange(2006, 2024, dtype=float).reshape(-1, 1)
+    y = np.random.RandomState(0).normal(0, 20, (11, len(x))).cumsum(axis=1)
+
+    oracle = WoodOracle()
+    batch = oracle.fit_many(x, y)
+    for idx, result in enumerate(batch):
+        for key, value in oracle.fit_many(x, y[idx : idx + 1])[0].items():
+            np.testing.assert_array_equal(value, result[key])
+
+
+def test_sklearn_engine_shares_the_design_of_a_batch(monkeypatch):
+    x = np.arange(2006, 2024, dtype=float).reshape(-1, 1)
+    y = np.random.RandomState(0).normal(0, 20, (4, len(x))).cumsum(axis=1)
+    oracle = WoodOracle("sklearn", degrees=[1, 2, 3])
+
+    designs = []
+    fit_transform = PolynomialFeatures.fit_transform
+    monkeypatch.setattr(
+        PolynomialFeatures,
+        "fit_transform",
+        lambda self, X, *args: designs.append(len(X)) or fit_transform(self, X, *args),
+    )
+    results = oracle.fit_many(x, y)
+    # One design of all years for each degree, whatever the number of series
+    assert designs == [len(x)] * 3
+
+    # Each series equals a cross validation of its own
+    kf = KFold(n_splits=oracle.k_splits, shuffle=True, random_state=0)
+    for series, result in zip(y, results):
+        errors = [
+            abs(
+                np.mean(
+                    [
+                        Oracle.polynomial_regression(x[train], series[train], x[val], series[val], degree)[2]
+                        for train, val in kf.split(x)
+                    ]
+                )
+            )
+            for degree in oracle.degrees
+        ]
+        np.testing.assert_allclose(result["test_errors"], errors, rtol=1e-12)
+        assert result["degree"] == oracle.degrees[np.argmin(errors)]
+
+
+def test_predict_many_leaves_out_missing_values():
+    x = np.arange(2006, 2024, dtype=float).reshape(-1, 1)
+    rng = np.random.RandomState(0)
+    y = rng.normal(100, 20, (3, len(x)))
+    y[1, [0, 5]] = np.nan
+
+    oracle = WoodOracle()
+    oracle.degrees = [1, 2, 3]
+    train_predict, train_score, value_2024, degree = oracle.predict_many(x, y)
+
+    present = ~np.isnan(y[1])
+    expected = oracle.predict_many(x[present], y[1:2, present])
+    assert value_2024[1] == pytest.approx(expected[2][0])
+    assert train_score[1] == pytest.approx(expected[1][0])
+    assert np.isfinite(train_predict).all()
+
+    with pytest.raises(ValueError):
+        oracle.fit_many(x[:5], y[:, :5])
+
+
+@pytest.mark.parametrize("engine", ["numpy", "sklearn", "incremental"])
+def test_folds_with_one_validation_value_are_left_out(engine):
+    # 13 of 18 years have a value, so 5 of the 9 folds have only 1 validation value and no score
+    x = np.arange(2006, 2024, dtype=float).reshape(-1, 1)
+    t = x.ravel() - 2006
+    y = np.stack([50 - 2 * t + 0.3 * t**2 + np.random.RandomState(0).normal(0, 1, len(t))])
+    y[0, [1, 4, 7, 10, 13]] = np.nan
+
+    oracle = WoodOracle(engine, degrees=[1, 2, 3])
+    _, _, value_2024, degree = oracle.predict_many(x, y)
+    errors = [oracle.results[0][f"cv_error_degree_{degree}"] for degree in oracle.degrees]
+    assert np.isfinite(errors).all() and np.isfinite(value_2024).all()
+    assert degree[0] == oracle.degrees[np.argmin(errors)]
+
+    # With a fold for each year, no fold has a score
+    oracle = WoodOracle(engine, k_splits=18, degrees=[1, 2, 3])
+    assert not oracle.can_cross_validate(~np.isnan(y[0]))
+    with pytest.raises(ValueError):
+        oracle.predict_many(x, y)